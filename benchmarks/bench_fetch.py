@@ -0,0 +1,172 @@
+"""Measure the throughput of listing and resolving issues end to end, against the local GitLab stand-in.
+
+usage: python benchmarks/bench_fetch.py [--issues N ...] [--latency S] [--jitter S] [--rate-limit N]
+                                        [--rate-window S] [--throttle F] [--state closed] [--processes N]
+                                        [--output FILE]
+       python benchmarks/bench_fetch.py --replay CASSETTE --group G --milestone M [--state closed]
+                                        [--resolvers label state closed_by] [--processes N]
+
+The stand-in runs in its own process, see gitlab_standin.py. The client is GitlabIssuesRepository with
+the label, state and closed by resolvers, as the cycletime command uses them, or the --resolvers given.
+Every request is recorded by the session's RequestMetrics, failed runs report how far they got.
+
+With --replay the responses come from a cassette recorded by a real run with --record, instead of the
+stand-in, so changes to the pipeline are timed on real data shapes and without network.
+"""
+import argparse
+import json
+import pathlib
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench_metrics import environment  # NOQA
+from gitlab_standin import start_process  # NOQA
+
+
+RESOLVERS = ["label", "state", "closed_by"]
+
+
+def list_issues(session, group="bench", resolvers=RESOLVERS, processes=None, **kwargs):
+    """List issues with the named resolvers, returns a result dict with the time taken."""
+    from gl_analytics.issues import (
+        GitLabClosedByMergeRequestResolver,
+        GitlabIssuesRepository,
+        GitlabScopedLabelResolver,
+        GitLabStateEventResolver,
+    )
+
+    classes = {
+        "label": GitlabScopedLabelResolver,
+        "state": GitLabStateEventResolver,
+        "closed_by": GitLabClosedByMergeRequestResolver,
+    }
+    repository = GitlabIssuesRepository(
+        session, group=group, resolvers=[classes[r] for r in resolvers], processes=processes
+    )
+    result = {}
+    start = time.perf_counter()
+    try:
+        result["listed"] = len(repository.list(**{k: v for k, v in kwargs.items() if v}))
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _report(result, metrics):
+    requests = metrics.count()
+    result.update(
+        requests=requests,
+        issues_per_second=result.get("listed", 0) / result["seconds"],
+        requests_per_second=requests / result["seconds"],
+        endpoints=metrics.summary(),
+    )
+    print(_format(result), flush=True)
+    print(metrics.format_summary(), "\n", flush=True)
+    return result
+
+
+def run_once(issues, state=None, resolvers=RESOLVERS, processes=None, **standin):
+    """List every issue of the stand-in with a fresh session, returns a result dict."""
+    from gl_analytics.instrumentation import RequestMetrics
+    from gl_analytics.issues import GitlabSession
+
+    process, url = start_process(issues=issues, **standin)
+    try:
+        metrics = RequestMetrics()
+        session = GitlabSession(url, access_token="x", metrics=metrics)
+        result = dict(issues=issues, **list_issues(session, resolvers=resolvers, processes=processes, state=state))
+    finally:
+        process.terminate()
+        process.join()
+    return _report(result, metrics)
+
+
+def run_replay(path, group, milestone=None, state=None, resolvers=RESOLVERS, processes=None):
+    """List the issues of a recorded run from its cassette, returns a result dict."""
+    from gl_analytics.cassette import Cassette
+    from gl_analytics.instrumentation import RequestMetrics
+    from gl_analytics.issues import GitlabSession
+
+    cassette = Cassette(path)
+    metrics = RequestMetrics()
+    session = GitlabSession(cassette.base_url, metrics=metrics, cassette=cassette)
+    result = list_issues(
+        session, group=group, resolvers=resolvers, processes=processes, milestone=milestone, state=state
+    )
+    return _report(dict(issues=result.get("listed", 0), **result), metrics)
+
+
+def _format(result):
+    line = (
+        f"{result['issues']:>7} issues  {result['seconds']:>8.2f}s  {result['requests']:>7} requests  "
+        f"{result['issues_per_second']:>8.1f} issues/s  {result['requests_per_second']:>8.1f} requests/s"
+    )
+    if "error" in result:
+        line += f"\n  failed after {result['requests']} requests, {result['error']}"
+    return line
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--issues", type=int, nargs="+", default=[100, 1000], help="Numbers of issues")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every response waits")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many more seconds, at random")
+    parser.add_argument("--rate-limit", type=int, default=None, help="Requests allowed every window")
+    parser.add_argument("--rate-window", type=float, default=60.0, help="Seconds of a rate limit window")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument("--state", choices=["opened", "closed"], default=None, help="List only these issues")
+    parser.add_argument("--output", help="Results file, default benchmarks/results/fetch_<commit>.json")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Replay a run recorded with --record instead")
+    parser.add_argument("--group", default="bench", help="Group of the recorded run")
+    parser.add_argument("--milestone", default=None, help="Milestone of the recorded run")
+    parser.add_argument(
+        "--resolvers",
+        nargs="+",
+        choices=RESOLVERS,
+        default=RESOLVERS,
+        help="Resolvers of the recorded run, e.g. label state for timeinstage, default all",
+    )
+    parser.add_argument("--processes", type=int, default=None, help="Parse in a pool of processes, default threads")
+    prog_args = parser.parse_args(argv)
+
+    env = environment()
+    if prog_args.replay:
+        print(f"commit {env['commit']}, replaying {prog_args.replay}\n")
+        result = run_replay(
+            prog_args.replay,
+            prog_args.group,
+            prog_args.milestone,
+            prog_args.state,
+            prog_args.resolvers,
+            prog_args.processes,
+        )
+        return _save(prog_args.output, env, {"replay": prog_args.replay}, [result])
+
+    standin = dict(
+        latency=prog_args.latency,
+        jitter=prog_args.jitter,
+        rate_limit=prog_args.rate_limit,
+        rate_window=prog_args.rate_window,
+        throttle=prog_args.throttle,
+    )
+    print(f"commit {env['commit']}, stand-in {', '.join(f'{k}={v}' for k, v in standin.items())}\n")
+    results = [
+        run_once(n, prog_args.state, prog_args.resolvers, prog_args.processes, **standin) for n in prog_args.issues
+    ]
+    _save(prog_args.output, env, {"standin": standin}, results)
+
+
+def _save(output, env, source, results):
+    default = ROOT / "benchmarks" / "results" / f"fetch_{env['commit'] or 'latest'}.json"
+    output = pathlib.Path(output or default)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(dict(environment=env, results=results, **source), indent=2))
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,190 @@
+"""Measure how the metrics hot paths scale with synthetic workloads, and compare with a baseline.
+
+usage: python benchmarks/bench_metrics.py [--sizes N ...] [--repeat N] [--budget S] [--output FILE]
+                                          [--compare BASELINE] [--tolerance F] [paths ...]
+
+Every path runs on workloads of every size, see workload.py. The time is the best of --repeat runs,
+the memory is the peak traced by tracemalloc in a separate run. Once a path takes longer than --budget
+seconds its larger sizes are skipped. Results are written as JSON, by default to
+benchmarks/results/<commit>.json, so runs of different commits can be compared with --compare.
+"""
+import argparse
+import datetime
+import gc
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from workload import END, STAGES, build_issues, generate  # NOQA
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def _history(workload, issues, transitions):
+    return build_issues(workload)
+
+
+def _build_transitions(workload, issues, transitions):
+    from gl_analytics.metrics import build_transitions
+
+    return build_transitions(issues)
+
+
+def _cumulative_flow(workload, issues, transitions):
+    from gl_analytics.metrics import CumulativeFlow
+
+    return CumulativeFlow(transitions, stages=STAGES, days=90, end_date=END.date()).get_data_frame()
+
+
+def _lead_cycle_times(workload, issues, transitions):
+    from gl_analytics.metrics import LeadCycleTimes
+
+    closed = [i for i in issues if i.closed_at is not None]
+    return LeadCycleTimes(closed, wip="In Progress", stages=STAGES).get_data_frame()
+
+
+# the paths measured, each is called with the workload, its issues and their transitions
+PATHS = {
+    "history": _history,
+    "build_transitions": _build_transitions,
+    "cumulative_flow": _cumulative_flow,
+    "lead_cycle_times": _lead_cycle_times,
+}
+
+
+def measure(func, args, repeat):
+    """Returns the best time in seconds of repeat runs and the peak bytes traced in another run."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def run(paths, sizes, repeat=3, budget=60.0, seed=0):
+    """Returns a list of result dicts, one for every path and size."""
+    from gl_analytics.metrics import build_transitions
+
+    results = []
+    over_budget = set()
+    for size in sizes:
+        workload = generate(size, seed=seed)
+        needs_issues = any(p != "history" for p in paths if p not in over_budget)
+        issues = build_issues(workload) if needs_issues else []
+        needs_transitions = any(p == "cumulative_flow" for p in paths if p not in over_budget)
+        transitions = build_transitions(issues) if needs_transitions else []
+        events = sum(len(x["label_events"]) + len(x["state_events"]) for x in workload)
+
+        for name in paths:
+            result = {"path": name, "issues": size, "events": events}
+            if name in over_budget:
+                result["skipped"] = f"over the {budget}s budget at a smaller size"
+            else:
+                seconds, peak = measure(PATHS[name], (workload, issues, transitions), repeat)
+                result.update(seconds=seconds, peak_bytes=peak)
+                if seconds > budget:
+                    over_budget.add(name)
+            results.append(result)
+            print(_format(result), flush=True)
+    return results
+
+
+def _format(result):
+    head = f"{result['path']:<18} {result['issues']:>7} issues {result['events']:>8} events"
+    if "skipped" in result:
+        return f"{head}  skipped, {result['skipped']}"
+    return f"{head}  {result['seconds'] * 1000:>10.1f}ms  {result['peak_bytes'] / 2 ** 20:>8.1f}MiB peak"
+
+
+def _commit():
+    try:
+        res = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return res.stdout.strip() or None
+
+
+def environment():
+    import numpy
+    import pandas
+
+    return {
+        "commit": _commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of every measured path against the baseline, returns the regressions."""
+    before = {(r["path"], r["issues"]): r for r in baseline["results"] if "seconds" in r}
+    regressions = []
+    print(f"\ncompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('date')})")
+    for r in results:
+        old = before.get((r["path"], r["issues"]))
+        if old is None or "seconds" not in r:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        memory = r["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else float("nan")
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(r)
+        print(f"{r['path']:<18} {r['issues']:>7} issues  time x{ratio:.2f}  memory x{memory:.2f}{flag}")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help=f"Paths to run, default all of {', '.join(PATHS)}")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of issues")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs of every path and size, default 3")
+    parser.add_argument("--budget", type=float, default=60.0, help="Seconds before larger sizes are skipped")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the workloads, default 0")
+    parser.add_argument("--output", help="Results file, default benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown reported as regression, default 0.2")
+    prog_args = parser.parse_args(argv)
+    unknown = set(prog_args.paths) - set(PATHS)
+    if unknown:
+        parser.error(f"unknown paths {', '.join(sorted(unknown))}")
+
+    env = environment()
+    print(f"commit {env['commit']}, python {env['python']}, pandas {env['pandas']}, numpy {env['numpy']}")
+    results = run(prog_args.paths or list(PATHS), prog_args.sizes, prog_args.repeat, prog_args.budget, prog_args.seed)
+
+    output = pathlib.Path(prog_args.output or ROOT / "benchmarks" / "results" / f"{env['commit'] or 'latest'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"environment": env, "results": results}, indent=2))
+    print(f"\nwrote {output}")
+
+    if prog_args.compare:
+        baseline = json.loads(pathlib.Path(prog_args.compare).read_text())
+        if compare(results, baseline, prog_args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
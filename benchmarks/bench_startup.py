@@ -0,0 +1,53 @@
+"""Measure how long the command line takes to start, e.g. to print --help.
+
+usage: python benchmarks/bench_startup.py [--runs N] [args ...]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "requests", "cachecontrol", "dateutil"]
+
+PROBE = """
+import runpy, sys
+sys.argv = ["gl-analytics"] + sys.argv[1:]
+try:
+    runpy.run_module("gl_analytics", run_name="__main__")
+except SystemExit:
+    pass
+heavy = sorted({m.split(".")[0] for m in sys.modules} & set(%r))
+print("imported:", ", ".join(heavy) or "none", file=sys.stderr)
+"""
+
+
+def run_once(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "gl_analytics"] + args, stdout=subprocess.DEVNULL, check=False)
+    return time.perf_counter() - start
+
+
+def heavy_imports(args):
+    res = subprocess.run(
+        [sys.executable, "-c", PROBE % HEAVY_MODULES] + args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    return res.stderr.decode().strip().splitlines()[-1]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Number of timed runs, default 10")
+    parser.add_argument("args", nargs="*", default=["--help"], help="Command line to time, default --help")
+    prog_args = parser.parse_args(argv)
+
+    timings = [run_once(prog_args.args) for _ in range(prog_args.runs)]
+    print(f"gl_analytics {' '.join(prog_args.args)}")
+    print(f"  runs:   {prog_args.runs}")
+    print(f"  min:    {min(timings) * 1000:.0f}ms")
+    print(f"  median: {statistics.median(timings) * 1000:.0f}ms")
+    print(f"  {heavy_imports(prog_args.args)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,270 @@
+"""A local stand-in for the GitLab API serving a synthetic workload, for end-to-end load tests.
+
+usage: python benchmarks/gitlab_standin.py [--issues N] [--port P] [--latency S] [--jitter S]
+                                           [--rate-limit N] [--rate-window S] [--throttle F]
+
+Serves, under /api/v4/:
+  groups/<group>/issues                                  keyset pages with a Link rel="next" header, or
+                                                         offset pages with X-Total headers without
+                                                         pagination=keyset
+  projects/<id>/issues/<iid>/resource_label_events
+  projects/<id>/issues/<iid>/resource_state_events
+  projects/<id>/issues/<iid>/closed_by
+
+Every group holds the same issues, see workload.py, the milestone parameter is accepted and ignored.
+Responses wait --latency seconds plus up to --jitter more. With --rate-limit, every response carries
+GitLab's RateLimit-* headers and requests over the limit of a --rate-window get 429 Too Many Requests
+with Retry-After, --throttle also answers that fraction of all requests with 429.
+"""
+import argparse
+import json
+import multiprocessing
+import pathlib
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlencode, urlparse
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+
+from workload import generate  # NOQA
+
+ISSUES_PATH = re.compile(r"^/api/v4/groups/(?P<group>[^/]+)/issues$")
+EVENTS_PATH = re.compile(
+    r"^/api/v4/projects/(?P<project>\d+)/issues/(?P<iid>\d+)/"
+    r"(?P<kind>resource_label_events|resource_state_events|closed_by)$"
+)
+
+MAX_PER_PAGE = 100
+
+# the workload events served by every resource events endpoint
+EVENTS = {"resource_label_events": "label_events", "resource_state_events": "state_events"}
+
+
+class RateLimiter:
+    """Fixed window request counter, like GitLab's per user limits."""
+
+    def __init__(self, limit, window=60.0):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._count = 0
+
+    def take(self):
+        """Count a request, returns whether it is allowed and the headers describing the limit."""
+        with self._lock:
+            now = time.time()
+            if now - self._start >= self.window:
+                self._start, self._count = now, 0
+            self._count += 1
+            allowed = self._count <= self.limit
+            reset = self._start + self.window
+            headers = {
+                "RateLimit-Limit": str(self.limit),
+                "RateLimit-Observed": str(self._count),
+                "RateLimit-Remaining": str(max(0, self.limit - self._count)),
+                "RateLimit-Reset": str(int(reset)),
+            }
+            if not allowed:
+                headers["Retry-After"] = str(max(1, int(reset - now + 0.999)))
+        return allowed, headers
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    """Answers GitLab API GET requests from the workload of the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        options = server.options
+        delay = options.latency + (random.uniform(0, options.jitter) if options.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        headers = {}
+        if server.limiter:
+            allowed, headers = server.limiter.take()
+            if not allowed:
+                return self._send(429, {"message": "429 Too Many Requests"}, headers)
+        if options.throttle and random.random() < options.throttle:
+            return self._send(429, {"message": "429 Too Many Requests"}, dict(headers, **{"Retry-After": "1"}))
+
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        match = ISSUES_PATH.match(url.path)
+        if match:
+            return self._issues(url.path, query, headers)
+        match = EVENTS_PATH.match(url.path)
+        if match:
+            item = server.by_key.get((int(match["project"]), int(match["iid"])))
+            if item is None:
+                return self._send(404, {"message": "404 Issue Not Found"}, headers)
+            # no merge requests are generated, nothing closes the issues but the state events
+            events = item[EVENTS[match["kind"]]] if match["kind"] in EVENTS else []
+            return self._send(200, events, headers)
+        self._send(404, {"message": "404 Not Found"}, headers)
+
+    def _issues(self, path, query, headers):
+        per_page = min(int(query.get("per_page", 20)), MAX_PER_PAGE)
+        id_after = int(query.get("id_after", 0))
+        state = query.get("state")
+        if query.get("pagination") != "keyset":
+            return self._offset_issues(path, query, headers, per_page, state)
+
+        page = []
+        items = self.server.workload
+        # issue ids are their position in the workload plus one
+        for item in items[id_after:]:
+            if state and _state(item) != state:
+                continue
+            page.append(_issue(item))
+            if len(page) == per_page:
+                break
+
+        if page and page[-1]["id"] < len(items):
+            next_query = urlencode(sorted(dict(query, id_after=page[-1]["id"], per_page=per_page).items()))
+            headers["Link"] = f'<http://{self.headers["Host"]}{path}?{next_query}>; rel="next"'
+        self._send(200, page, headers)
+
+    def _offset_issues(self, path, query, headers, per_page, state):
+        items = [item for item in self.server.workload if not state or _state(item) == state]
+        number = int(query.get("page", 1))
+        pages = max(1, -(-len(items) // per_page))
+        page = [_issue(item) for item in items[(number - 1) * per_page : number * per_page]]
+        headers.update(
+            {
+                "X-Total": str(len(items)),
+                "X-Total-Pages": str(pages),
+                "X-Per-Page": str(per_page),
+                "X-Page": str(number),
+            }
+        )
+        if number < pages:
+            next_query = urlencode(sorted(dict(query, page=number + 1, per_page=per_page).items()))
+            headers["Link"] = f'<http://{self.headers["Host"]}{path}?{next_query}>; rel="next"'
+        self._send(200, page, headers)
+
+    def _send(self, status, payload, headers):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _state(item):
+    return "closed" if item["closed_at"] else "opened"
+
+
+def _issue(item):
+    issue = {
+        "id": item["iid"],
+        "iid": item["iid"],
+        "project_id": item["project_id"],
+        "title": f"Issue {item['iid']}",
+        "state": _state(item),
+        "created_at": item["created_at"],
+        "labels": [f"type::{item['type']}"],
+    }
+    if item["closed_at"]:
+        issue["closed_at"] = item["closed_at"]
+    return issue
+
+
+def make_standin(
+    issues=1000,
+    seed=0,
+    host="127.0.0.1",
+    port=0,
+    latency=0.0,
+    jitter=0.0,
+    rate_limit=None,
+    rate_window=60.0,
+    throttle=0.0,
+):
+    """Create the stand-in server for a workload of the given number of issues, port 0 picks a free port.
+
+    kwargs:
+    latency seconds every response waits
+    jitter up to this many more seconds, at random
+    rate_limit number of requests allowed every rate_window seconds, default unlimited
+    throttle fraction of requests answered 429 at random
+    """
+    server = ThreadingHTTPServer((host, port), StandinRequestHandler)
+    server.daemon_threads = True
+    server.workload = generate(issues, seed=seed)
+    server.by_key = {(item["project_id"], item["iid"]): item for item in server.workload}
+    server.options = SimpleNamespace(latency=latency, jitter=jitter, throttle=throttle)
+    server.limiter = RateLimiter(rate_limit, rate_window) if rate_limit else None
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/api/v4/"
+
+
+def _serve(queue, kwargs):
+    server = make_standin(**kwargs)
+    queue.put(base_url(server))
+    server.serve_forever()
+
+
+def start_process(**kwargs):
+    """Run a stand-in server in its own process, so it does not share the interpreter with the client.
+
+    Returns the process and the API base url, terminate the process when done.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(queue, kwargs), daemon=True)
+    process.start()
+    return process, queue.get(timeout=120)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--issues", type=int, default=1000, help="Number of issues, default 1000")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the workload, default 0")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on, default 127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8929, help="Port to listen on, default 8929")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every response waits")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many more seconds, at random")
+    parser.add_argument("--rate-limit", type=int, default=None, help="Requests allowed every window")
+    parser.add_argument("--rate-window", type=float, default=60.0, help="Seconds of a rate limit window")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Fraction of requests answered 429")
+    prog_args = parser.parse_args(argv)
+
+    server = make_standin(
+        issues=prog_args.issues,
+        seed=prog_args.seed,
+        host=prog_args.host,
+        port=prog_args.port,
+        latency=prog_args.latency,
+        jitter=prog_args.jitter,
+        rate_limit=prog_args.rate_limit,
+        rate_window=prog_args.rate_window,
+        throttle=prog_args.throttle,
+    )
+    print(f"Serving {prog_args.issues} issues at {base_url(server)}, set GITLAB_BASE_URL to it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,130 @@
+"""Synthetic GitLab workloads of any size, shaped like the API responses the resolvers process.
+
+Issues arrive evenly over a date range and move through the workflow stages with log-normal waits.
+Some go back from review to work (rework), some are reopened after closing, and the issues still
+open at the end of the range are left in the stage they reached.
+"""
+import datetime
+import math
+import random
+
+STAGES = ["opened", "In Progress", "Code Review", "closed"]
+
+# issue types and how often they occur
+TYPES = {"Feature": 0.5, "Bug": 0.3, "Maintenance": 0.2}
+
+# median hours spent in every stage before the next move
+MEDIAN_HOURS = {"opened": 240, "In Progress": 72, "Code Review": 12}
+
+END = datetime.datetime(2021, 6, 30, 18, tzinfo=datetime.timezone.utc)
+
+
+def _wait(rng, stage, sigma=1.0):
+    return datetime.timedelta(hours=rng.lognormvariate(math.log(MEDIAN_HOURS[stage]), sigma))
+
+
+def _iso(when):
+    # GitLab's format, e.g. 2021-03-14T12:00:00.000Z
+    return when.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _label(action, stage, when):
+    return {"created_at": _iso(when), "action": action, "label": {"name": f"workflow::{stage}"}}
+
+
+def _state(state, when):
+    return {"created_at": _iso(when), "state": state}
+
+
+def generate(n, seed=0, days=180, end=END, projects=20, rework_rate=0.15, reopen_rate=0.05):
+    """Returns a list of n issues as dicts of iid, project_id, created_at, closed_at, type,
+    label_events and state_events, the same for the same arguments.
+
+    args:
+    n number of issues
+
+    kwargs:
+    seed seed of the random generator
+    days issues are created evenly over this many days before end
+    end datetime of the last possible event, issues not closed by then stay open
+    projects number of projects the issues belong to
+    rework_rate chance of every review sending the issue back to In Progress
+    reopen_rate chance of a closed issue being reopened and closed again
+    """
+    rng = random.Random(seed)
+    types, weights = zip(*TYPES.items())
+    issues = []
+    for iid in range(1, n + 1):
+        created = end - datetime.timedelta(days=days * rng.random())
+        label_events = []
+        state_events = []
+        closed = None
+
+        when = created + _wait(rng, "opened")
+        if when < end:
+            label_events.append(_label("add", "In Progress", when))
+            stage = "In Progress"
+            while when < end:
+                when += _wait(rng, stage)
+                if when >= end:
+                    break
+                if stage == "In Progress":
+                    label_events.append(_label("add", "Code Review", when))
+                    label_events.append(_label("remove", "In Progress", when))
+                    stage = "Code Review"
+                elif rng.random() < rework_rate:
+                    label_events.append(_label("add", "In Progress", when))
+                    label_events.append(_label("remove", "Code Review", when))
+                    stage = "In Progress"
+                else:
+                    label_events.append(_label("remove", "Code Review", when))
+                    state_events.append(_state("closed", when))
+                    closed = when
+                    break
+
+        if closed and rng.random() < reopen_rate:
+            reopened = closed + datetime.timedelta(days=rng.expovariate(1 / 3))
+            if reopened < end:
+                state_events.append(_state("reopened", reopened))
+                closed = reopened + _wait(rng, "In Progress")
+                if closed < end:
+                    state_events.append(_state("closed", closed))
+                else:
+                    closed = None
+
+        issues.append(
+            {
+                "iid": iid,
+                "project_id": 1 + iid % projects,
+                "created_at": _iso(created),
+                "closed_at": _iso(closed) if closed else None,
+                "type": rng.choices(types, weights)[0],
+                "label_events": label_events,
+                "state_events": state_events,
+            }
+        )
+    return issues
+
+
+def build_issues(workload):
+    """Issues with histories built by the GitLab resolvers from the generated events."""
+    from dateutil import parser as date_parser
+
+    from gl_analytics.issues import GitlabScopedLabelResolver, GitLabStateEventResolver, Issue
+
+    labels = GitlabScopedLabelResolver(None)
+    states = GitLabStateEventResolver(None)
+    issues = []
+    for item in workload:
+        closed_at = date_parser.parse(item["closed_at"]) if item["closed_at"] else None
+        issue = Issue(
+            item["iid"],
+            item["project_id"],
+            date_parser.parse(item["created_at"]),
+            issue_type=item["type"],
+            closed_at=closed_at,
+        )
+        labels.process(issue, item["label_events"])
+        states.process(issue, item["state_events"])
+        issues.append(issue)
+    return issues
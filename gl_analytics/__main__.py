@@ -2,11 +2,24 @@
 
 """
 import argparse
+import contextlib
+import datetime
 import logging
 import sys
 
 from .config import load_config
-from .command import CumulativeFlowCommand, CycleTimeCommand
+from .command import (
+    REPORT_TYPES,
+    CumulativeFlowCommand,
+    CycleTimeCommand,
+    ForecastCommand,
+    ServeCommand,
+    TimeInStageCommand,
+    TransitionsCommand,
+    WebhookCommand,
+    WipAgeCommand,
+)
+from .utils import profiling, tracing
 
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
@@ -64,11 +77,86 @@ def create_parser():
     )
 
     common_parser.add_argument(
-        "-r", "--report", choices=["csv", "plot"], default="csv", help="Specify output report type"
+        "-r",
+        "--report",
+        choices=REPORT_TYPES,
+        nargs="+",
+        default=["csv"],
+        help="Specify one or more output report types, exported from the same aggregation",
     )
 
     common_parser.add_argument(
-        "-o", "--outfile", metavar="Filepath", nargs="?", default=None, help="File to output or default"
+        "-o",
+        "--outfile",
+        metavar="Filepath",
+        nargs="?",
+        default=None,
+        help="File to output or default, with several report types the extension is set by each type",
+    )
+
+    common_parser.add_argument(
+        "--store",
+        metavar="Filepath",
+        default=None,
+        help="Read issues recorded by the webhook command from this event store instead of GitLab",
+    )
+
+    common_parser.add_argument(
+        "--trace",
+        metavar="Filepath",
+        default=None,
+        help="Write a Chrome trace JSON of where the time goes, open it in ui.perfetto.dev or chrome://tracing",
+    )
+
+    common_parser.add_argument(
+        "--metrics",
+        metavar="Filepath",
+        default=None,
+        help="Write the counts, bytes, cache results and latencies of the GitLab requests in Prometheus text format",
+    )
+
+    common_parser.add_argument(
+        "--profile",
+        metavar="Directory",
+        default=None,
+        help="Profile the listing, aggregation and export phases, writing pstats and memory reports to Directory",
+    )
+
+    common_parser.add_argument(
+        "--processes",
+        metavar="count",
+        type=int,
+        default=None,
+        help="Parse the GitLab responses in a pool of this many processes while threads fetch, default in process",
+    )
+
+    common_parser.add_argument(
+        "--archive",
+        metavar="Directory",
+        default=None,
+        help="Append the histories of the closed issues listed to the memory-mapped event archive in Directory",
+    )
+
+    run_group = common_parser.add_mutually_exclusive_group()
+
+    run_group.add_argument(
+        "--record",
+        metavar="Filepath",
+        default=None,
+        help="Record every GitLab response of the run into a compressed cassette file",
+    )
+
+    run_group.add_argument(
+        "--replay",
+        metavar="Filepath",
+        default=None,
+        help="Answer every GitLab request from a recorded cassette file, without network or token",
+    )
+
+    run_group.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Fetch only the first page of issues and estimate the requests and time of the run",
     )
 
     subparsers = parser.add_subparsers(
@@ -97,6 +185,153 @@ def create_parser():
     )
     cycletime_parser.set_defaults(func=CycleTimeCommand, extra_args=dict(wip=DEFAULT_WIP, stages=DEFAULT_STAGES))
 
+    timeinstage_parser = subparsers.add_parser(
+        "timeinstage",
+        aliases=["tis"],
+        parents=[common_parser],
+        help="Generate time spent in each workflow stage per issue in the given report format.",
+    )
+
+    timeinstage_parser.add_argument(
+        "-u",
+        "--unit",
+        choices=["days", "hours"],
+        default="days",
+        help="Measure business days or calendar hours, default days",
+    )
+
+    timeinstage_parser.set_defaults(func=TimeInStageCommand, extra_args=dict(wip=DEFAULT_WIP, stages=DEFAULT_STAGES))
+
+    transitions_parser = subparsers.add_parser(
+        "transitions",
+        aliases=["tr"],
+        parents=[common_parser],
+        help="Generate counts of moves between workflow stages in the given report format.",
+    )
+
+    transitions_parser.add_argument(
+        "-t", "--by-type", action="store_true", help="Count the moves of every issue type separately"
+    )
+
+    transitions_parser.set_defaults(func=TransitionsCommand, extra_args=dict(stages=DEFAULT_STAGES))
+
+    wipage_parser = subparsers.add_parser(
+        "wipage",
+        aliases=["wa"],
+        parents=[common_parser],
+        help="Generate the age of open issues in their current workflow stage in the given report format.",
+    )
+
+    wipage_parser.add_argument(
+        "-d",
+        "--date",
+        dest="as_of",
+        metavar="YYYY-MM-DD",
+        type=datetime.date.fromisoformat,
+        default=None,
+        help="Age the issues open at the end of this date, default now",
+    )
+
+    wipage_parser.add_argument(
+        "-u",
+        "--unit",
+        choices=["days", "hours"],
+        default="days",
+        help="Measure business days or calendar hours, default days",
+    )
+
+    wipage_parser.set_defaults(func=WipAgeCommand, extra_args=dict(stages=DEFAULT_STAGES))
+
+    forecast_parser = subparsers.add_parser(
+        "forecast",
+        aliases=["fc"],
+        parents=[common_parser],
+        help="Forecast completion dates of the open issues from their daily throughput.",
+    )
+
+    forecast_parser.add_argument(
+        "-d",
+        "--days",
+        metavar="days",
+        type=int,
+        nargs="?",
+        default=30,
+        help="Number of days of throughput history, default 30",
+    )
+
+    forecast_parser.add_argument(
+        "-s",
+        "--simulations",
+        metavar="count",
+        type=int,
+        default=100000,
+        help="Number of Monte Carlo simulations, default 100000",
+    )
+
+    forecast_parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="count",
+        type=int,
+        default=None,
+        help="Run the simulations in a pool of worker processes, default in process",
+    )
+
+    forecast_parser.set_defaults(func=ForecastCommand, extra_args=dict(stages=DEFAULT_STAGES))
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve the reports over HTTP from issues and aggregations kept in memory.",
+    )
+
+    serve_parser.add_argument(
+        "-g",
+        "--group",
+        metavar="group",
+        nargs="?",
+        default=config.get("GITLAB_GROUP"),
+        help="Default GitLab Group name, default %s" % config.get("GITLAB_GROUP"),
+    )
+
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on, default 127.0.0.1")
+
+    serve_parser.add_argument("-p", "--port", type=int, default=8080, help="Port to listen on, default 8080")
+
+    serve_parser.add_argument(
+        "--refresh",
+        metavar="seconds",
+        type=int,
+        default=900,
+        help="Seconds between background refreshes of the issues, 0 never refreshes, default 900",
+    )
+
+    serve_parser.add_argument(
+        "--store",
+        metavar="Filepath",
+        default=None,
+        help="Read issues recorded by the webhook command from this event store instead of GitLab",
+    )
+
+    serve_parser.set_defaults(func=ServeCommand, extra_args=dict(wip=DEFAULT_WIP, stages=DEFAULT_STAGES))
+
+    webhook_parser = subparsers.add_parser(
+        "webhook",
+        help="Record GitLab Issue Hook events into an event store, set WEBHOOK_SECRET to check X-Gitlab-Token.",
+    )
+
+    webhook_parser.add_argument(
+        "--store",
+        metavar="Filepath",
+        default="events.sqlite3",
+        help="Event store file, default events.sqlite3",
+    )
+
+    webhook_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on, default 127.0.0.1")
+
+    webhook_parser.add_argument("-p", "--port", type=int, default=8081, help="Port to listen on, default 8081")
+
+    webhook_parser.set_defaults(func=WebhookCommand, extra_args={})
+
     return parser
 
 
@@ -104,7 +339,12 @@ def main(args):
     parser = create_parser()
     prog_args = parser.parse_args(args)
     cmd = prog_args.func(config, prog_args)
-    cmd.execute()
+    with contextlib.ExitStack() as stack:
+        if getattr(prog_args, "trace", None):
+            stack.enter_context(tracing(prog_args.trace))
+        if getattr(prog_args, "profile", None):
+            stack.enter_context(profiling(prog_args.profile))
+        cmd.execute()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -0,0 +1,219 @@
+"""Append-only archive of issue histories on disk, read back as memory-mapped HistoryTables.
+
+Years of histories do not fit in memory as Issue objects. The archive keeps them as the fixed width
+records of a HistoryTable, one file per project and month the issues were opened in:
+
+    <directory>/archive.json                 format version, the stage and type names of the codes
+    <directory>/<project>/<YYYY-MM>.events   records of the issues of the project opened that month
+
+Every issue is in one partition, its records contiguous and in history order. Reading maps the
+partition files instead of loading them, so only the pages an aggregation touches are resident.
+Appending an issue again, e.g. after it was reopened and closed again, adds a newer copy and reading
+keeps the last one. Appending an unchanged issue writes nothing.
+"""
+import datetime
+import json
+import logging
+import os
+import pathlib
+import threading
+
+import numpy as np
+
+from .histories import EVENT_DTYPE, HistoryTable
+
+_log = logging.getLogger(__name__)
+
+VERSION = 1
+
+META_FILE = "archive.json"
+
+SUFFIX = ".events"
+
+
+def _month(value):
+    """The "YYYY-MM" month of a date or datetime, a "YYYY-MM" string is taken as it is."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m")
+    return str(value)
+
+
+class EventArchive:
+    """Histories of issues in partitions by project and month opened, see the module documentation."""
+
+    def __init__(self, directory):
+        """Open the archive in directory, creating it when missing."""
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stages = []
+        self._types = []
+        self._load_meta()
+
+    @property
+    def stages(self):
+        return self._stages
+
+    @property
+    def types(self):
+        return self._types
+
+    def _load_meta(self):
+        meta = self.directory / META_FILE
+        if not meta.exists():
+            return
+        data = json.loads(meta.read_text())
+        if data.get("version") != VERSION:
+            raise ValueError(f"Unsupported event archive version {data.get('version')}")
+        self._stages = data["stages"]
+        self._types = data["types"]
+
+    def _save_meta(self):
+        # replaced in one step, so readers never see a partial file
+        meta = self.directory / META_FILE
+        tmp = meta.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": VERSION, "stages": self._stages, "types": self._types}))
+        os.replace(tmp, meta)
+
+    def append(self, issues):
+        """Append the histories of issues, a list of issues or a HistoryTable, returns the records written."""
+        table = issues if isinstance(issues, HistoryTable) else HistoryTable.from_issues(issues)
+        if not len(table):
+            return 0
+
+        with self._lock:
+            self._load_meta()
+            stages = {x: i for i, x in enumerate(self._stages)}
+            types = {x: i for i, x in enumerate(self._types)}
+            records = table.recode(stages, types)
+            if len(stages) > len(self._stages) or len(types) > len(self._types):
+                # the names of the codes are saved before any record refers to them
+                self._stages, self._types = list(stages), list(types)
+                self._save_meta()
+
+            keys = _issue_keys(records, stages.get("opened", -1))
+            heads = _heads(keys)
+            # every record goes to the partition of the month its issue was opened in
+            months = records["start"][heads].astype("M8[M]")[keys]
+
+            written = 0
+            for project in np.unique(records["project"]):
+                in_project = records["project"] == project
+                for month in np.unique(months[in_project]):
+                    selected = np.flatnonzero(in_project & (months == month))
+                    path = self._partition_path(int(project), str(month))
+                    written += self._append_partition(path, records[selected], keys[selected])
+        return written
+
+    def _opened(self):
+        return self._stages.index("opened") if "opened" in self._stages else -1
+
+    def _partition_path(self, project, month):
+        return self.directory / str(project) / f"{month}{SUFFIX}"
+
+    def _append_partition(self, path, records, keys):
+        existing = self._map(path)
+        latest = {}
+        if existing is not None:
+            for run in np.split(existing, _heads(_issue_keys(existing, self._opened()))[1:]):
+                latest[(int(run["project"][0]), int(run["issue"][0]))] = run.tobytes()
+
+        runs = [run for run in np.split(records, _heads(keys)[1:]) if run.tobytes() != latest.get(_key(run))]
+        if not runs:
+            return 0
+        path.parent.mkdir(exist_ok=True)
+        with open(path, "ab") as f:
+            for run in runs:
+                f.write(run.tobytes())
+        return sum(len(run) for run in runs)
+
+    def _map(self, path):
+        if not path.exists():
+            return None
+        # a partly written record at the end, e.g. after a crash, is not read
+        count = path.stat().st_size // EVENT_DTYPE.itemsize
+        if not count:
+            return None
+        return np.memmap(path, dtype=EVENT_DTYPE, mode="r", shape=(count,))
+
+    def partitions(self, projects=None, since=None, until=None):
+        """List of (project, month, path) of the partitions, in order.
+
+        kwargs:
+        projects only these project ids
+        since, until only the issues opened in these months or between them, dates or "YYYY-MM"
+        """
+        since = _month(since) if since is not None else None
+        until = _month(until) if until is not None else None
+        projects = {int(x) for x in projects} if projects is not None else None
+
+        found = []
+        for path in self.directory.glob(f"*/*{SUFFIX}"):
+            project, month = int(path.parent.name), path.stem
+            if projects is not None and project not in projects:
+                continue
+            if (since and month < since) or (until and month > until):
+                continue
+            found.append((project, month, path))
+        return sorted(found)
+
+    def tables(self, projects=None, since=None, until=None):
+        """Generator of a memory-mapped HistoryTable for every partition, takes the partitions kwargs."""
+        self._load_meta()
+        for _, _, path in self.partitions(projects, since, until):
+            records = self._map(path)
+            if records is not None:
+                yield HistoryTable(_latest(records, self._opened()), self._stages, self._types)
+
+    def table(self, projects=None, since=None, until=None):
+        """One HistoryTable of the partitions, takes the partitions kwargs.
+
+        A single partition is memory-mapped, the records of several are joined in memory. Aggregations
+        that can be merged, e.g. StageTransitionMatrix or CycleTimeSketches, can instead run over the
+        tables one partition at a time.
+        """
+        tables = list(self.tables(projects, since, until))
+        if len(tables) == 1:
+            return tables[0]
+        records = np.concatenate([t.records for t in tables]) if tables else np.empty(0, dtype=EVENT_DTYPE)
+        return HistoryTable(records, self._stages, self._types)
+
+
+def _issue_keys(records, opened):
+    """Ordinal of the copy of an issue each record belongs to.
+
+    Copies of an issue appended one after another have the same ids, every copy starts with the
+    record of the opened stage, as every History does.
+
+    args:
+    opened stage code of "opened"
+    """
+    if not len(records):
+        return np.zeros(0, dtype=int)
+    changed = (
+        (records["issue"][1:] != records["issue"][:-1])
+        | (records["project"][1:] != records["project"][:-1])
+        | (records["stage"][1:] == opened)
+    )
+    return np.concatenate([[0], np.cumsum(changed)])
+
+
+def _heads(keys):
+    """Positions of the first record of every issue."""
+    return np.flatnonzero(np.diff(keys, prepend=-1)) if len(keys) else np.zeros(0, dtype=int)
+
+
+def _key(run):
+    return int(run["project"][0]), int(run["issue"][0])
+
+
+def _latest(records, opened):
+    """The records without the older copies of issues appended again, the mapped records when there are none."""
+    keys = _issue_keys(records, opened)
+    heads = _heads(keys)
+    pairs = np.stack([records["project"][heads], records["issue"][heads]], axis=1)
+    _, last = np.unique(pairs[::-1], axis=0, return_index=True)
+    if len(last) == len(heads):
+        return records
+    kept = np.sort(len(heads) - 1 - last)
+    return np.asarray(records[np.isin(keys, kept)])
@@ -0,0 +1,125 @@
+"""Record the GitLab API responses of a run into a compressed file, and replay them without network.
+
+A cassette is a gzip compressed file of JSON lines. The first line holds the format version and the
+base url of the recorded session, every other line one response: the requested url, including its
+query string, the status code, the Link and Content-Type headers and the body. Request headers,
+such as the access token, are never recorded.
+"""
+import gzip
+import http
+import json
+import logging
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+_log = logging.getLogger(__name__)
+
+VERSION = 1
+
+# response headers the repository and resolvers read
+RECORDED_HEADERS = ["Content-Type", "Link"]
+
+
+def request_key(url, params=None):
+    """The url of a GET request with its query string, as requests encodes it."""
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+class Cassette:
+    """Recorded responses of a GitLab session, see GitlabSession(cassette=...)."""
+
+    def __init__(self, path, mode="replay", base_url=None):
+        """Open a cassette file.
+
+        args:
+        path file path of the cassette
+
+        kwargs:
+        mode "replay" serves the recorded responses, "record" writes every response of the session
+        base_url url of the recorded GitLab API, stored when recording
+        """
+        if mode not in ["record", "replay"]:
+            raise ValueError("mode must be record or replay")
+
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._recorded = 0
+
+        if mode == "record":
+            self.base_url = base_url
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            self._write({"version": VERSION, "base_url": base_url})
+        else:
+            self._file = None
+            self._load(path)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def __len__(self):
+        return len(self._responses) if self.replaying else self._recorded
+
+    def _load(self, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')}")
+            self.base_url = header["base_url"]
+            for line in f:
+                entry = json.loads(line)
+                self._responses[entry["url"]] = entry
+        _log.info(f"Replaying {len(self._responses)} responses from '{path}'")
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def record(self, url, params, response):
+        """Write a response of the GET request to url with params."""
+        entry = {
+            "url": request_key(url, params),
+            "status": response.status_code,
+            "headers": {k: response.headers[k] for k in RECORDED_HEADERS if k in response.headers},
+            "body": response.content.decode("utf-8"),
+        }
+        with self._lock:
+            self._write(entry)
+            self._recorded += 1
+
+    def play(self, url, params=None):
+        """A response built from the recording of the GET request to url with params.
+
+        raises:
+        KeyError - when the request was not recorded
+        """
+        key = request_key(url, params)
+        try:
+            entry = self._responses[key]
+        except KeyError:
+            raise KeyError(f"No response recorded in '{self.path}' for {key}") from None
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = key
+        response.reason = http.HTTPStatus(entry["status"]).phrase
+        return response
+
+    def close(self):
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
+                self._file = None
+            _log.info(f"Recorded {self._recorded} responses to '{self.path}'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
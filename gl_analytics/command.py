@@ -1,22 +1,40 @@
 import datetime
 import logging
+import pathlib
 import sys
 from abc import ABC, abstractmethod
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-from .issues import (
-    GitlabSession,
-    GitLabClosedByMergeRequestResolver,
-    GitlabIssuesRepository,
-    GitlabScopedLabelResolver,
-    GitLabStateEventResolver,
-)
-from .metrics import CumulativeFlow, LeadCycleTimes, build_transitions
-from .report import CsvReport, PlotReport
-from .utils import timer
+from .instrumentation import RequestMetrics
+from .report import CsvReport, FeatherReport, ParquetReport, PlotReport, SvgReport, render_plots
+from .utils import profile, timer
+
+# The issues, metrics and forecast modules pull in requests, pandas and numpy. They are imported by
+# the commands when they run, so parsing arguments and printing help stays fast.
 
 _log = logging.getLogger(__name__)
 
+REPORT_TYPES = ["csv", "plot", "svg", "parquet", "feather"]
+
+# arguments that configure the run itself, they are not passed on to the aggregations
+RUN_ARGS = [
+    "command",
+    "func",
+    "group",
+    "milestone",
+    "store",
+    "trace",
+    "metrics",
+    "profile",
+    "record",
+    "replay",
+    "dry_run",
+    "processes",
+    "archive",
+    "extra_args",
+]
+
 
 class AbstractCommand(ABC):  # pragma: no cover
     def __init__(self, config, prog_args, *args, **kwargs):
@@ -28,7 +46,36 @@ class AbstractCommand(ABC):  # pragma: no cover
         raise NotImplementedError()
 
 
+class _EstimatingRepository:
+    """Takes the place of a repository in a command's list, returning the estimate of the listing instead."""
+
+    def __init__(self, repository):
+        self._repository = repository
+
+    def list(self, **kwargs):
+        return self._repository.estimate(**kwargs)
+
+
+class _TableRepository:
+    """Takes the place of a repository in a command's list, returning the HistoryTable parsed by its workers."""
+
+    def __init__(self, repository):
+        self._repository = repository
+
+    def list(self, **kwargs):
+        return self._repository.list_table(**kwargs)
+
+
+def _count_issues(issues):
+    from .histories import HistoryTable
+
+    return issues.count_issues() if isinstance(issues, HistoryTable) else len(issues)
+
+
 class AggregationCommand(AbstractCommand):
+    # the aggregation runs on the records of a HistoryTable, with --processes the issues are not rebuilt
+    takes_table = False
+
     def __init__(self, config, prog_args, *args, **kwargs):
         super().__init__(config, prog_args, *args, **kwargs)
 
@@ -38,17 +85,58 @@ class AggregationCommand(AbstractCommand):
         self.supported_reports = {
             "csv": (CsvReport, sys.stdout),
             "plot": (PlotReport, f"cfd_{timestamp_str}.png"),
+            "svg": (SvgReport, f"cfd_{timestamp_str}.svg"),
+            "parquet": (ParquetReport, f"report_{timestamp_str}.parquet"),
+            "feather": (FeatherReport, f"report_{timestamp_str}.feather"),
         }
+        self.metrics = RequestMetrics()
+        self.cassette = None
 
-    def build_repo(self):
-        token = self.config["TOKEN"]
-        baseurl = self.config["GITLAB_BASE_URL"]
-        session = GitlabSession(baseurl, access_token=token)
+    def build_repo(self, session=None, event_store=None):
+        """The repository to list the issues from, GitLab through session or the event store.
+
+        kwargs:
+        session GitlabSession to share, default a new session
+        event_store EventStore to share, default the --store file opened when given
+        """
+        from .issues import GitlabIssuesRepository
+
+        store = getattr(self.prog_args, "store", None)
+        if event_store is not None or store:
+            from .events import EventStore, EventStoreRepository
+
+            # histories recorded from webhooks, no GitLab requests needed
+            return EventStoreRepository(event_store if event_store is not None else EventStore(store))
+
+        if session is None:
+            session = self._build_session()
 
         # XXX currently the repo only supports a group level query
-        repository = GitlabIssuesRepository(session, group=self.prog_args.group, resolvers=self.resolvers)
+        repository = GitlabIssuesRepository(
+            session,
+            group=self.prog_args.group,
+            resolvers=self.resolvers,
+            processes=getattr(self.prog_args, "processes", None),
+        )
         return repository
 
+    def _build_session(self):
+        from .cassette import Cassette
+        from .issues import GitlabSession
+
+        replay = getattr(self.prog_args, "replay", None)
+        if replay:
+            # the recorded responses are all that is needed, no token and no network
+            self.cassette = Cassette(replay)
+            return GitlabSession(self.cassette.base_url, metrics=self.metrics, cassette=self.cassette)
+
+        token = self.config["TOKEN"]
+        baseurl = self.config["GITLAB_BASE_URL"]
+        record = getattr(self.prog_args, "record", None)
+        if record:
+            self.cassette = Cassette(record, mode="record", base_url=baseurl)
+        return GitlabSession(baseurl, access_token=token, metrics=self.metrics, cassette=self.cassette)
+
     @abstractmethod
     def list(self, repository):  # pragma: no cover
         raise NotImplementedError()
@@ -58,7 +146,19 @@ class AggregationCommand(AbstractCommand):
     def resolvers(self):  # pragma: no cover
         raise NotImplementedError()
 
+    def estimate(self):
+        """Print the expected cost of listing the issues, fetching only their first page."""
+        if getattr(self.prog_args, "store", None):
+            raise ValueError("--dry-run estimates GitLab requests, an event store needs none")
+
+        # through the command's own list, so the estimate has the same arguments and resolvers as a run
+        estimate = self.list(_EstimatingRepository(self.build_repo()))
+        print(estimate.format())
+        return estimate
+
     def execute(self):
+        if getattr(self.prog_args, "dry_run", False):
+            return self.estimate()
 
         ReportArgs = namedtuple("ReportArgs", ["report", "outfile"])
         report_args = ReportArgs(report=self.prog_args.report, outfile=self.prog_args.outfile)
@@ -66,33 +166,115 @@ class AggregationCommand(AbstractCommand):
         # create a simple dictionary with the rest of the argparser arguments to pass to the aggregator class
         # stripping out args that are expressly used for other purposes.
         aggregator_args = {
-            k: v
-            for k, v in self.prog_args.__dict__.items()
-            if k not in report_args._asdict() and k not in ["command", "func", "group", "milestone", "extra_args"]
+            k: v for k, v in self.prog_args.__dict__.items() if k not in report_args._asdict() and k not in RUN_ARGS
         }
         aggregator_args.update(self.prog_args.extra_args)
 
         repository = self.build_repo()
+        if self.takes_table and getattr(repository, "processes", None):
+            repository = _TableRepository(repository)
 
         # XXX refactor this now that repository.list() takes kwargs, rethink the design
-        with timer("Listing issues"):
-            issues = self.list(repository)
+        try:
+            with timer("Listing issues"), profile("listing"):
+                issues = self.list(repository)
+        finally:
+            if self.cassette is not None:
+                self.cassette.close()
 
-        _log.info(f"Retrieved {len(issues)} issues")
+        _log.info(f"Retrieved {_count_issues(issues)} issues")
+        self.archive(issues)
 
-        with timer("Aggregations"):
+        with timer("Aggregations"), profile("aggregation"):
             result = self.aggregate_results(issues, **aggregator_args)
-
-        report_cls, default_file = self.supported_reports[report_args.report]
-        report = report_cls(
-            result.get_data_frame(), file=(report_args.outfile or default_file), title=self.prog_args.milestone
-        )
-
-        with timer("Export"):
+            df = result.get_data_frame()
+
+        reports = self.build_reports(df, report_args.report, report_args.outfile)
+
+        self.export_reports(reports)
+
+        self.report_metrics()
+
+    def archive(self, issues):
+        """Append the histories of the closed issues to the event archive, if the run has one."""
+        directory = getattr(self.prog_args, "archive", None)
+        if not directory:
+            return
+        from .archive import EventArchive
+        from .histories import HistoryTable
+
+        # open issues are still changing, they are archived once closed
+        if isinstance(issues, HistoryTable):
+            closed = issues.closed()
+        else:
+            closed = [i for i in issues if i.closed_at is not None]
+        with timer("Archiving"):
+            written = EventArchive(directory).append(closed)
+        _log.info(f"Archived {written} events to '{directory}'")
+
+    def report_metrics(self):
+        """Print a summary of the GitLab requests made, and write them in Prometheus format if asked to."""
+        if not self.metrics.count():
+            return
+        print(self.metrics.format_summary(), file=sys.stderr)
+        metrics_file = getattr(self.prog_args, "metrics", None)
+        if metrics_file:
+            self.metrics.save(metrics_file)
+            _log.info(f"Wrote request metrics to '{metrics_file}'")
+
+    def build_reports(self, df, formats, outfile=None):
+        """Returns a list of (report, file) tuples, one report for every distinct format.
+
+        A single format writes to outfile as given. With several formats, every report writes to the
+        outfile name with the extension of its format.
+        """
+        import pandas as pd
+
+        if isinstance(formats, str):
+            formats = [formats]
+        formats = list(dict.fromkeys(formats))
+
+        plots = [fmt for fmt in formats if issubclass(self.supported_reports[fmt][0], PlotReport)]
+        if plots and not isinstance(df.index, pd.DatetimeIndex):
+            command = getattr(self.prog_args, "command", None) or "this command"
+            raise ValueError(
+                f"{' and '.join(plots)} reports draw daily counts, {command} has none, use csv, parquet or feather"
+            )
+
+        reports = []
+        for fmt in formats:
+            report_cls, default_file = self.supported_reports[fmt]
+            file = outfile
+            if outfile and len(formats) > 1:
+                file = str(pathlib.Path(outfile).with_suffix(report_cls.extension))
+            report = report_cls(df, file=(file or default_file), title=self.prog_args.milestone)
+            reports.append((report, file))
+        return reports
+
+    def export_reports(self, reports):
+        """Export the (report, file) tuples of build_reports side by side.
+
+        The reports only read the shared frame, the tabular formats export on threads. matplotlib is
+        not thread safe, so the plots render in a process pool meanwhile, see report.render_plots.
+        """
+        plots = [(report, file) for report, file in reports if isinstance(report, PlotReport)]
+        others = [(report, file) for report, file in reports if not isinstance(report, PlotReport)]
+        with timer("Export"), profile("export"), ThreadPoolExecutor(max_workers=max(len(others), 1)) as executor:
+            futures = [executor.submit(self._export, report, file) for report, file in others]
+            if plots:
+                with timer("Render plots"):
+                    render_plots([report for report, _ in plots])
+                for _, file in plots:
+                    if file:
+                        print(f"Created '{file}'.")
+            for future in futures:
+                future.result()
+
+    def _export(self, report, file):
+        with timer(f"Export {report.__class__.__name__}"):
             report.export()
-
-        if report_args.outfile:
-            print(f"Created '{report_args.outfile}'.")
+        if file:
+            print(f"Created '{file}'.")
 
     @abstractmethod
     def aggregate_results(self, issues, *args, **kwargs):
@@ -100,6 +282,8 @@ class AggregationCommand(AbstractCommand):
 
 
 class CumulativeFlowCommand(AggregationCommand):
+    takes_table = True
+
     def __init__(self, config, prog_args, *args, **kwargs):
         super().__init__(config, prog_args, *args, **kwargs)
 
@@ -108,14 +292,21 @@ class CumulativeFlowCommand(AggregationCommand):
 
     @property
     def resolvers(self):
+        from .issues import GitlabScopedLabelResolver, GitLabStateEventResolver
+
         return [GitlabScopedLabelResolver, GitLabStateEventResolver]
 
     def aggregate_results(self, issues, *args, **kwargs):
-        transitions = build_transitions(issues)
+        from .histories import HistoryTable
+        from .metrics import CumulativeFlow, build_transitions
+
+        transitions = issues if isinstance(issues, HistoryTable) else build_transitions(issues)
         return CumulativeFlow(transitions, *args, **kwargs)
 
 
 class CycleTimeCommand(AggregationCommand):
+    takes_table = True
+
     def __init__(self, config, prog_args, *args, **kwargs):
         super().__init__(config, prog_args, *args, **kwargs)
 
@@ -124,7 +315,140 @@ class CycleTimeCommand(AggregationCommand):
 
     @property
     def resolvers(self):
+        from .issues import GitLabClosedByMergeRequestResolver, GitlabScopedLabelResolver, GitLabStateEventResolver
+
         return [GitlabScopedLabelResolver, GitLabStateEventResolver, GitLabClosedByMergeRequestResolver]
 
     def aggregate_results(self, issues, *args, **kwargs):
+        from .metrics import LeadCycleTimes
+
         return LeadCycleTimes(issues, *args, **kwargs)
+
+
+class TimeInStageCommand(AggregationCommand):
+    takes_table = True
+
+    def __init__(self, config, prog_args, *args, **kwargs):
+        super().__init__(config, prog_args, *args, **kwargs)
+
+    def list(self, repository):
+        return repository.list(milestone=self.prog_args.milestone)
+
+    @property
+    def resolvers(self):
+        from .issues import GitlabScopedLabelResolver, GitLabStateEventResolver
+
+        return [GitlabScopedLabelResolver, GitLabStateEventResolver]
+
+    def aggregate_results(self, issues, *args, **kwargs):
+        from .metrics import TimeInStage
+
+        return TimeInStage(issues, *args, **kwargs)
+
+
+class TransitionsCommand(AggregationCommand):
+    takes_table = True
+
+    def __init__(self, config, prog_args, *args, **kwargs):
+        super().__init__(config, prog_args, *args, **kwargs)
+
+    def list(self, repository):
+        return repository.list(milestone=self.prog_args.milestone)
+
+    @property
+    def resolvers(self):
+        from .issues import GitlabScopedLabelResolver, GitLabStateEventResolver
+
+        return [GitlabScopedLabelResolver, GitLabStateEventResolver]
+
+    def aggregate_results(self, issues, *args, **kwargs):
+        from .metrics import StageTransitionMatrix
+
+        return StageTransitionMatrix(issues, *args, **kwargs)
+
+
+class WipAgeCommand(AggregationCommand):
+    takes_table = True
+
+    def __init__(self, config, prog_args, *args, **kwargs):
+        super().__init__(config, prog_args, *args, **kwargs)
+
+    def list(self, repository):
+        return repository.list(milestone=self.prog_args.milestone)
+
+    @property
+    def resolvers(self):
+        from .issues import GitlabScopedLabelResolver, GitLabStateEventResolver
+
+        return [GitlabScopedLabelResolver, GitLabStateEventResolver]
+
+    def aggregate_results(self, issues, *args, **kwargs):
+        from .metrics import WipAge
+
+        return WipAge(issues, *args, **kwargs)
+
+
+class ForecastCommand(AggregationCommand):
+    def __init__(self, config, prog_args, *args, **kwargs):
+        super().__init__(config, prog_args, *args, **kwargs)
+
+    def list(self, repository):
+        return repository.list(milestone=self.prog_args.milestone)
+
+    @property
+    def resolvers(self):
+        from .issues import GitlabScopedLabelResolver, GitLabStateEventResolver
+
+        return [GitlabScopedLabelResolver, GitLabStateEventResolver]
+
+    def aggregate_results(self, issues, stages=None, days=30, *args, **kwargs):
+        from .forecast import MonteCarloForecast, daily_throughput
+        from .metrics import CumulativeFlow, build_transitions
+
+        flow = CumulativeFlow(build_transitions(issues), stages=stages, days=days)
+        throughput = daily_throughput(flow.get_data_frame(), closed=stages[-1])
+        remaining = len([i for i in issues if i.closed_at is None])
+        _log.info(f"Forecasting {remaining} open issues from {throughput.sum()} closed in {days} days")
+        return MonteCarloForecast(throughput, remaining, start_date=flow.included_dates[-1], *args, **kwargs)
+
+
+class ServeCommand(AbstractCommand):
+    """Answer dashboard requests over HTTP from issues and aggregations kept in memory."""
+
+    def __init__(self, config, prog_args, *args, **kwargs):
+        super().__init__(config, prog_args, *args, **kwargs)
+
+    def execute(self):
+        from .server import AnalyticsService, serve
+
+        service = AnalyticsService(
+            self.config,
+            group=self.prog_args.group,
+            refresh=self.prog_args.refresh,
+            store=self.prog_args.store,
+            **self.prog_args.extra_args,
+        )
+        serve(service, host=self.prog_args.host, port=self.prog_args.port)
+
+
+class WebhookCommand(AbstractCommand):
+    """Record GitLab Issue Hook payloads into an event store."""
+
+    def __init__(self, config, prog_args, *args, **kwargs):
+        super().__init__(config, prog_args, *args, **kwargs)
+
+    def execute(self):
+        from .events import EventStore, make_webhook_server
+
+        store = EventStore(self.prog_args.store)
+        server = make_webhook_server(
+            store, host=self.prog_args.host, port=self.prog_args.port, secret=self.config.get("WEBHOOK_SECRET")
+        )
+        _log.info(f"Recording webhooks into '{self.prog_args.store}' on port {server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            store.close()
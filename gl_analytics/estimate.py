@@ -0,0 +1,178 @@
+"""Estimate what listing issues from GitLab costs before running it, from the first page of issues only.
+
+The total comes from GitLab's X-Total header, the resolver requests are one per issue and resolver, and
+the share of them the local cache answers is sampled from the issues of the first page. The wall time
+is extrapolated from the latency of the first page at the concurrency of the repository. It is bounded
+by the CPU time the first page took in the client, the threads share the interpreter, and by the
+RateLimit-* headers when GitLab sends them.
+"""
+import logging
+import math
+import time
+from urllib.parse import urljoin
+
+from .instrumentation import classify_endpoint
+
+_log = logging.getLogger(__name__)
+
+# GitLab's page size when per_page is not given
+DEFAULT_PER_PAGE = 20
+
+# GitLab's RateLimit-Limit is the number of requests allowed every minute
+RATE_WINDOW = 60.0
+
+
+class CostEstimate:
+    """The requests and time a listing is expected to take."""
+
+    def __init__(
+        self,
+        url,
+        params,
+        issues,
+        exact,
+        per_page,
+        resolvers,
+        latency,
+        workers,
+        cpu=0.0,
+        rate_limit=None,
+        rate_remaining=None,
+    ):
+        """Initialize an estimate.
+
+        args:
+        url url of the issues listing, params its query parameters
+        issues expected number of issues, exact whether GitLab reported it or it is a lower bound
+        per_page issues on every page
+        resolvers list of (endpoint, requests, cached) tuples, one for every resolver
+        latency seconds the first page took
+        workers threads resolving the issues of a page
+
+        kwargs:
+        cpu seconds of CPU time the client spent on the first page
+        rate_limit requests allowed every minute, rate_remaining of them left, None without a limit
+        """
+        self.url = url
+        self.params = params
+        self.issues = issues
+        self.exact = exact
+        self.per_page = per_page
+        self.resolvers = resolvers
+        self.latency = latency
+        self.workers = workers
+        self.cpu = cpu
+        self.rate_limit = rate_limit
+        self.rate_remaining = rate_remaining
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.issues / self.per_page))
+
+    @property
+    def requests(self):
+        """Number of requests sent to GitLab, the pages and the resolver requests the cache does not answer."""
+        return self.pages + sum(requests - cached for _, requests, cached in self.resolvers)
+
+    @property
+    def cached(self):
+        return sum(cached for _, _, cached in self.resolvers)
+
+    @property
+    def seconds(self):
+        """Expected wall time, the pages one after another and the resolver requests of a page in parallel."""
+        concurrency = max(1, min(self.workers, self.per_page))
+        resolving = (self.requests - self.pages) * self.latency / concurrency
+        seconds = max(self.pages * self.latency + resolving, self.requests * self.cpu)
+        if self.rate_limit:
+            seconds = max(seconds, self.requests / self.rate_limit * RATE_WINDOW)
+        return seconds
+
+    @property
+    def over_rate_limit(self):
+        """Whether the run needs more requests than remain of the rate limit, GitLab answers those with 429."""
+        return self.rate_remaining is not None and self.requests > self.rate_remaining
+
+    def format(self):
+        """Returns the estimate as text lines."""
+        filters = ", ".join(f"{k}={v}" for k, v in self.params)
+        issues = f"{self.issues}" if self.exact else f"more than {self.issues}, X-Total not reported"
+        lines = [
+            f"Estimate for {self.url} ({filters})",
+            f"  {'issues':<24}{issues}",
+            f"  {'issues pages':<24}{self.pages} of {self.per_page}",
+        ]
+        for endpoint, requests, cached in self.resolvers:
+            lines.append(f"  {endpoint:<24}{requests} requests, {cached} from the local cache")
+        lines += [
+            f"  {'requests':<24}{self.requests} to GitLab, {self.cached} from the local cache",
+            f"  {'latency':<24}{self.latency * 1000:.0f}ms, {self.cpu * 1000:.0f}ms CPU, measured on the first page",
+            f"  {'wall time':<24}{_duration(self.seconds)} with {self.workers} workers",
+        ]
+        if self.rate_limit:
+            lines.append(f"  {'rate limit':<24}{self.rate_limit} a minute, {self.rate_remaining} remaining")
+        if self.over_rate_limit:
+            lines.append("  warning: more requests than remain of the rate limit, those over it fail with 429")
+        return "\n".join(lines)
+
+
+def _duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(round(seconds), 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes}m"
+
+
+def _int_header(headers, name):
+    value = headers.get(name)
+    return int(value) if value and value.isdigit() else None
+
+
+def estimate_cost(session, url, params, resolvers, workers):
+    """Fetch the first page of issues and estimate the cost of listing them all with the resolvers.
+
+    args:
+    session GitlabSession the listing uses
+    url url of the issues listing, params its query parameters, without keyset pagination
+    resolvers resolver classes of the repository
+    workers threads resolving the issues of a page
+    """
+    start, start_cpu = time.perf_counter(), time.process_time()
+    res = session.get(url, params=params)
+    res.raise_for_status()
+    page = res.json()
+    latency, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+
+    total = _int_header(res.headers, "X-Total")
+    exact = total is not None or "next" not in res.links
+    if total is None:
+        total = len(page)
+    per_page = _int_header(res.headers, "X-Per-Page") or DEFAULT_PER_PAGE
+
+    estimates = []
+    for resolver_cls in resolvers:
+        resolver = resolver_cls(session)
+        paths = [resolver.build_request_url(item["project_id"], item["iid"]) for item in page]
+        sampled = sum(1 for path in paths if session.cached(path))
+        cached = round(total * sampled / len(paths)) if paths else 0
+        endpoint = classify_endpoint(urljoin(session.baseurl, resolver.build_request_url(0, 0)))
+        estimates.append((endpoint, total, cached))
+
+    estimate = CostEstimate(
+        url,
+        params,
+        total,
+        exact,
+        per_page,
+        estimates,
+        latency,
+        workers,
+        cpu=cpu,
+        rate_limit=_int_header(res.headers, "RateLimit-Limit"),
+        rate_remaining=_int_header(res.headers, "RateLimit-Remaining"),
+    )
+    _log.info(f"Estimated {estimate.requests} requests from the first page of {len(page)} issues")
+    return estimate
@@ -0,0 +1,240 @@
+"""Store of issue events received from GitLab webhooks, so reports need no polling.
+
+GitLab "Issue Hook" payloads are translated into records shaped like the resource_label_events and
+resource_state_events APIs, and persisted in sqlite. Issues are rebuilt from the store with the same
+resolvers that process the API responses, so both sources produce identical histories.
+"""
+import json
+import logging
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dateutil import parser as date_parser
+
+from .issues import AbstractRepository, GitlabScopedLabelResolver, GitLabStateEventResolver, Issue
+
+_log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    project_id INTEGER NOT NULL,
+    issue_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    closed_at TEXT,
+    state TEXT NOT NULL,
+    issue_type TEXT,
+    milestone_id INTEGER,
+    PRIMARY KEY (project_id, issue_id)
+);
+CREATE TABLE IF NOT EXISTS label_events (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    issue_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    action TEXT NOT NULL,
+    label TEXT NOT NULL,
+    UNIQUE (project_id, issue_id, created_at, action, label)
+);
+CREATE TABLE IF NOT EXISTS state_events (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    issue_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    state TEXT NOT NULL,
+    UNIQUE (project_id, issue_id, created_at, state)
+);
+"""
+
+# Issue Hook actions that change the state of an issue, and the state event they record
+STATE_ACTIONS = {"close": "closed", "reopen": "reopened"}
+
+
+def _timestamp(value):
+    """ISO 8601 UTC text of a webhook datetime, e.g. "2021-03-10 16:59:37 UTC"."""
+    return date_parser.parse(value).isoformat() if value else None
+
+
+def _titles(labels):
+    return [x["title"] for x in labels or []]
+
+
+class EventStore:
+    """Issues and their label and state events, persisted in a sqlite database."""
+
+    def __init__(self, path=":memory:"):
+        """Open the store, creating the tables when needed.
+
+        args:
+        path sqlite database file, default in memory
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def ingest(self, payload):
+        """Record an Issue Hook payload, returns the number of new events.
+
+        Label changes are recorded at the time the issue was updated, labels of a new issue at the
+        time it was created. Delivering the same payload again records nothing new.
+        """
+        if payload.get("object_kind") != "issue":
+            raise ValueError(f"Unsupported webhook payload '{payload.get('object_kind')}'")
+
+        attrs = payload["object_attributes"]
+        project_id = attrs.get("project_id") or payload["project"]["id"]
+        issue_id = attrs["iid"]
+        action = attrs.get("action")
+        created_at = _timestamp(attrs["created_at"])
+        updated_at = _timestamp(attrs.get("updated_at")) or created_at
+        current = _titles(payload.get("labels", attrs.get("labels")))
+
+        label_events = []
+        changes = payload.get("changes", {}).get("labels")
+        if changes:
+            previous = _titles(changes.get("previous"))
+            current = _titles(changes.get("current"))
+            label_events += [(updated_at, "add", x) for x in current if x not in previous]
+            label_events += [(updated_at, "remove", x) for x in previous if x not in current]
+        elif action == "open":
+            label_events += [(created_at, "add", x) for x in current]
+
+        state_events = []
+        if action in STATE_ACTIONS:
+            at = _timestamp(attrs.get("closed_at")) if action == "close" else None
+            state_events.append((at or updated_at, STATE_ACTIONS[action]))
+
+        issue_type = next((x[len("type::") :] for x in current if x.startswith("type::")), None)
+        issue = (
+            project_id,
+            issue_id,
+            created_at,
+            _timestamp(attrs.get("closed_at")),
+            attrs.get("state", "opened"),
+            issue_type,
+            attrs.get("milestone_id"),
+        )
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO issues VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (project_id, issue_id) DO UPDATE SET"
+                " closed_at = excluded.closed_at, state = excluded.state, issue_type = excluded.issue_type,"
+                " milestone_id = excluded.milestone_id",
+                issue,
+            )
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO label_events (project_id, issue_id, created_at, action, label)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(project_id, issue_id, *x) for x in label_events],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO state_events (project_id, issue_id, created_at, state) VALUES (?, ?, ?, ?)",
+                [(project_id, issue_id, *x) for x in state_events],
+            )
+            return self._conn.total_changes - before
+
+    def label_events(self, project_id, issue_id):
+        """Label events of an issue, oldest first, shaped like the resource_label_events API."""
+        rows = self._query(
+            "SELECT created_at, action, label FROM label_events WHERE project_id = ? AND issue_id = ?"
+            " ORDER BY created_at, id",
+            (project_id, issue_id),
+        )
+        return [{"created_at": r["created_at"], "action": r["action"], "label": {"name": r["label"]}} for r in rows]
+
+    def state_events(self, project_id, issue_id):
+        """State events of an issue, oldest first, shaped like the resource_state_events API."""
+        rows = self._query(
+            "SELECT created_at, state FROM state_events WHERE project_id = ? AND issue_id = ? ORDER BY created_at, id",
+            (project_id, issue_id),
+        )
+        return [{"created_at": r["created_at"], "state": r["state"]} for r in rows]
+
+    def issue_rows(self, milestone_id=None, state=None):
+        sql = "SELECT * FROM issues WHERE 1 = 1"
+        params = []
+        if milestone_id is not None:
+            sql += " AND milestone_id = ?"
+            params.append(milestone_id)
+        if state is not None:
+            sql += " AND state = ?"
+            params.append(state)
+        return self._query(sql + " ORDER BY project_id, issue_id", params)
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+
+class EventStoreRepository(AbstractRepository):
+    """Issues rebuilt from an EventStore, with the histories the label and state resolvers produce."""
+
+    def __init__(self, store):
+        self._store = store
+        self._label_resolver = GitlabScopedLabelResolver(None)
+        self._state_resolver = GitLabStateEventResolver(None)
+
+    def list(self, milestone=None, state=None, **kwargs):
+        """Return issues from the store.
+
+        milestone: milestone id, webhooks do not carry milestone names. Names, such as #started,
+                   list all issues.
+        state: issue state filter, e.g. 'closed'
+        """
+        milestone_id = int(milestone) if milestone is not None and str(milestone).isdigit() else None
+        return [self._build_issue_from(row) for row in self._store.issue_rows(milestone_id, state)]
+
+    def _build_issue_from(self, row):
+        opened_at = date_parser.parse(row["created_at"])
+        closed_at = date_parser.parse(row["closed_at"]) if row["closed_at"] else None
+        issue = Issue(row["issue_id"], row["project_id"], opened_at, issue_type=row["issue_type"], closed_at=closed_at)
+        self._label_resolver.process(issue, self._store.label_events(row["project_id"], row["issue_id"]))
+        self._state_resolver.process(issue, self._store.state_events(row["project_id"], row["issue_id"]))
+        return issue
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Records the Issue Hook payloads posted by GitLab in the store of the server."""
+
+    def do_POST(self):
+        secret = self.server.secret
+        if secret and self.headers.get("X-Gitlab-Token") != secret:
+            return self._send(401, {"error": "Invalid X-Gitlab-Token"})
+
+        if self.headers.get("X-Gitlab-Event") != "Issue Hook":
+            return self._send(202, {"ignored": self.headers.get("X-Gitlab-Event")})
+
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            count = self.server.store.ingest(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            _log.warning(f"Unable to record webhook payload: {e!r}")
+            return self._send(400, {"error": f"Invalid Issue Hook payload: {e!r}"})
+
+        self._send(200, {"events": count})
+
+    def _send(self, status, message):
+        body = json.dumps(message).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _log.info("%s %s", self.address_string(), format % args)
+
+
+def make_webhook_server(store, host="127.0.0.1", port=8081, secret=None):
+    """Create a threaded HTTP server recording webhooks into store, port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    server.secret = secret
+    return server
@@ -0,0 +1,129 @@
+"""Monte Carlo forecasts of delivery dates from historical throughput."""
+
+import datetime
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# a simulation that has not finished within this many days is reported as never finishing
+MAX_DAYS = 3650
+
+# upper bound of the days drawn at once, across all simulations
+MAX_DRAWS = 10_000_000
+
+
+def daily_throughput(df, closed="closed"):
+    """Items closed per day, from the closed stage of a cumulative flow DataFrame."""
+    return df[closed].diff().dropna().clip(lower=0).to_numpy(dtype=np.int64)
+
+
+def simulate(throughput, remaining, simulations, seed=None):
+    """Days needed to close the remaining items in every simulation, np.inf when never finished.
+
+    Each simulated day closes a number of items drawn at random from the historical throughput.
+    Days are drawn for all unfinished simulations at once, in blocks of at most the expected number
+    of days and MAX_DRAWS draws in total, so memory stays bounded however long the backlog is.
+    """
+    days = np.full(simulations, np.inf)
+    if remaining <= 0:
+        days[:] = 0
+        return days
+
+    samples = np.asarray(throughput, dtype=np.int64)
+    if not samples.size or not samples.any():
+        return days
+
+    rng = np.random.default_rng(seed)
+    expected = int(min(MAX_DAYS, np.ceil(2 * remaining / samples.mean()) + 1))
+    closed = np.zeros(simulations, dtype=np.int64)
+    pending = np.arange(simulations)
+    elapsed = 0
+    while pending.size and elapsed < MAX_DAYS:
+        block = max(1, min(expected, MAX_DAYS - elapsed, MAX_DRAWS // pending.size))
+        totals = closed[pending, np.newaxis] + rng.choice(samples, size=(pending.size, block)).cumsum(axis=1)
+        finished = totals[:, -1] >= remaining
+        first_day = (totals[finished] >= remaining).argmax(axis=1)
+        days[pending[finished]] = elapsed + first_day + 1
+
+        closed[pending] = totals[:, -1]
+        pending = pending[~finished]
+        elapsed += block
+
+    return days
+
+
+class MonteCarloForecast:
+    """Completion date percentiles of the remaining items from random samples of daily throughput."""
+
+    def __init__(
+        self,
+        throughput,
+        remaining,
+        simulations=100000,
+        percentiles=[50, 70, 85, 95],
+        start_date=None,
+        workers=None,
+        seed=None,
+        *args,
+        **kwargs,
+    ):
+        """Run the simulations.
+
+        args:
+        throughput sequence of items closed per day
+        remaining number of items still open
+
+        kwargs:
+        simulations number of simulations to run, default 100000
+        percentiles list of percentiles to report
+        start_date date the simulations start from, default today()
+        workers spread the simulations across a process pool of this size, default in process
+        seed seed for reproducible simulations
+        """
+        if simulations < 1:
+            raise ValueError("simulations must include at least 1 simulation")
+
+        if start_date and not isinstance(start_date, datetime.date):
+            raise ValueError("start_date must be datetime.date")
+
+        if hasattr(start_date, "date"):
+            start_date = start_date.date()
+
+        self.start_date = start_date or datetime.datetime.now(datetime.timezone.utc).date()
+        self.remaining = remaining
+        self.percentiles = percentiles
+
+        days = self._run(throughput, remaining, simulations, workers, seed)
+        self._data = self._summarize(np.sort(days))
+
+    def _run(self, throughput, remaining, simulations, workers, seed):
+        if not workers or workers < 2:
+            return simulate(throughput, remaining, simulations, seed)
+
+        # every worker runs an equal share of the simulations from an independent random stream
+        sizes = [len(x) for x in np.array_split(np.arange(simulations), workers) if len(x)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(simulate, *zip(*[(throughput, remaining, n, s) for n, s in zip(sizes, seeds)]))
+            return np.concatenate(list(results))
+
+    def _summarize(self, days):
+        # nearest rank, so every reported number of days happened in at least one simulation
+        ranks = np.ceil(np.array(self.percentiles) / 100 * days.size).astype(int).clip(1, days.size) - 1
+        values = days[ranks]
+        finished = np.isfinite(values)
+        dates = [
+            pd.Timestamp(self.start_date) + pd.Timedelta(days=x) if ok else pd.NaT for x, ok in zip(values, finished)
+        ]
+        return pd.DataFrame(
+            {
+                "days": pd.Series(values).where(finished).astype("Int64").array,
+                "date": pd.DatetimeIndex(dates).date,
+            },
+            index=pd.Index(self.percentiles, name="percentile"),
+        )
+
+    def get_data_frame(self):
+        return self._data
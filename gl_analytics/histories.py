@@ -0,0 +1,267 @@
+"""Columnar form of issue histories for vectorized aggregations.
+"""
+import datetime
+import logging
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+_log = logging.getLogger(__name__)
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("issue", "<i8"),
+        ("project", "<i8"),
+        ("type", "<i2"),
+        ("stage", "<i2"),
+        ("start", "<M8[ns]"),
+        ("end", "<M8[ns]"),
+    ]
+)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+NAT = np.iinfo(np.int64).min
+
+
+def _to_ns(dt):
+    """Nanoseconds since the epoch of an aware datetime, converting through timedelta keeps it exact."""
+    return NAT if dt is None else (dt - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+# what a worker process needs to attach to a shared HistoryTable, see HistoryTable.share
+HistoryTableDescriptor = namedtuple("HistoryTableDescriptor", ["name", "length", "stages", "types"])
+
+
+def _to_datetimes(values):
+    """UTC datetimes of datetime64 values, None for NaT."""
+    utc = datetime.timezone.utc
+    return [None if x is None else x.replace(tzinfo=utc) for x in values.astype("M8[us]").astype(object)]
+
+
+class HistoryTable:
+    """Histories of many issues as one array of fixed width records, one record per history event.
+
+    The records of an issue are contiguous and in history order. Stage and type names are stored
+    once and referenced by code, a type code of -1 means the issue has no type. Datetimes are UTC,
+    an event without an end has NaT.
+    """
+
+    def __init__(self, records, stages, types):
+        self._records = records
+        self._stages = list(stages)
+        self._types = list(types)
+        self._keys = None
+        self._shm = None
+
+    @classmethod
+    def from_issues(cls, issues):
+        """Build the table from resolved issues."""
+        stages = {}
+        types = {}
+        rows = []
+        for issue in issues:
+            type_code = -1 if issue.issue_type is None else types.setdefault(issue.issue_type, len(types))
+            project_id = int(issue.project_id)
+            for label, start, end in issue.history:
+                stage_code = stages.setdefault(label, len(stages))
+                rows.append((issue.issue_id, project_id, type_code, stage_code, _to_ns(start), _to_ns(end)))
+
+        records = np.empty(len(rows), dtype=EVENT_DTYPE)
+        if rows:
+            issue_ids, project_ids, type_codes, stage_codes, starts, ends = zip(*rows)
+            records["issue"] = issue_ids
+            records["project"] = project_ids
+            records["type"] = type_codes
+            records["stage"] = stage_codes
+            records["start"] = np.array(starts, dtype=np.int64).view("M8[ns]")
+            records["end"] = np.array(ends, dtype=np.int64).view("M8[ns]")
+
+        return cls(records, stages, types)
+
+    @classmethod
+    def concat(cls, tables):
+        """Join tables one after another, mapping their stage and type codes onto shared names."""
+        stages = {}
+        types = {}
+        parts = [table.recode(stages, types) for table in tables]
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=EVENT_DTYPE)
+        return cls(records, stages, types)
+
+    def recode(self, stages, types):
+        """A copy of the records with their stage and type codes mapped onto other codes.
+
+        args:
+        stages, types dicts of names to codes, the names missing from them are added
+        """
+        records = self._records.copy()
+        stage_codes = np.array([stages.setdefault(s, len(stages)) for s in self._stages], dtype=np.int16)
+        # the last entry maps the code -1 of issues without a type onto itself
+        type_codes = np.array([types.setdefault(t, len(types)) for t in self._types] + [-1], dtype=np.int16)
+        if len(records):
+            records["stage"] = stage_codes[records["stage"]]
+            records["type"] = type_codes[records["type"]]
+        return records
+
+    def to_issues(self):
+        """Rebuild the issues of the table, the inverse of from_issues."""
+        from .issues import Issue
+
+        r = self._records
+        starts = _to_datetimes(r["start"])
+        ends = _to_datetimes(r["end"])
+        stages = [self._stages[x] for x in r["stage"]]
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(self.issue_keys())) + 1, [len(r)]]) if len(r) else []
+
+        issues = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            type_code = r["type"][first]
+            events = list(zip(stages[first:last], starts[first:last], ends[first:last]))
+            issue_type = None if type_code < 0 else self._types[type_code]
+            issues.append(Issue.from_history(int(r["issue"][first]), int(r["project"][first]), events, issue_type))
+        return issues
+
+    def share(self):
+        """Publish the records in shared memory, returns a SharedHistoryTable to close when done.
+
+        Worker processes attach to it with HistoryTable.attach(shared.descriptor) without copying.
+        """
+        return SharedHistoryTable(self)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """A table viewing the records another process published with share, close it when done."""
+        shm = shared_memory.SharedMemory(name=descriptor.name)
+        records = np.ndarray((descriptor.length,), dtype=EVENT_DTYPE, buffer=shm.buf)
+        table = cls(records, descriptor.stages, descriptor.types)
+        table._shm = shm
+        return table
+
+    def close(self):
+        """Detach an attached table from the shared memory, the table is empty afterwards."""
+        if self._shm is None:
+            return
+        self._records = np.empty(0, dtype=EVENT_DTYPE)
+        self._keys = None
+        shm, self._shm = self._shm, None
+        try:
+            shm.close()
+        except BufferError:
+            # views of the records are still in use, the mapping is released with them
+            _log.debug(f"Shared memory {shm.name} is still viewed, not closed")
+
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def stages(self):
+        return self._stages
+
+    @property
+    def types(self):
+        return self._types
+
+    def issue_keys(self):
+        """Ordinal of the issue each record belongs to, counting from 0."""
+        if self._keys is None:
+            r = self._records
+            changed = (r["issue"][1:] != r["issue"][:-1]) | (r["project"][1:] != r["project"][:-1])
+            self._keys = np.concatenate([[0], np.cumsum(changed)]) if len(r) else np.zeros(0, dtype=int)
+        return self._keys
+
+    def count_issues(self):
+        """Number of issues in the table."""
+        keys = self.issue_keys()
+        return int(keys[-1]) + 1 if len(keys) else 0
+
+    def closed(self, stage="closed"):
+        """A table of the issues whose last event is the closed stage, as `Issue.closed_at` tells them."""
+        keys = self.issue_keys()
+        if stage not in self._stages or not len(keys):
+            return HistoryTable(self._records[:0], self._stages, self._types)
+        last = np.append(np.flatnonzero(np.diff(keys)), len(keys) - 1)
+        closed = np.flatnonzero(self._records["stage"][last] == self._stages.index(stage))
+        return HistoryTable(self._records[np.isin(keys, closed)], self._stages, self._types)
+
+    def to_frame(self, positions=None):
+        """A DataFrame of the records with categorical stage and type, and timezone aware datetimes.
+
+        kwargs:
+        positions only include the records at these positions, default all records
+        """
+        r = self._records
+        keys = self.issue_keys()
+        if positions is not None:
+            r = r[positions]
+            keys = keys[positions]
+        return pd.DataFrame(
+            {
+                "key": keys,
+                "issue": r["issue"],
+                "project": r["project"],
+                "type": pd.Categorical.from_codes(r["type"], categories=self._types),
+                "stage": pd.Categorical.from_codes(r["stage"], categories=self._stages),
+                "start": pd.DatetimeIndex(r["start"]).tz_localize("UTC"),
+                "end": pd.DatetimeIndex(r["end"]).tz_localize("UTC"),
+            }
+        )
+
+    def __len__(self):
+        return len(self._records)
+
+
+class SharedHistoryTable:
+    """The records of a HistoryTable copied once into shared memory, see HistoryTable.share.
+
+    The memory is freed when closed, use as a context manager around the work of the processes.
+    """
+
+    def __init__(self, table):
+        records = table.records
+        # shared memory can not be empty
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, records.nbytes))
+        np.ndarray(records.shape, dtype=EVENT_DTYPE, buffer=self._shm.buf)[:] = records
+        self.descriptor = HistoryTableDescriptor(self._shm.name, len(records), tuple(table.stages), tuple(table.types))
+
+    def close(self):
+        if self._shm is not None:
+            shm, self._shm = self._shm, None
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HistoryIntervals:
+    """Interval tree over the events of a HistoryTable, finding the events in effect at a point in time.
+
+    An event covers its start up to, but not including, its end. An event without an end covers
+    everything after its start. The tree is built by the first query, every query after that takes
+    logarithmic time in the number of events.
+    """
+
+    def __init__(self, table):
+        r = table.records
+        start = r["start"].view(np.int64)
+        end = r["end"].view(np.int64)
+        end = np.where(end == NAT, np.iinfo(np.int64).max, np.maximum(start, end))
+        self._table = table
+        self._index = pd.IntervalIndex.from_arrays(start, end, closed="left")
+
+    @property
+    def table(self):
+        return self._table
+
+    def at(self, when):
+        """Positions of the records in effect at a timezone aware datetime, in table order."""
+        indexer, _ = self._index.get_indexer_non_unique(np.array([_to_ns(when)], dtype=np.int64))
+        return np.sort(indexer[indexer >= 0])
+
+    def __len__(self):
+        return len(self._index)
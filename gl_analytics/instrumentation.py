@@ -0,0 +1,168 @@
+"""Counts, bytes, cache results and latency of the requests made to the GitLab API."""
+
+import logging
+import re
+import threading
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+_log = logging.getLogger(__name__)
+
+# endpoint name and the template of the paths it serves, matched against the request url path
+ENDPOINT_TEMPLATES = [
+    ("issues", re.compile(r"/groups/[^/]+/issues$")),
+    ("resource_label_events", re.compile(r"/projects/[^/]+/issues/[^/]+/resource_label_events$")),
+    ("resource_state_events", re.compile(r"/projects/[^/]+/issues/[^/]+/resource_state_events$")),
+    ("closed_by", re.compile(r"/projects/[^/]+/issues/[^/]+/closed_by$")),
+]
+
+# upper bounds, in seconds, of the latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CACHE_RESULTS = ("hit", "miss", "revalidated")
+
+_CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+def classify_endpoint(url):
+    """The name of the endpoint template the url belongs to, "other" when none matches."""
+    path = url.split("?", 1)[0].rstrip("/")
+    for name, template in ENDPOINT_TEMPLATES:
+        if template.search(path):
+            return name
+    return "other"
+
+
+def cache_result(response):
+    """Whether a response was a cache "hit", a "miss", or "revalidated" with the server.
+
+    CacheControlAdapter marks responses it built from the cache with from_cache. Those that were only
+    served from the cache after sending conditional headers were revalidated by a 304 Not Modified.
+    """
+    if not getattr(response, "from_cache", False):
+        return "miss"
+    headers = getattr(response.request, "headers", None) or {}
+    if any(h in headers for h in _CONDITIONAL_HEADERS):
+        return "revalidated"
+    return "hit"
+
+
+class RequestMetrics:
+    """Thread safe totals of the requests of a session, by endpoint."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._statuses = Counter()
+        self._cache = Counter()
+        self._bytes = Counter()
+        self._histograms = defaultdict(lambda: [0] * (len(self._buckets) + 1))
+        self._latency_sum = Counter()
+        self._latency_max = Counter()
+
+    def record(self, url, response, seconds):
+        """Add a response of the request to url that took the given number of seconds."""
+        endpoint = classify_endpoint(url)
+        size = len(response.content or b"")
+        result = cache_result(response)
+        bucket = bisect_left(self._buckets, seconds)
+        with self._lock:
+            self._statuses[(endpoint, response.status_code)] += 1
+            self._cache[(endpoint, result)] += 1
+            self._bytes[endpoint] += size
+            self._histograms[endpoint][bucket] += 1
+            self._latency_sum[endpoint] += seconds
+            self._latency_max[endpoint] = max(self._latency_max[endpoint], seconds)
+
+    def count(self, endpoint=None):
+        """Number of requests to the endpoint, or to all endpoints."""
+        with self._lock:
+            return sum(n for (e, _), n in self._statuses.items() if endpoint in (None, e))
+
+    def summary(self):
+        """Returns a list of dicts, one for every endpoint."""
+        rows = []
+        with self._lock:
+            for endpoint in sorted(self._bytes):
+                histogram = self._histograms[endpoint]
+                count = sum(histogram)
+                largest = self._latency_max[endpoint]
+                rows.append(
+                    dict(
+                        endpoint=endpoint,
+                        requests=count,
+                        errors=sum(n for (e, s), n in self._statuses.items() if e == endpoint and s >= 400),
+                        bytes=self._bytes[endpoint],
+                        **{r: self._cache[(endpoint, r)] for r in CACHE_RESULTS},
+                        mean_ms=1000 * self._latency_sum[endpoint] / count,
+                        p95_ms=1000 * self._bucket_quantile(histogram, 0.95, largest),
+                        max_ms=1000 * largest,
+                    )
+                )
+        return rows
+
+    def _bucket_quantile(self, histogram, q, largest):
+        # upper bound of the bucket holding the quantile, no more than the largest latency seen
+        rank = q * sum(histogram)
+        total = 0
+        for i, n in enumerate(histogram):
+            total += n
+            if n and total >= rank:
+                return min(self._buckets[i], largest) if i < len(self._buckets) else largest
+        return 0.0
+
+    def format_summary(self):
+        """A plain text table of the summary."""
+        header = "endpoint               requests errors      bytes   hit  miss reval  mean ms   p95 ms   max ms"
+        lines = [header]
+        for r in self.summary():
+            lines.append(
+                f"{r['endpoint']:<22} {r['requests']:>8} {r['errors']:>6} {r['bytes']:>10} {r['hit']:>5} "
+                f"{r['miss']:>5} {r['revalidated']:>5} {r['mean_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['max_ms']:>8.1f}"
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """The metrics in Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP gitlab_requests_total GitLab API requests by endpoint and status code.",
+                "# TYPE gitlab_requests_total counter",
+            ]
+            for (endpoint, code), n in sorted(self._statuses.items()):
+                lines.append(f'gitlab_requests_total{{endpoint="{endpoint}",code="{code}"}} {n}')
+            lines += [
+                "# HELP gitlab_cache_requests_total GitLab API requests by endpoint and HTTP cache result.",
+                "# TYPE gitlab_cache_requests_total counter",
+            ]
+            for (endpoint, result), n in sorted(self._cache.items()):
+                lines.append(f'gitlab_cache_requests_total{{endpoint="{endpoint}",result="{result}"}} {n}')
+            lines += [
+                "# HELP gitlab_response_bytes_total Bytes of GitLab API response bodies by endpoint.",
+                "# TYPE gitlab_response_bytes_total counter",
+            ]
+            lines += [f'gitlab_response_bytes_total{{endpoint="{e}"}} {n}' for e, n in sorted(self._bytes.items())]
+            lines += [
+                "# HELP gitlab_request_duration_seconds Latency of GitLab API requests by endpoint.",
+                "# TYPE gitlab_request_duration_seconds histogram",
+            ]
+            for endpoint, histogram in sorted(self._histograms.items()):
+                total = 0
+                for bound, n in zip(self._buckets + ("+Inf",), histogram):
+                    total += n
+                    labels = f'endpoint="{endpoint}",le="{bound}"'
+                    lines.append(f"gitlab_request_duration_seconds_bucket{{{labels}}} {total}")
+                lines.append(
+                    f'gitlab_request_duration_seconds_sum{{endpoint="{endpoint}"}} {self._latency_sum[endpoint]}'
+                )
+                lines.append(f'gitlab_request_duration_seconds_count{{endpoint="{endpoint}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+    def save(self, file):
+        """Write the Prometheus text format to a file path or open text file buffer."""
+        if hasattr(file, "write"):
+            file.write(self.to_prometheus())
+        else:
+            with open(file, "w") as f:
+                f.write(self.to_prometheus())
@@ -1,15 +1,16 @@
 """ Issues module interacts with a backend system API, e.g. GitLab.
 """
-# import json
+import json
 import logging
 import requests
+import time
 
 from abc import ABC, abstractmethod
 from cachecontrol import CacheControlAdapter
 from cachecontrol.caches.file_cache import FileCache
 from cachecontrol.heuristics import ExpiresAfter
 from collections.abc import Sequence
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # from datetime import datetime
 from dateutil import parser as date_parser
@@ -18,8 +19,13 @@ from urllib.parse import urljoin
 
 from functools import reduce
 
+from .utils import span
+
 _log = logging.getLogger(__name__)
 
+# threads resolving the issues of a page
+MAX_WORKERS = 10
+
 
 class Session(ABC):  # pragma: no cover
     @abstractmethod
@@ -28,7 +34,14 @@ class Session(ABC):  # pragma: no cover
 
 
 class GitlabSession(Session):
-    def __init__(self, base_url, access_token=None):
+    def __init__(self, base_url, access_token=None, metrics=None, cassette=None):
+        """Initialize a session of requests to the GitLab API.
+
+        Optional:
+        metrics: RequestMetrics object recording every request, see the instrumentation module
+        cassette: Cassette object to record every response to, or to replay the responses from
+                  without any network, see the cassette module
+        """
         if not base_url.endswith("/"):
             base_url += "/"
         self._base_url = base_url
@@ -44,6 +57,8 @@ class GitlabSession(Session):
         sess.mount("https://", adapter)
 
         self.session = sess
+        self.metrics = metrics
+        self.cassette = cassette
 
     def get(self, path, params=None):
         """Calls request.get(url) appending relative path to session baseurl.
@@ -58,7 +73,31 @@ class GitlabSession(Session):
             raise ValueError
         url = urljoin(self.baseurl, path)
 
-        return self.session.get(url, params=params)
+        if self.metrics is None:
+            return self._send(url, params)
+
+        start = time.perf_counter()
+        res = self._send(url, params)
+        self.metrics.record(url, res, time.perf_counter() - start)
+        return res
+
+    def cached(self, path, params=None):
+        """Whether a fresh response to the GET request is in the local cache, answering it without a request."""
+        request = self.session.prepare_request(requests.Request("GET", urljoin(self.baseurl, path), params=params))
+        controller = getattr(self.session.get_adapter(request.url), "controller", None)
+        if controller is None:
+            return False
+        return bool(controller.cached_request(request))
+
+    def _send(self, url, params):
+        if self.cassette is None:
+            return self.session.get(url, params=params)
+        if self.cassette.replaying:
+            return self.cassette.play(url, params)
+
+        res = self.session.get(url, params=params)
+        self.cassette.record(url, params, res)
+        return res
 
     @property
     def baseurl(self):
@@ -90,16 +129,25 @@ class AbstractResolver(ABC):  # pragma: no cover
         raise NotImplementedError()
 
     def resolve(self, issue):
+        name = self.__class__.__name__
         url = self.build_request_url(issue.project_id, issue.issue_id)
-        res = self.fetch(url)
-        self.process(issue, res)
+        with span(f"{name}.fetch", project=issue.project_id, issue=issue.issue_id):
+            res = self.fetch(url)
+        with span(f"{name}.process", project=issue.project_id, issue=issue.issue_id):
+            self.process(issue, res)
 
     def fetch(self, url):
+        return self._get(url).json()
+
+    def fetch_content(self, url):
+        """The body of the response as bytes, to be parsed elsewhere, e.g. in a worker process."""
+        return self._get(url).content
+
+    def _get(self, url):
         r = self.session.get(url)
         if self._raise_for_status:
             r.raise_for_status()
-        payload = r.json()
-        return payload
+        return r
 
 
 class HistoryResolver(AbstractResolver):
@@ -128,7 +176,7 @@ class GitlabIssuesRepository(AbstractRepository):
     """
 
     # XXX rename to reflect group requirement? or, explore using python-gitlab package.
-    def __init__(self, session, group=None, resolvers=None):
+    def __init__(self, session, group=None, resolvers=None, processes=None):
         """Initialize a repository.
 
         Required:
@@ -137,48 +185,88 @@ class GitlabIssuesRepository(AbstractRepository):
 
         Optional:
         resolvers: Specify classes to use to resolve additional fields.
+        processes: Parse the resolver responses and build the histories in a pool of this many
+                   processes, a page at a time, while threads keep fetching. Default in this process.
         """
 
         if not group:
             raise ValueError("Requires group")
 
+        if processes is not None and processes < 1:
+            raise ValueError("processes must be at least 1")
+
         self._session = session
         self._group = group
         self._resolvers = resolvers
+        self._processes = processes
         self._url = self._build_request_url()
 
     @property
     def url(self):
         return self._url
 
+    @property
+    def processes(self):
+        return self._processes
+
     def list(self, **kwargs):
         """Return issues from the repository.
         milestone: milestone name or id
         state: issue state filter, e.g. 'closed'
         """
+        if self._processes:
+            return self.list_table(**kwargs).to_issues()
         return [x for x in self._page_results(**kwargs)]
 
-    def _build_request_url(self):
-        return "groups/{0}/issues".format(self._group)
+    def list_table(self, **kwargs):
+        """Return the histories of the issues as a HistoryTable, parsed in a pool of processes.
 
-    def _page_results(self, **kwargs):
-        """Generator of issues from pages of results."""
+        Threads fetch the responses of every page, the workers parse them into a HistoryTable per page,
+        so only arrays come back. Takes the list kwargs.
+        """
+        from .histories import HistoryTable
+
+        resolvers = self._resolvers or []
+        futures = []
+        with ProcessPoolExecutor(max_workers=self._processes or 1) as pool:
+            for items, contents in self._page_contents(**kwargs):
+                futures.append(pool.submit(parse_page, items, contents, resolvers))
+            with span("Parse pages", pages=len(futures)):
+                tables = [f.result() for f in futures]
+        return HistoryTable.concat(tables)
+
+    def estimate(self, **kwargs):
+        """Return a CostEstimate of listing the issues, see the estimate module. Takes the list kwargs."""
+        from .estimate import estimate_cost
+
+        # offset pagination, unlike keyset, reports the total in the X-Total header
+        params = [p for p in self._list_params(**kwargs) if p[0] != "pagination"]
+        return estimate_cost(self._session, self.url, sorted(params), self._resolvers or [], workers=MAX_WORKERS)
+
+    def _list_params(self, **kwargs):
         params = [("pagination", "keyset"), ("scope", "all")]
         params += [(k, v) for k, v in kwargs.items()]
+        return params
+
+    def _build_request_url(self):
+        return "groups/{0}/issues".format(self._group)
+
+    def _pages(self, **kwargs):
+        """Generator of the issue items of every page of results."""
+        params = self._list_params(**kwargs)
         url = self.url
 
+        page = 0
         hasMore = True
         while hasMore:
-            r1 = self._session.get(url, params=sorted(params))
-            r1.raise_for_status()
-
-            # extract the issues from the response body
-            payload = r1.json()
-            # count = len(payload)
-            # print(f'processing {count} items');
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                for issue in executor.map(self._build_issue_from, payload):
-                    yield issue
+            page += 1
+            with span("Fetch issues page", page=page):
+                r1 = self._session.get(url, params=sorted(params))
+                r1.raise_for_status()
+
+                # extract the issues from the response body
+                payload = r1.json()
+            yield payload
 
             if r1.links and "next" in r1.links:
                 # setup next page request
@@ -188,26 +276,83 @@ class GitlabIssuesRepository(AbstractRepository):
             else:
                 hasMore = False
 
+    def _page_results(self, **kwargs):
+        """Generator of issues from pages of results."""
+        for payload in self._pages(**kwargs):
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                for issue in executor.map(self._build_issue_from, payload):
+                    yield issue
+
+    def _page_contents(self, **kwargs):
+        """Generator of the issue items of every page, with the response bodies of their resolvers."""
+        for payload in self._pages(**kwargs):
+            items = [{k: item[k] for k in ISSUE_FIELDS if k in item} for item in payload]
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                contents = list(executor.map(self._fetch_contents, items))
+            yield items, contents
+
+    def _fetch_contents(self, item):
+        contents = []
+        for resolver_cls in self._resolvers or []:
+            resolver = resolver_cls(self._session)
+            url = resolver.build_request_url(item["project_id"], item["iid"])
+            with span(f"{resolver_cls.__name__}.fetch", project=item["project_id"], issue=item["iid"]):
+                contents.append(resolver.fetch_content(url))
+        return contents
+
     def _build_issue_from(self, item):
-        # print('creating Issue from item', json.dumps(item))
-        issue_id = item["iid"]
-        project_id = item["project_id"]
-        opened_at = date_parser.parse(item["created_at"])
-        closed_at = date_parser.parse(item["closed_at"]) if "closed_at" in item else None
-        issue_type = self._find_type_label(item)
-        issue = Issue(issue_id, project_id, opened_at, issue_type=issue_type, closed_at=closed_at)
+        issue = _issue_from(item)
         if self._resolvers:
             self._resolve_fields(issue)
         return issue
 
-    def _find_type_label(self, item):
-        type_labels = [t.lstrip("type::") for t in item.get("labels", []) if t.startswith("type::")][:1]
-        return type_labels[0] if type_labels else None
-
     def _resolve_fields(self, issue):
-        for resolver_cls in self._resolvers:
-            resolver = resolver_cls(self._session)
-            resolver.resolve(issue)
+        with span("Resolve issue", project=issue.project_id, issue=issue.issue_id):
+            for resolver_cls in self._resolvers:
+                resolver = resolver_cls(self._session)
+                resolver.resolve(issue)
+
+
+# fields of an issue item the issues are built from
+ISSUE_FIELDS = ["iid", "project_id", "created_at", "closed_at", "labels"]
+
+
+def _issue_from(item):
+    # print('creating Issue from item', json.dumps(item))
+    issue_id = item["iid"]
+    project_id = item["project_id"]
+    opened_at = date_parser.parse(item["created_at"])
+    closed_at = date_parser.parse(item["closed_at"]) if "closed_at" in item else None
+    issue_type = _find_type_label(item)
+    return Issue(issue_id, project_id, opened_at, issue_type=issue_type, closed_at=closed_at)
+
+
+def _find_type_label(item):
+    type_labels = [t.lstrip("type::") for t in item.get("labels", []) if t.startswith("type::")][:1]
+    return type_labels[0] if type_labels else None
+
+
+def parse_page(items, contents, resolvers):
+    """Build the issues of a page and return their histories as a HistoryTable.
+
+    Runs in the worker processes of GitlabIssuesRepository.list_table, so only arrays are sent back.
+
+    args:
+    items issue items of the page
+    contents for every item, the response bodies of the resolvers in order
+    resolvers resolver classes processing the bodies
+    """
+    from .histories import HistoryTable
+
+    issues = []
+    for item, bodies in zip(items, contents):
+        issue = _issue_from(item)
+        for resolver_cls, body in zip(resolvers, bodies):
+            resolver = resolver_cls(None)
+            with span(f"{resolver_cls.__name__}.process", project=issue.project_id, issue=issue.issue_id):
+                resolver.process(issue, json.loads(body))
+        issues.append(issue)
+    return HistoryTable.from_issues(issues)
 
 
 class GitlabScopedLabelResolver(HistoryResolver):
@@ -351,6 +496,13 @@ class Issue(object):
         self._issue_type = issue_type
         self._history = History(opened_at, closed_at)
 
+    @classmethod
+    def from_history(cls, issue_id, project_id, events, issue_type=None):
+        """An issue with a history of events already in order and with their end dates, see History.from_events."""
+        issue = cls(issue_id, project_id, events[0][1], issue_type=issue_type)
+        issue._history = History.from_events(events)
+        return issue
+
     @property
     def issue_id(self):
         return self._issue_id
@@ -396,6 +548,13 @@ class History(Sequence):
             events.append(("closed", closed_at, None))
         self._build_history(events)
 
+    @classmethod
+    def from_events(cls, events):
+        """A history of events already in order and with their end dates, e.g. rebuilt from a HistoryTable."""
+        history = cls.__new__(cls)
+        history._history = list(events)
+        return history
+
     def _build_history(self, events):
         ordered_events = sorted(events, key=itemgetter(1))
         assert ordered_events[0][0] == "opened"
@@ -5,14 +5,56 @@ import numpy as np
 
 from functools import partial, reduce
 
+from .histories import HistoryIntervals, HistoryTable
+from .issues import Issue
+from .utils import span
+
 _log = logging.getLogger(__name__)
 
 
 def build_transitions(issues):
-    """Create a list of transitions from a list of issues."""
+    """Create a list of transitions from a list of issues, or a HistoryTable of their histories."""
+    if isinstance(issues, HistoryTable):
+        issues = issues.to_issues()
     return [IssueStageTransitions(i) for i in issues]
 
 
+def aggregate_in_processes(table, aggregations, workers=None):
+    """Compute aggregations of the same issues side by side in a pool of processes.
+
+    The records of the table are published once in shared memory. The workers attach to them by a
+    small descriptor instead of receiving pickled issues, only the resulting DataFrames come back.
+
+    The aggregations that take a HistoryTable, e.g. CumulativeFlow, LeadCycleTimes, TimeInStage or
+    StageTransitionMatrix, compute over the shared records without rebuilding the issues.
+
+    args:
+    table HistoryTable of the issues
+    aggregations list of (aggregation class, kwargs) tuples, e.g. (CumulativeFlow, dict(days=30)),
+                 every class takes the table as its first argument
+
+    kwargs:
+    workers size of the process pool, default the number of CPUs
+
+    Returns the DataFrame of every aggregation, in order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # the pool is shut down before the shared memory is freed
+    with table.share() as shared, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_aggregate_shared, shared.descriptor, cls, kwargs) for cls, kwargs in aggregations]
+        return [f.result() for f in futures]
+
+
+def _aggregate_shared(descriptor, aggregation_cls, kwargs):
+    table = HistoryTable.attach(descriptor)
+    try:
+        # a copy, so nothing sent back views the shared memory
+        return aggregation_cls(table, **kwargs).get_data_frame().copy()
+    finally:
+        table.close()
+
+
 class IssueStageTransitions:
     """Creates a DataFrame holding all stages of a single Issue through a workflow.
 
@@ -94,19 +136,21 @@ class CumulativeFlow(object):
         days=30,
         end_date=None,
         start_date=None,
+        group_by=None,
         *args,
         **kwargs,
     ):
         """Groups stages of workflow by date.
 
         args:
-        stage_transitions list of Stages objects
+        transitions list of IssueStageTransitions, or a HistoryTable of the issue histories
 
         kwargs:
         stages list of stages to include in the report
         days number of days to include in the report, default 30
         end_date provide a specific end date, default today()
         start_date provide a specific start date, default 30 days before end_date (inclusive)
+        group_by list of transition columns, e.g. ["type"] or ["project"], to break the counts down by
         """
         self._index_daterange = _calculate_date_range(days, start_date, end_date)
         self._labels = stages
@@ -114,7 +158,37 @@ class CumulativeFlow(object):
         cats = pd.Series(pd.Categorical(self._labels, categories=self._labels, ordered=True))
 
         df = pd.DataFrame([], index=self._index_daterange, columns=cats)
-        self._data = reduce(combine_by_totals, [a.data for a in transitions], df)
+        if group_by or isinstance(transitions, HistoryTable):
+            # the daily deltas come from the records of a table directly, no issues are rebuilt
+            self._data = self._count_from_deltas(transitions, group_by, df)
+        else:
+            self._data = reduce(combine_by_totals, [a.data for a in transitions], df)
+
+    def _count_from_deltas(self, transitions, group_by, df):
+        """Counts indexed by date, and each dimension of group_by, from one pass over all transitions."""
+        deltas = daily_stage_deltas(transitions, self._labels, by=group_by)
+        if deltas.empty:
+            if not group_by:
+                return df
+            deltas.columns = df.columns
+            return deltas
+
+        index = self._index_daterange
+        start = min(deltas.index.get_level_values("datetime").min(), index[0])
+        history = pd.date_range(start=start, end=max(index[-1], start), freq="D", name="datetime", tz="UTC")
+
+        if group_by:
+            # stack drops missing labels of several column levels, e.g. the issues without a type
+            missing = object()
+            deltas = deltas.rename(index=lambda x: missing if pd.isna(x) else x, level=None)
+            counts = deltas.unstack(group_by).reindex(history, fill_value=0).fillna(0).cumsum()
+            counts = counts.reindex(index, method="ffill").fillna(0).stack(group_by)
+            counts = counts.rename(index=lambda x: None if x is missing else x)
+        else:
+            counts = deltas.reindex(history, fill_value=0).cumsum().reindex(index, method="ffill").fillna(0)
+        counts = counts.reindex(columns=self._labels)
+        counts.columns = df.columns
+        return counts
 
     @property
     def included_dates(self):
@@ -160,16 +234,19 @@ def dt_index_shift(r):
 
 
 def combine_by_totals(d1, d2):
+    with span("combine_by_totals"):
+        return _combine_by_totals(d1, d2)
+
+
+def _combine_by_totals(d1, d2):
     d2 = d2.reindex(columns=d1.columns)
     shift_dt_index = d2.groupby(pd.Grouper(freq="1D")).apply(dt_index_shift)
     dt_to_shift = [dt for dt in shift_dt_index if dt is not pd.NaT]
-    for dt in dt_to_shift:
-        # use numpy datetime64 object to sort these "raw" indices
-        dt64 = dt.to_numpy()
-        new_index_dt64 = (dt.normalize() + pd.Timedelta("1D")).to_numpy()
-        old_indices_dt64 = np.where(d2.index.values == dt64)[0]
-        for old_index in old_indices_dt64:
-            d2.index.values[old_index] = new_index_dt64
+    if dt_to_shift:
+        # assign a new index rather than writing into index.values, the index is shared with the
+        # caller's transitions and must not change between aggregations
+        to_shift = d2.index.isin(dt_to_shift)
+        d2.index = d2.index.where(~to_shift, d2.index.normalize() + pd.Timedelta("1D"))
 
     d2 = d2.resample("1D").last()
     d2 = d2.fillna(method="ffill")
@@ -177,11 +254,310 @@ def combine_by_totals(d1, d2):
     return d1.combine(d2, np.add, fill_value=0)
 
 
+def daily_stage_deltas(transitions, stages, by=None):
+    """Net change of every stage per day, summed over all transitions in a single pass.
+
+    Applies the same end of day shifting as `combine_by_totals`, so the running sum of the
+    deltas over days is the count of items in each stage at the end of that day.
+
+    When `by` names transition columns, e.g. ["type"], the deltas are also indexed by them.
+    The transitions may also be a HistoryTable, its records give the same deltas without building
+    the IssueStageTransitions of every issue.
+
+    Example:
+                               opened  todo  done
+    datetime
+    2021-03-14 00:00:00+00:00     2.0   0.0   0.0
+    2021-03-15 00:00:00+00:00    -1.0   1.0   0.0
+    2021-03-16 00:00:00+00:00     0.0  -1.0   1.0
+    """
+    by = list(by or [])
+    if isinstance(transitions, HistoryTable):
+        if not len(transitions):
+            return _empty_deltas(stages, by)
+        key, dt, values, dimensions = _table_events(transitions, stages, by)
+    else:
+        frames = [t.data for t in transitions]
+        if not frames:
+            return _empty_deltas(stages, by)
+
+        events = pd.concat(frames, keys=range(len(frames)), names=["key", "datetime"])
+        key = events.index.get_level_values("key")
+        dt = events.index.get_level_values("datetime")
+        # dateutil parses GitLab's "Z" timestamps as tzlocal() on a UTC host, the days are always UTC days
+        if dt.tz is not None:
+            dt = dt.tz_convert("UTC")
+        values = events.reindex(columns=stages).reset_index(drop=True)
+        dimensions = events[by].reset_index(drop=True)
+
+    # see dt_index_shift, the last event of the day moves to midnight when it leaves every stage
+    day = dt.floor("D")
+    by_day = [key, day]
+    complete = values.notna().all(axis=1).groupby(by_day).transform("any")
+    last_sum = values.sum(axis=1).groupby(by_day).transform("last")
+    is_last = pd.Series(dt, index=values.index).groupby(by_day).transform("max") == dt
+    shift = (complete & is_last & (last_sum == 0)).to_numpy()
+    dt = dt.where(~shift, day + pd.Timedelta("1D"))
+
+    order = np.lexsort((dt.asi8, key.to_numpy()))
+    values = values.iloc[order].set_axis(pd.MultiIndex.from_arrays([key[order], dt[order].floor("D")]), axis=0)
+    values.index.names = ["key", "datetime"]
+
+    # state at the end of each day the item changed, then the change from the previous such day
+    daily = values.groupby(level=["key", "datetime"]).last()
+    daily = daily.groupby(level="key").ffill().fillna(0)
+    deltas = daily.groupby(level="key").diff().fillna(daily)
+    if not by:
+        return deltas.groupby(level="datetime").sum().reindex(columns=stages)
+
+    dimensions = dimensions.groupby(key).first()
+    deltas = deltas.join(dimensions, on="key")
+    return deltas.groupby(["datetime"] + by, dropna=False)[stages].sum()
+
+
+def _empty_deltas(stages, by):
+    index = pd.DatetimeIndex([], name="datetime", tz="UTC")
+    if by:
+        index = pd.MultiIndex.from_arrays([index] + [[] for _ in by], names=["datetime"] + by)
+    return pd.DataFrame([], index=index, columns=stages, dtype=float)
+
+
+def _table_events(table, stages, by):
+    """The rows of the IssueStageTransitions of every issue, computed over the records of a HistoryTable.
+
+    Returns the issue key and the datetime of every row, a DataFrame of the stage values of the rows
+    and a DataFrame of their by columns, as daily_stage_deltas takes them from the transitions.
+    """
+    r = table.records
+    keys = table.issue_keys()
+    heads = np.flatnonzero(np.diff(keys, prepend=-1))
+
+    # a start entry for every record and an end entry for the records with an end, in the order
+    # IssueStageTransitions writes them
+    entry_key = np.repeat(keys, 2)
+    entry_dt = np.empty(2 * len(r), dtype="M8[ns]")
+    entry_dt[0::2] = r["start"]
+    entry_dt[1::2] = r["end"]
+    entry_stage = np.repeat(r["stage"], 2)
+    entry_value = np.tile([1.0, 0.0], len(r))
+    written = ~np.isnat(entry_dt)
+    entry_key, entry_dt, entry_stage, entry_value = (
+        x[written] for x in (entry_key, entry_dt, entry_stage, entry_value)
+    )
+
+    # a row for every distinct datetime of an issue, in the order the datetimes first appear
+    order = np.lexsort((entry_dt.view(np.int64), entry_key))
+    starts_group = np.ones(len(order), dtype=bool)
+    starts_group[1:] = (entry_key[order][1:] != entry_key[order][:-1]) | (entry_dt[order][1:] != entry_dt[order][:-1])
+    group = np.empty(len(order), dtype=np.int64)
+    group[order] = np.cumsum(starts_group) - 1
+    first_entry = np.sort(order[starts_group])
+    row_of_group = np.empty(len(first_entry), dtype=np.int64)
+    row_of_group[group[first_entry]] = np.arange(len(first_entry))
+    row = row_of_group[group]
+
+    # the value of a stage in a row is the one written last
+    columns = np.array([stages.index(x) if x in stages else -1 for x in table.stages], dtype=np.int64)[entry_stage]
+    included = columns >= 0
+    cells = (row * len(stages) + columns)[included][::-1]
+    cell_values = entry_value[included][::-1]
+    cells, last = np.unique(cells, return_index=True)
+    matrix = np.full(len(first_entry) * len(stages), np.nan)
+    matrix[cells] = cell_values[last]
+    values = pd.DataFrame(matrix.reshape(len(first_entry), len(stages)), columns=stages)
+
+    row_keys = entry_key[first_entry]
+    dimensions = {
+        "project": r["project"][heads],
+        "id": r["issue"][heads],
+        "type": np.array(table.types + [None], dtype=object)[r["type"][heads]],
+    }
+    dimensions = pd.DataFrame({name: dimensions[name][row_keys] for name in by})
+    dt = pd.DatetimeIndex(entry_dt[first_entry]).tz_localize("UTC")
+    return pd.Index(row_keys), dt, values, dimensions
+
+
+class CumulativeFlowIndex:
+    """Daily count of items per stage over the whole history of a set of transitions.
+
+    The counts are the running sum of `daily_stage_deltas`, built once. Any date range or
+    weekly/monthly rollup is then sliced from the index without touching the transitions again.
+    """
+
+    def __init__(self, transitions, stages=["opened", "closed"], end_date=None, *args, **kwargs):
+        """Build the index.
+
+        args:
+        transitions list of IssueStageTransitions objects
+
+        kwargs:
+        stages list of stages to include in the index
+        end_date last date of the index, default today()
+        """
+        if end_date and not isinstance(end_date, datetime.date):
+            raise ValueError("end_date must be datetime.date")
+
+        if hasattr(end_date, "date"):
+            end_date = end_date.date()
+
+        end_date = end_date if end_date else datetime.datetime.now(datetime.timezone.utc).date()
+        end = pd.Timestamp(end_date, tz="UTC")
+
+        deltas = daily_stage_deltas(transitions, stages)
+        start = min(deltas.index.min(), end) if not deltas.empty else end
+
+        index = pd.date_range(start=start, end=end, freq="D", name="datetime", tz="UTC")
+        counts = deltas.loc[:end].reindex(index, fill_value=0).cumsum()
+        counts.columns = pd.CategoricalIndex(stages, categories=stages, ordered=True)
+        self._data = counts
+
+    @classmethod
+    def load(cls, file):
+        """Load an index previously written by `save`."""
+        df = pd.read_csv(file, index_col="datetime", parse_dates=["datetime"])
+        df.index = df.index.tz_localize("UTC")
+        df.index.freq = "D"
+        stages = list(df.columns)
+        df.columns = pd.CategoricalIndex(stages, categories=stages, ordered=True)
+
+        index = cls.__new__(cls)
+        index._data = df.astype(float)
+        return index
+
+    def save(self, file):
+        """Write the daily counts to a file path or open file buffer."""
+        self._data.to_csv(file, date_format="%Y-%m-%d")
+
+    @property
+    def included_dates(self):
+        """The dates held by this index."""
+        return self._data.index
+
+    def get_data_frame(self):
+        """The daily counts for the whole history."""
+        return self._data
+
+    def window(self, days=30, start_date=None, end_date=None):
+        """Slice the daily counts for a date range, accepts the same arguments as `CumulativeFlow`.
+
+        Days before the history are empty, days after it carry the last known counts forward.
+        """
+        index = _calculate_date_range(days, start_date, end_date)
+        return self._data.reindex(index, method="ffill").fillna(0)
+
+    def rollup(self, freq="W", days=30, start_date=None, end_date=None):
+        """Counts at the end of every period, e.g. "W" for weekly or "M" for monthly, within a date range."""
+        return self.window(days, start_date, end_date).resample(freq).last()
+
+
+class IncrementalCumulativeFlow:
+    """Cumulative flow kept current one stage event at a time.
+
+    Every issue contributes its own `daily_stage_deltas`. When an event arrives only that issue's
+    history is rebuilt and the change in its contribution is applied to the daily totals, so a
+    long running process never recomputes the flow over every issue.
+    """
+
+    ACTIONS = ["open", "add", "remove", "close", "reopen"]
+
+    def __init__(self, stages=["opened", "closed"], days=30, end_date=None, start_date=None, *args, **kwargs):
+        """Start an empty flow.
+
+        kwargs:
+        stages list of stages to include in the report
+        days number of days to include in the report, default 30
+        end_date provide a specific end date, default today()
+        start_date provide a specific start date, default 30 days before end_date (inclusive)
+        """
+        # validate the date range now, it is recalculated for each report
+        _calculate_date_range(days, start_date, end_date)
+        self._days = days
+        self._start_date = start_date
+        self._end_date = end_date
+        self._labels = stages
+        self._issues = {}
+        self._deltas = daily_stage_deltas([], stages)
+
+    @property
+    def included_dates(self):
+        """The dates included in this report."""
+        return _calculate_date_range(self._days, self._start_date, self._end_date)
+
+    def add_issue(self, issue):
+        """Track an already resolved issue, replacing any previous state of the same issue."""
+        self._update(
+            (issue.project_id, issue.issue_id),
+            dict(opened_at=issue.opened_at, issue_type=issue.issue_type, events=list(issue.history[1:])),
+        )
+
+    def apply(self, project_id, issue_id, action, dt, stage=None, issue_type=None):
+        """Apply a single event to an issue.
+
+        args:
+        project_id, issue_id identify the issue
+        action one of "open", "add", "remove", "close" or "reopen"
+        dt datetime of the event
+        stage the scoped label name for "add" and "remove" actions
+        issue_type type of a newly opened issue
+        """
+        if action not in self.ACTIONS:
+            raise ValueError(f"action must be one of {self.ACTIONS}")
+
+        key = (project_id, issue_id)
+        if action == "open":
+            self._update(key, dict(opened_at=dt, issue_type=issue_type, events=[]))
+            return
+
+        if key not in self._issues:
+            raise ValueError(f"Issue #{issue_id} in Project #{project_id} must be opened first")
+
+        state = self._issues[key]
+        events = list(state["events"])
+        if action == "add":
+            events.append((stage, dt, None))
+        elif action == "remove":
+            # same as GitlabScopedLabelResolver, ends the first open occurrence of the label
+            for i, x in enumerate(events):
+                if x[0] == stage and x[2] is None:
+                    events[i] = (x[0], x[1], dt)
+                    break
+        else:
+            events.append(("closed" if action == "close" else "reopened", dt, None))
+
+        self._update(key, dict(state, events=events))
+
+    def _update(self, key, state):
+        issue = Issue(key[1], key[0], state["opened_at"], issue_type=state["issue_type"])
+        try:
+            issue.history.add_events(state["events"])
+        except AssertionError:
+            _log.warning(f"Unable to apply events on Issue #{key[1]} in Project #{key[0]}")
+            return
+
+        transitions = IssueStageTransitions(issue)
+        deltas = daily_stage_deltas([transitions], self._labels)
+        if key in self._issues:
+            deltas = deltas.sub(daily_stage_deltas([self._issues[key]["transitions"]], self._labels), fill_value=0)
+
+        self._deltas = self._deltas.add(deltas, fill_value=0).sort_index()
+        self._issues[key] = dict(state, transitions=transitions)
+
+    def get_data_frame(self):
+        """Build a DataFrame of the current counts for the report dates."""
+        counts = self._deltas.cumsum().reindex(self.included_dates, method="ffill").fillna(0)
+        counts.columns = pd.CategoricalIndex(self._labels, categories=self._labels, ordered=True)
+        return counts
+
+
 class LeadCycleTimes:
     """Calculations for a scatter plot diagram."""
 
     def __init__(self, issues, wip=None, stages=None, *args, **kwargs):
-        """Generate lead & cycle time values from issue histories."""
+        """Generate lead & cycle time values from issue histories.
+
+        args:
+        issues list of closed issues, or a HistoryTable of their histories, computed over its records
+        """
         # we could generate a business day range by passing freq='B' into date_range calculation.
         self.stages = stages or ["opened", "closed"]
         self.opened = self.stages[0]
@@ -189,13 +565,15 @@ class LeadCycleTimes:
         self.wip = wip
         self.closed = self.stages[-1]
 
-        records = self._build_records_from_issues(issues)
         # TODO have output print all columns, with ordered stages
         columns = (
             ["issue", "project", "type"] + stages + ["last_closed", "wip_event", "wip", "reopened", "lead", "cycle"]
         )
-
-        df = pd.DataFrame.from_records(records, columns=columns)
+        if isinstance(issues, HistoryTable):
+            df = self._build_frame_from_table(issues).reindex(columns=columns)
+        else:
+            records = self._build_records_from_issues(issues)
+            df = pd.DataFrame.from_records(records, columns=columns)
 
         # for leadtime: from opened to last closed event
         df["lead"] = [
@@ -219,6 +597,51 @@ class LeadCycleTimes:
         # print("Data", self._data)
         return self._data
 
+    def _build_frame_from_table(self, table):
+        """The columns of _build_records_from_issues computed over the records of a HistoryTable."""
+        r = table.records
+        keys = table.issue_keys()
+        count = table.count_issues()
+        codes = {x: i for i, x in enumerate(table.stages)}
+        stage = r["stage"]
+        start = r["start"]
+        heads = np.flatnonzero(np.diff(keys, prepend=-1)) if len(keys) else np.zeros(0, dtype=int)
+
+        def first(name, last=False):
+            return _first_per_issue(keys, stage == codes.get(name, -1), start, count, last=last)
+
+        columns = {
+            "issue": r["issue"][heads],
+            "project": r["project"][heads],
+            "type": np.array(table.types + [None], dtype=object)[r["type"][heads]],
+        }
+        # first occurrences of every stage
+        columns.update({name: first(name) for name in self.stages})
+        columns["last_closed"] = first(self.closed, last=True)
+        missing = np.flatnonzero(np.isnat(columns[self.closed]))
+        if len(missing):
+            issue = (columns["issue"][missing[0]], columns["project"][missing[0]])
+            raise KeyError(f"{self.closed} missing from Issue #{issue[0]} in Project #{issue[1]}")
+
+        # the first work after opening and before closing, see _find_nearest_available_work
+        labels = self.stages[self.stages.index(self.wip) : -1] + ["merge_request"]
+        opened, closed = columns[self.opened], columns[self.closed]
+        work = np.isin(stage, [codes[x] for x in labels if x in codes])
+        work &= (start > opened[keys]) & (start < closed[keys])
+        wip_code = _first_per_issue(keys, work, stage.astype(np.int64), count)
+        wip = _first_per_issue(keys, work, start, count)
+        names = np.array(table.stages + [self.closed], dtype=object)
+        columns["wip_event"] = names[wip_code]
+        columns["wip"] = np.where(np.isnat(wip), closed, wip)
+        columns["reopened"] = np.bincount(keys[stage == codes.get("reopened", -1)], minlength=count)
+
+        for name in self.stages + ["last_closed", "wip"]:
+            # as from_records infers it, a stage no issue reached has no datetimes
+            all_missing = name in self.stages and np.isnat(columns[name]).all()
+            utc = np.full(count, np.nan) if all_missing else pd.DatetimeIndex(columns[name]).tz_localize("UTC")
+            columns[name] = utc
+        return pd.DataFrame(columns)
+
     def _build_records_from_issues(self, issues):
         records = []
         for issue in issues:
@@ -275,3 +698,410 @@ class LeadCycleTimes:
         except StopIteration:
             # closed without detected work, should set wip to closed date
             return self.closed, closed_date
+
+
+def _first_per_issue(keys, selected, values, count, last=False):
+    """The value of the first, or last, selected record of every issue, NaT or -1 for the issues without one."""
+    result = np.full(count, np.datetime64("NaT") if values.dtype.kind == "M" else -1, dtype=values.dtype)
+    positions = np.flatnonzero(selected)
+    if last:
+        positions = positions[::-1]
+    issue_keys, first = np.unique(keys[positions], return_index=True)
+    result[issue_keys] = values[positions[first]]
+    return result
+
+
+class CycleTimeSketches:
+    """Mergeable histograms of cycle times per issue type and closing period.
+
+    Cycle times are whole business days, so a histogram of counts per day is an exact sketch:
+    merging shards adds the counts, and quantiles over any range of periods are computed from the
+    summed counts without keeping the issues around.
+    """
+
+    def __init__(self, freq="M", wip=None, stages=None, *args, **kwargs):
+        """Create empty sketches.
+
+        kwargs:
+        freq period of the closing date to sketch by, e.g. "W", "M", "Q"
+        wip work in progress stage, as for `LeadCycleTimes`
+        stages list of stages, as for `LeadCycleTimes`
+        """
+        self.freq = freq
+        self.wip = wip
+        self.stages = stages
+        self._counts = {}
+
+    def update(self, issues):
+        """Add the cycle times of the closed issues, a list or a HistoryTable, calculated as `LeadCycleTimes` does.
+
+        The cycle times come from the records of the table, so memory-mapped partitions of an
+        EventArchive are sketched without rebuilding their issues.
+        """
+        table = issues if isinstance(issues, HistoryTable) else HistoryTable.from_issues(issues)
+        closed = table.closed(stage=(self.stages or ["opened", "closed"])[-1])
+        if not len(closed):
+            return self
+
+        df = LeadCycleTimes(closed, wip=self.wip, stages=self.stages).get_data_frame()
+        closed_at = pd.to_datetime(df[self.stages[-1]], utc=True).dt.tz_localize(None)
+        periods = closed_at.dt.to_period(self.freq)
+        types = df["type"].astype(object).where(df["type"].notna(), None)
+        for (issue_type, period), cycles in df["cycle"].groupby([types, periods], dropna=False, sort=False):
+            self._add((issue_type, period), np.bincount(cycles.to_numpy(dtype=np.int64)))
+        return self
+
+    def merge(self, other):
+        """Add the counts of another set of sketches, e.g. a shard built by a parallel worker."""
+        if other.freq != self.freq:
+            raise ValueError(f"Cannot merge sketches by {other.freq} into sketches by {self.freq}")
+        for key, counts in other._counts.items():
+            self._add(key, counts)
+        return self
+
+    def _add(self, key, counts):
+        # grouping turns a missing type into NaN, sketches keep None like the issues do
+        issue_type, period = key
+        key = (None if pd.isna(issue_type) else issue_type, period)
+        current = self._counts.get(key, np.zeros(0, dtype=np.int64))
+        if len(current) < len(counts):
+            current = np.pad(current, (0, len(counts) - len(current)))
+        current[: len(counts)] += counts
+        self._counts[key] = current
+
+    @property
+    def periods(self):
+        """The sorted periods holding cycle times."""
+        return sorted({period for _, period in self._counts})
+
+    @property
+    def types(self):
+        return sorted({t for t, _ in self._counts}, key=_type_order)
+
+    def count(self):
+        """Number of cycle times sketched."""
+        return int(sum(c.sum() for c in self._counts.values()))
+
+    def quantiles(self, q=[0.5, 0.85, 0.95], start=None, end=None):
+        """Cycle time quantiles per type over the periods from start to end, inclusive.
+
+        The quantiles interpolate linearly between business days, matching `Series.quantile`
+        over the same cycle times.
+
+        kwargs:
+        q list of quantiles
+        start first period, default the first sketched period
+        end last period, default the last sketched period
+        """
+        start = pd.Period(start, freq=self.freq) if start is not None else None
+        end = pd.Period(end, freq=self.freq) if end is not None else None
+
+        totals = {}
+        for (issue_type, period), counts in sorted(self._counts.items(), key=lambda x: _type_order(x[0][0])):
+            if (start is None or period >= start) and (end is None or period <= end):
+                total = totals.get(issue_type, np.zeros(0, dtype=np.int64))
+                size = max(len(total), len(counts))
+                totals[issue_type] = np.pad(total, (0, size - len(total))) + np.pad(counts, (0, size - len(counts)))
+
+        columns = ["count"] + [f"p{round(x * 100)}" for x in q]
+        rows = [[int(c.sum())] + list(_histogram_quantiles(c, q)) for c in totals.values()]
+        return pd.DataFrame(rows, index=pd.Index(list(totals.keys()), name="type", dtype=object), columns=columns)
+
+    def rolling(self, periods=3, q=[0.5, 0.85, 0.95]):
+        """Cycle time quantiles per type over a trailing window of periods, at the end of every period."""
+        frames = []
+        for period in pd.period_range(self.periods[0], self.periods[-1], freq=self.freq) if self._counts else []:
+            df = self.quantiles(q, start=period - (periods - 1), end=period)
+            df.insert(0, "period", period)
+            frames.append(df.reset_index())
+        columns = ["period", "type", "count"] + [f"p{round(x * 100)}" for x in q]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        return df.set_index(["period", "type"])
+
+    def get_data_frame(self):
+        """Cycle time quantiles per type for every period on its own."""
+        return self.rolling(periods=1)
+
+    def save(self, file):
+        """Write the histograms to a file path or open file buffer."""
+        rows = [
+            (issue_type, str(period), days, count)
+            for (issue_type, period), counts in self._counts.items()
+            for days, count in enumerate(counts)
+            if count
+        ]
+        df = pd.DataFrame.from_records(rows, columns=["type", "period", "cycle", "count"])
+        df.to_csv(file, index=False)
+
+    @classmethod
+    def load(cls, file, freq="M", wip=None, stages=None):
+        """Load histograms previously written by `save`, sketched by the same freq."""
+        df = pd.read_csv(file, dtype={"type": object, "period": str})
+        sketches = cls(freq=freq, wip=wip, stages=stages)
+        types = df["type"].where(df["type"].notna(), None)
+        for (issue_type, period), rows in df.groupby([types, df["period"]], dropna=False, sort=False):
+            counts = np.zeros(rows["cycle"].max() + 1, dtype=np.int64)
+            counts[rows["cycle"].to_numpy()] = rows["count"].to_numpy()
+            sketches._add((issue_type, pd.Period(period, freq=freq)), counts)
+        return sketches
+
+
+def _type_order(issue_type):
+    """Sort key of issue types, issues without a type last."""
+    return (issue_type is None, issue_type or "")
+
+
+def _histogram_quantiles(counts, q):
+    """Linearly interpolated quantiles of the values 0..len(counts)-1 occurring counts times."""
+    total = counts.sum()
+    if not total:
+        return [np.nan] * len(q)
+    cumulative = np.cumsum(counts)
+    position = (total - 1) * np.asarray(q, dtype=float)
+    lower = np.floor(position)
+    low = np.searchsorted(cumulative, lower, side="right")
+    high = np.searchsorted(cumulative, np.minimum(lower + 1, total - 1), side="right")
+    return low + (high - low) * (position - lower)
+
+
+class TimeInStage:
+    """Time every issue spent in each workflow stage, summing repeated visits to a stage."""
+
+    def __init__(self, issues, stages=None, wip=None, active=None, unit="days", as_of=None, *args, **kwargs):
+        """Aggregate stage durations from issue histories.
+
+        args:
+        issues list of issues, or a HistoryTable of their histories
+
+        kwargs:
+        stages workflow stages, the last stage ends the workflow and is not measured
+        wip the first stage of active work, used for flow efficiency
+        active list of stages counted as work for flow efficiency, default the stages from wip (or after
+               opened when wip is not given) up to closed
+        unit "days" for business days or "hours" for calendar hours
+        as_of end of stages still in progress, default now()
+        """
+        self.stages = stages or ["opened", "closed"]
+        if unit not in ["days", "hours"]:
+            raise ValueError("unit must be 'days' or 'hours'")
+        self.unit = unit
+        self.measured = self.stages[:-1]
+        if active is None:
+            active = self.stages[self.stages.index(wip) if wip in self.stages else 1 : -1]
+        self.active = [x for x in active if x in self.measured]
+
+        as_of = pd.Timestamp(as_of or datetime.datetime.now(datetime.timezone.utc))
+        as_of = as_of.tz_localize("UTC") if as_of.tzinfo is None else as_of
+
+        table = issues if isinstance(issues, HistoryTable) else HistoryTable.from_issues(issues)
+        events = table.to_frame()
+        issues = events.drop_duplicates("key").set_index("key")[["issue", "project", "type"]]
+        self._durations = self._build_durations(events, issues, as_of)
+        self._data = self._build_matrix(issues)
+
+    def _build_durations(self, events, issues, as_of):
+        events = events[events["stage"].isin(self.measured)]
+        end = events["end"].fillna(as_of)
+        events = events.assign(
+            hours=(end - events["start"]) / pd.Timedelta(hours=1),
+            days=np.busday_count(events["start"].values.astype("datetime64[D]"), end.values.astype("datetime64[D]")),
+            stage=events["stage"].cat.set_categories(self.measured),
+        )
+        durations = events.groupby(["key", "stage"], observed=True).agg(
+            visits=("start", "size"),
+            hours=("hours", "sum"),
+            days=("days", "sum"),
+        )
+        durations = durations.reset_index().join(issues, on="key")
+        return durations[["key", "stage", "issue", "project", "type", "visits", "hours", "days"]]
+
+    def _build_matrix(self, issues):
+        matrix = self._durations.pivot(index="key", columns="stage", values=self.unit)
+        matrix = matrix.reindex(index=issues.index, columns=self.measured).fillna(0)
+        matrix = matrix.astype(int if self.unit == "days" else float)
+
+        hours = self._durations.pivot(index="key", columns="stage", values="hours")
+        hours = hours.reindex(index=issues.index, columns=self.measured).fillna(0)
+        total = hours.sum(axis=1)
+        efficiency = (hours[self.active].sum(axis=1) / total).where(total > 0)
+
+        df = issues.join(matrix).assign(efficiency=efficiency)
+        df.columns = ["issue", "project", "type"] + self.measured + ["efficiency"]
+        return df.reset_index(drop=True)
+
+    @property
+    def durations(self):
+        """One row per issue and visited stage, with the number of visits, calendar hours and business days."""
+        return self._durations
+
+    def get_data_frame(self):
+        """Per issue durations of every stage in the chosen unit, and flow efficiency."""
+        return self._data
+
+    def percentiles(self, q=[0.5, 0.85, 0.95]):
+        """Percentiles of the durations per stage and type, over the issues that visited the stage."""
+        durations = self._durations
+        # issues without a type are kept as their own group, categorical keys would drop them
+        by_type = durations["type"].astype(object)
+        df = durations.groupby(["stage", by_type], observed=True, dropna=False)[self.unit].quantile(q)
+        df = df.unstack()
+        df.columns = [f"p{round(x * 100)}" for x in q]
+        return df
+
+
+class WipAge:
+    """Stage of every open issue at a point in time and how long it has been in that stage."""
+
+    def __init__(self, issues, stages=None, as_of=None, unit="days", *args, **kwargs):
+        """Index the issue histories and take a snapshot of the work in progress.
+
+        args:
+        issues list of issues, or a HistoryTable of their histories
+
+        kwargs:
+        stages workflow stages, issues in the last stage are done and not aged
+        as_of datetime of the snapshot, a date is taken at the end of the day, default now()
+        unit "days" for business days or "hours" for calendar hours
+        """
+        self.stages = stages or ["opened", "closed"]
+        if unit not in ["days", "hours"]:
+            raise ValueError("unit must be 'days' or 'hours'")
+        self.unit = unit
+        self.measured = self.stages[:-1]
+
+        table = issues if isinstance(issues, HistoryTable) else HistoryTable.from_issues(issues)
+        self._intervals = HistoryIntervals(table)
+        self.as_of = self._as_timestamp(as_of)
+        self._items = self.snapshot(self.as_of)
+        self._data = self._summarize(self._items)
+
+    def _as_timestamp(self, as_of):
+        if as_of is None:
+            return pd.Timestamp.now(tz="UTC")
+        if isinstance(as_of, datetime.date) and not isinstance(as_of, datetime.datetime):
+            return pd.Timestamp(as_of, tz="UTC") + pd.Timedelta("1D") - pd.Timedelta(1)
+        as_of = pd.Timestamp(as_of)
+        return as_of.tz_localize("UTC") if as_of.tzinfo is None else as_of
+
+    def snapshot(self, as_of):
+        """Open issues at as_of, with the stage they were in, when they entered it and their age in it."""
+        as_of = self._as_timestamp(as_of)
+        table = self._intervals.table
+        positions = self._intervals.at(as_of)
+        measured = [i for i, x in enumerate(table.stages) if x in self.measured]
+        events = table.to_frame(positions[np.isin(table.records["stage"][positions], measured)])
+        if self.unit == "days":
+            age = np.busday_count(events["start"].values.astype("datetime64[D]"), np.datetime64(as_of.date()))
+        else:
+            age = (as_of - events["start"]) / pd.Timedelta(hours=1)
+        items = events.assign(
+            stage=events["stage"].cat.set_categories(self.measured, ordered=True), entered=events["start"], age=age
+        )
+        items = items.sort_values(["stage", "age"], ascending=[True, False], kind="stable")
+        return items[["issue", "project", "type", "stage", "entered", "age"]].reset_index(drop=True)
+
+    def _summarize(self, items):
+        ages = items.groupby("stage", observed=False)["age"]
+        df = pd.DataFrame(
+            {"count": ages.size(), "p50": ages.quantile(0.5), "p85": ages.quantile(0.85), "max": ages.max()}
+        )
+        df.index = pd.Index(self.measured, name="stage")
+        return df
+
+    @property
+    def items(self):
+        """One row per open issue at as_of, oldest first within every stage."""
+        return self._items
+
+    def get_data_frame(self):
+        """Count and age percentiles of the open issues per stage at as_of."""
+        return self._data
+
+
+class StageTransitionMatrix:
+    """Count of moves from each workflow stage to every other stage, including backward moves (rework)."""
+
+    def __init__(self, issues, stages=None, by_type=False, *args, **kwargs):
+        """Count the transitions between consecutive workflow stages of every issue history.
+
+        Events for labels outside of the stages are skipped, e.g. a reopened issue moves from closed
+        directly to the next workflow stage.
+
+        args:
+        issues list of issues, or a HistoryTable of their histories
+
+        kwargs:
+        stages workflow stages in order, default ["opened", "closed"]
+        by_type report the matrix of every issue type instead of all issues
+        """
+        self.stages = stages or ["opened", "closed"]
+        self.by_type = by_type
+
+        table = issues if isinstance(issues, HistoryTable) else HistoryTable.from_issues(issues)
+        n = len(self.stages)
+
+        # position of every table stage code in the workflow, -1 when the stage is not included
+        positions = np.array([self.stages.index(x) if x in self.stages else -1 for x in table.stages], dtype=int)
+        records = table.records
+        stage = positions[records["stage"]]
+        included = stage >= 0
+        stage = stage[included]
+        keys = table.issue_keys()[included]
+        # issues without a type are counted after every known type
+        type_codes = np.where(records["type"] < 0, len(table.types), records["type"])[included]
+
+        same_issue = keys[1:] == keys[:-1]
+        origin = stage[:-1][same_issue]
+        target = stage[1:][same_issue]
+        origin_type = type_codes[:-1][same_issue]
+
+        size = len(table.types) + 1
+        counts = np.bincount((origin_type * n + origin) * n + target, minlength=size * n * n).reshape(size, n, n)
+        self._types = table.types + [None]
+        self._counts = counts
+
+    def merge(self, other):
+        """Add the counts of another matrix over the same stages, e.g. of another partition of the histories."""
+        if other.stages != self.stages:
+            raise ValueError(f"Cannot merge transitions between {other.stages} into transitions between {self.stages}")
+        # issues without a type stay last
+        types = self._types[:-1] + [t for t in other._types[:-1] if t not in self._types]
+        n = len(self.stages)
+        counts = np.zeros((len(types) + 1, n, n), dtype=np.int64)
+        for matrix in (self, other):
+            rows = [types.index(t) if t is not None else len(types) for t in matrix._types]
+            np.add.at(counts, rows, matrix._counts)
+        self._types = types + [None]
+        self._counts = counts
+        return self
+
+    def get_data_frame(self):
+        """The transition matrix, rows are the stage moved from and columns the stage moved to."""
+        if self.by_type:
+            return self.get_data_frame_by_type()
+        return self._matrix(self._counts.sum(axis=0))
+
+    def get_data_frame_by_type(self):
+        """A transition matrix for every issue type, indexed by type and the stage moved from."""
+        matrices = [self._matrix(c) for c in self._counts]
+        return pd.concat(matrices, keys=self._types, names=["type", "from"])
+
+    def _matrix(self, counts):
+        return pd.DataFrame(
+            counts,
+            index=pd.Index(self.stages, name="from"),
+            columns=pd.Index(self.stages, name="to"),
+        )
+
+    def rework(self):
+        """Backward moves per type, largest count first."""
+        type_index, origin, target = np.nonzero(np.tril(self._counts, k=-1))
+        df = pd.DataFrame(
+            {
+                "type": [self._types[i] for i in type_index],
+                "from": [self.stages[i] for i in origin],
+                "to": [self.stages[i] for i in target],
+                "count": self._counts[type_index, origin, target],
+            }
+        )
+        return df.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
@@ -1,9 +1,8 @@
-import matplotlib.pyplot as plt
-
-
 class CsvReport:
     """Configure the output of a DataFrame csv format."""
 
+    extension = ".csv"
+
     def __init__(self, df, file=None, **kwargs):
         """Prepare a CSV report format file.
 
@@ -24,25 +23,121 @@ class CsvReport:
         return self._df.to_csv(self._file, date_format="%Y-%m-%d")
 
 
+def columnar_frame(df):
+    """Prepare a DataFrame for a columnar file format.
+
+    The index becomes ordinary columns unless it only numbers the rows, column names become strings,
+    and object columns holding only strings, such as issue types, become categorical so they are stored
+    once as a dictionary. Timezone aware datetimes and existing categoricals, such as stages, are kept.
+    """
+    import pandas as pd
+
+    # a default row number index carries no information
+    df = df.reset_index(drop=isinstance(df.index, pd.RangeIndex) and df.index.name is None)
+    df.columns = [
+        "index" if c is None else "_".join(map(str, c)) if isinstance(c, tuple) else str(c) for c in df.columns
+    ]
+    for name in df.columns:
+        if df[name].dtype == object and pd.api.types.infer_dtype(df[name], skipna=True) == "string":
+            df[name] = df[name].astype("category")
+    return df
+
+
+class ArrowReport:
+    """Base of the reports in Apache Arrow based columnar formats, requires the optional pyarrow package."""
+
+    def __init__(self, df, file=None, **kwargs):
+        """Prepare a columnar report file.
+
+        Arguments:
+        df - DataFrame (required)
+        file - Write to given file path or open binary file buffer. Returns bytes when None.
+        """
+        self._df = df
+        self._file = file
+
+    def export(self):
+        import pyarrow as pa
+
+        # columns without nulls are handed to arrow without copying their numpy buffers
+        table = pa.Table.from_pandas(columnar_frame(self._df), preserve_index=False)
+        if self._file is not None:
+            return self.write(table, self._file)
+
+        sink = pa.BufferOutputStream()
+        self.write(table, sink)
+        return sink.getvalue().to_pybytes()
+
+    def write(self, table, file):  # pragma: no cover
+        raise NotImplementedError()
+
+
+class ParquetReport(ArrowReport):
+    """Configure the output of a DataFrame to Apache Parquet format (.parquet)."""
+
+    extension = ".parquet"
+
+    def write(self, table, file):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, file)
+
+
+class FeatherReport(ArrowReport):
+    """Configure the output of a DataFrame to Arrow IPC file format (.feather)."""
+
+    extension = ".feather"
+
+    def write(self, table, file):
+        import pyarrow.feather as feather
+
+        # uncompressed files can be memory mapped by readers without copying
+        feather.write_feather(table, file, compression="uncompressed")
+
+
 class PlotReport:
     """Configure the output of a DataFrame to plot image (.png)."""
 
-    def __init__(self, df, file=None, title="CFD", **kwargs):
+    extension = ".png"
+    format = "png"
+
+    # more days than pixels across the plot add render time and file size, but no detail
+    MAX_POINTS = 500
+
+    def __init__(self, df, file=None, title="CFD", freq=None, max_points=MAX_POINTS, **kwargs):
         """Prepare a plot file.
 
-        This is no more than a convenience wrapper to Pandas DataFrame API.
+        The plot is drawn on its own matplotlib Figure, without pyplot global state, so plots can be
+        rendered side by side, see `render_plots`.
 
         Arguments:
         df - DataFrame (required)
-        file - Write to given file path or open file buffer. Returns a string when None.
+        file - Write to given file path or open binary file buffer. Returns the image bytes when None.
         title - Extra title, typically represents the search criteria, e.g. milestone name
+        freq - Plot the counts at the end of every period instead of every day, e.g. "W" or "M"
+        max_points - Reduce longer ranges to about this many days, keeping the shape of every stage band.
+                     None plots every day.
         """
-        self._df = df[df.columns[::-1]]  # reverse order of columns
+        self._df = self._downsample(df[df.columns[::-1]], freq, max_points)  # reverse order of columns
         self._file = file
         self.title = " ".join([title, str(df.index.date[0]), str(df.index.date[-1])])
         self.min = self._calc_min(df)
         self.max = self._calc_max(df)
 
+    def _downsample(self, df, freq, max_points):
+        if freq:
+            df = df.resample(freq).last()
+        if max_points and len(df) > max_points:
+            # the top edge of every band is the running total of the stages stacked below it
+            edges = df.to_numpy(dtype=float).cumsum(axis=1)
+            days = (df.index - df.index[0]).days
+            budget = max(3, max_points // len(df.columns))
+            selected = set()
+            for edge in edges.T:
+                selected.update(lttb_indices(days, edge, budget).tolist())
+            df = df.iloc[sorted(selected)]
+        return df
+
     def _calc_min(self, df):
         _min = df[df.columns.values[-1]].min()
         return _min - (_min % 10)
@@ -51,17 +146,133 @@ class PlotReport:
         _max = df.sum(axis=1).max()
         return round(_max + 5, -1)
 
+    def payload(self):
+        """The compact arrays and settings needed to draw the plot, cheap to send to another process."""
+        return dict(
+            format=self.format,
+            title=self.title,
+            labels=[str(x) for x in self._df.columns],
+            dates=self._df.index.values.astype("datetime64[D]"),
+            values=self._df.to_numpy(dtype=float).T,
+            ylim=(float(self.min), float(self.max)),
+        )
+
     def export(self):
-        plt.close("all")
-
-        args = {
-            "title": self.title,
-            "legend": "reverse",
-            "ylabel": "Count of Issues",
-            "xlabel": "Days",
-            "ylim": (self.min, self.max),
-        }
-
-        ax = self._df.plot.area(**args)
-        fig = ax.get_figure()
-        fig.savefig(self._file)
+        return self.save(render_plot(**self.payload()))
+
+    def save(self, content):
+        """Write rendered image bytes to the report file, or return them when there is no file."""
+        if self._file is None:
+            return content
+        if hasattr(self._file, "write"):
+            self._file.write(content)
+        else:
+            with open(self._file, "wb") as f:
+                f.write(content)
+
+
+def render_plot(format, title, labels, dates, values, ylim):
+    """Draw a stacked area plot with matplotlib's object oriented API and return the image bytes.
+
+    Every call uses its own Figure and Agg canvas, no pyplot state is shared between calls.
+    """
+    import io
+
+    import numpy as np
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    # days are plotted as the number of days since the first date and labelled with their ISO date,
+    # about 8 labels whatever the range
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    days = (dates - dates[0]).astype(int)
+    ax.stackplot(days, values, labels=labels, alpha=0.5)
+    ticks = np.unique(np.linspace(0, days[-1], min(days[-1] + 1, 8)).round().astype(int))
+    # set separately, set_xticks only takes labels from matplotlib 3.5
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(np.datetime_as_string(dates[0] + ticks, unit="D"))
+    handles, legend_labels = ax.get_legend_handles_labels()
+    ax.legend(handles[::-1], legend_labels[::-1])
+    ax.set(title=title, ylabel="Count of Issues", xlabel="Days", ylim=ylim)
+    ax.margins(x=0)
+    fig.autofmt_xdate()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=format)
+    return buffer.getvalue()
+
+
+def lttb_indices(x, y, n_out):
+    """Positions of n_out points that keep the visual shape of a line, by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. From every bucket of points between them, the point
+    forming the largest triangle with the point kept before it and the average of the next bucket is kept.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n < 3:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            avg_x, avg_y = x[hi : edges[i + 2]].mean(), y[hi : edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        a = selected[i]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        selected[i + 1] = lo + np.argmax(area)
+    return selected
+
+
+def _render_payload(payload):
+    return render_plot(**payload)
+
+
+class SvgReport(PlotReport):
+    """Configure the output of a DataFrame to a scalable vector image (.svg).
+
+    Every plotted point is a path node in the file, the number of days is bounded by max_points so the
+    file size stays about the same however long the date range.
+    """
+
+    extension = ".svg"
+    format = "svg"
+
+
+def render_plots(reports, workers=None):
+    """Render many plot reports in a process pool and write every report's file.
+
+    Only the compact arrays of each plot are sent to the workers, the images come back as bytes and
+    are written by this process, so reports may also write to open file buffers.
+
+    args:
+    reports list of PlotReport objects
+
+    kwargs:
+    workers size of the process pool, default the number of CPUs, 1 renders in this process
+
+    Returns the export result of every report, in order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    payloads = [report.payload() for report in reports]
+    if workers == 1 or len(reports) < 2:
+        images = [_render_payload(p) for p in payloads]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            images = list(executor.map(_render_payload, payloads))
+
+    return [report.save(image) for report, image in zip(reports, images)]
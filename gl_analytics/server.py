@@ -0,0 +1,284 @@
+"""Long running service answering dashboard requests from warm issues and aggregations.
+
+GET /<command>?milestone=<milestone>&group=<group>&format=json|csv|png&<command options>
+GET /metrics the GitLab requests made so far, in Prometheus text format
+
+The GitLab session, the resolved issues of every group and milestone asked for, and every computed
+aggregation are kept in memory. A background thread fetches the issues again every refresh interval
+and recomputes the cached aggregations, requests are answered from memory in the meantime.
+"""
+import datetime
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from .command import (
+    CumulativeFlowCommand,
+    CycleTimeCommand,
+    ForecastCommand,
+    TimeInStageCommand,
+    TransitionsCommand,
+    WipAgeCommand,
+)
+from .instrumentation import RequestMetrics
+from .issues import GitlabSession
+from .report import CsvReport, PlotReport, columnar_frame
+from .utils import timer
+
+_log = logging.getLogger(__name__)
+
+
+def _flag(value):
+    return value.lower() in ["1", "true", "yes"]
+
+
+# the commands served, with the query parameters each accepts and their converters
+ENDPOINTS = {
+    "cumulativeflow": (CumulativeFlowCommand, {"days": int}),
+    "cycletime": (CycleTimeCommand, {}),
+    "timeinstage": (TimeInStageCommand, {"unit": str}),
+    "transitions": (TransitionsCommand, {"by_type": _flag}),
+    "wipage": (WipAgeCommand, {"date": datetime.date.fromisoformat, "unit": str}),
+    "forecast": (ForecastCommand, {"days": int, "simulations": int}),
+}
+
+# query parameters named differently from the aggregation argument
+ARGUMENT_NAMES = {"date": "as_of"}
+
+FORMATS = {"json": "application/json", "csv": "text/csv; charset=utf-8", "png": "image/png"}
+
+
+class AnalyticsService:
+    """Issues and aggregations of every requested command, group and milestone, kept warm in memory."""
+
+    def __init__(self, config, group=None, refresh=900, session=None, store=None, **kwargs):
+        """Prepare the service, nothing is fetched until asked for.
+
+        args:
+        config configuration with TOKEN and GITLAB_BASE_URL
+
+        kwargs:
+        group default GitLab group name or id
+        refresh seconds between background refreshes of the issues, 0 or None never refreshes
+        session GitlabSession to share, default a new session from config
+        store read the issues from this webhook event store file instead of GitLab
+        kwargs passed to every aggregation, e.g. stages and wip
+        """
+        self.config = config
+        self.group = group
+        self.refresh_interval = refresh
+        self.aggregator_args = kwargs
+        self.store = store
+        if session is None and not store:
+            session = GitlabSession(config["GITLAB_BASE_URL"], access_token=config["TOKEN"], metrics=RequestMetrics())
+        self._session = session
+        # one connection for every fetch and refresh, closed by stop
+        self._event_store = None
+        if store:
+            from .events import EventStore
+
+            self._event_store = EventStore(store)
+
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+        self._issues = {}
+        self._results = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def session(self):
+        return self._session
+
+    def _command(self, name, group, milestone):
+        command_cls, _ = ENDPOINTS[name]
+        prog_args = SimpleNamespace(group=group or self.group, milestone=milestone, store=self.store, extra_args={})
+        return command_cls(self.config, prog_args)
+
+    def _fetch(self, key):
+        name, group, milestone = key
+        command = self._command(name, group, milestone)
+        with timer(f"Listing issues for {key}"):
+            issues = command.list(command.build_repo(session=self._session, event_store=self._event_store))
+        _log.info(f"Retrieved {len(issues)} issues for {key}")
+        return issues
+
+    def issues(self, name, group=None, milestone="#started"):
+        """Resolved issues of a command, fetched on first use."""
+        key = (name, group or self.group, milestone)
+        with self._lock:
+            if key in self._issues:
+                return self._issues[key]
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+
+        # concurrent first requests for the same issues wait for one fetch
+        with fetch_lock:
+            with self._lock:
+                if key in self._issues:
+                    return self._issues[key]
+            issues = self._fetch(key)
+            with self._lock:
+                self._issues[key] = issues
+            return issues
+
+    def data_frame(self, name, group=None, milestone="#started", **params):
+        """The aggregated DataFrame of a command for the given parameters, computed on first use."""
+        if name not in ENDPOINTS:
+            raise KeyError(name)
+        key = (name, group or self.group, milestone, tuple(sorted(params.items())))
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+
+        df = self._aggregate(key, self.issues(name, group, milestone))
+        with self._lock:
+            self._results[key] = df
+        return df
+
+    def _aggregate(self, key, issues):
+        name, group, milestone, params = key
+        command = self._command(name, group, milestone)
+        args = {**self.aggregator_args, **{ARGUMENT_NAMES.get(k, k): v for k, v in params}}
+        with timer(f"Aggregating {key}"):
+            return command.aggregate_results(issues, **args).get_data_frame()
+
+    def refresh(self):
+        """Fetch all known issues again and recompute the cached aggregations from them."""
+        with self._lock:
+            issue_keys = list(self._issues)
+            result_keys = list(self._results)
+
+        for key in issue_keys:
+            try:
+                issues = self._fetch(key)
+                results = {k: self._aggregate(k, issues) for k in result_keys if k[:3] == key}
+            except Exception:
+                _log.exception(f"Unable to refresh {key}, keeping the previous results")
+                continue
+            with self._lock:
+                self._issues[key] = issues
+                self._results.update(results)
+
+    def start(self):
+        """Refresh in a background thread every refresh interval, until stopped."""
+        if not self.refresh_interval or self._thread:
+            return
+
+        def run():
+            while not self._stopped.wait(self.refresh_interval):
+                with timer("Refresh"):
+                    self.refresh()
+
+        self._thread = threading.Thread(target=run, name="refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._event_store is not None:
+            self._event_store.close()
+            self._event_store = None
+
+
+def render(df, fmt, title=None):
+    """Returns the body of a response in the given format."""
+    if fmt == "json":
+        return columnar_frame(df).to_json(orient="records", date_format="iso").encode()
+    if fmt == "csv":
+        return CsvReport(df).export().encode()
+    if fmt == "png":
+        import pandas as pd
+
+        if not isinstance(df.index, pd.DatetimeIndex):
+            raise ValueError("png is only available for daily counts")
+        return PlotReport(df, title=title or "CFD").export()
+    raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+class AnalyticsRequestHandler(BaseHTTPRequestHandler):
+    """Maps GET /<command> requests onto the service of the server."""
+
+    # fixed routes answered by the server itself, to the method sending the response
+    routes = {"health": "_send_health", "metrics": "_send_metrics"}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if name in self.routes:
+            return getattr(self, self.routes[name])()
+        if name not in ENDPOINTS:
+            return self._error(404, f"Unknown command '{name}', try one of {', '.join(ENDPOINTS)}")
+
+        try:
+            fmt = query.pop("format", "json")
+            group = query.pop("group", None)
+            milestone = query.pop("milestone", "#started")
+            converters = ENDPOINTS[name][1]
+            unknown = set(query) - set(converters)
+            if unknown:
+                raise ValueError(f"Unknown parameters {', '.join(sorted(unknown))}")
+            params = {k: converters[k](v) for k, v in query.items()}
+            if fmt not in FORMATS:
+                raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        except ValueError as e:
+            return self._error(400, str(e))
+
+        try:
+            df = self.server.service.data_frame(name, group=group, milestone=milestone, **params)
+            body = render(df, fmt, title=milestone)
+        except ValueError as e:
+            return self._error(400, str(e))
+        except Exception:
+            _log.exception(f"Unable to answer {self.path}")
+            return self._error(500, "Unable to compute the aggregation, see the server log")
+
+        self._send(200, FORMATS[fmt], body)
+
+    def _send_health(self):
+        self._send(200, FORMATS["json"], json.dumps({"status": "ok"}).encode())
+
+    def _send_metrics(self):
+        metrics = getattr(self.server.service.session, "metrics", None) or RequestMetrics()
+        self._send(200, "text/plain; version=0.0.4", metrics.to_prometheus().encode())
+
+    def _error(self, status, message):
+        self._send(status, FORMATS["json"], json.dumps({"error": message}).encode())
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _log.info("%s %s", self.address_string(), format % args)
+
+
+def make_server(service, host="127.0.0.1", port=8080):
+    """Create a threaded HTTP server for the service, port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), AnalyticsRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(service, host="127.0.0.1", port=8080):
+    """Serve requests until interrupted."""
+    server = make_server(service, host, port)
+    service.start()
+    _log.info(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
@@ -1,17 +1,224 @@
+import cProfile
+import io
+import json
 import logging
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
 
 from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 
 _log = logging.getLogger(__name__)
 
+# the Tracer collecting spans, None when tracing is off
+_tracer = None
+
+# the PhaseProfiler writing profiles, None when profiling is off
+_profiler = None
+
+
+class Tracer:
+    """Collects spans as Chrome trace events, viewable in chrome://tracing or https://ui.perfetto.dev.
+
+    Every span is a complete ("X") event on the thread that ran it. Spans of one thread nest by
+    their start and end times, so the viewer draws them as a flame chart per thread.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def add(self, name, start_ns, end_ns, args=None):
+        """Record a span that started and ended at the given time.perf_counter_ns() values."""
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self._pid,
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = {k: v if isinstance(v, (int, float, bool)) else str(v) for k, v in args.items()}
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    @property
+    def events(self):
+        """The recorded spans, preceded by a thread name metadata event for every thread."""
+        with self._lock:
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            return names + list(self._events)
+
+    def save(self, file):
+        """Write the trace in Chrome trace JSON format to a file path or open text file buffer."""
+        trace = {"traceEvents": self.events, "displayTimeUnit": "ms"}
+        if hasattr(file, "write"):
+            json.dump(trace, file)
+        else:
+            with open(file, "w") as f:
+                json.dump(trace, f)
+
+
+@contextmanager
+def span(name, **args):
+    """Trace the wrapped block as a span of the given name, a no-op unless tracing is on.
+
+    Keyword arguments are recorded with the span, e.g. span("Fetch issues page", page=2).
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        tracer.add(name, start, time.perf_counter_ns(), args)
+
+
+@contextmanager
+def tracing(file):
+    """Turn on tracing for the wrapped block and write the spans to file at the end."""
+    global _tracer
+
+    _tracer = Tracer()
+    try:
+        yield _tracer
+    finally:
+        tracer, _tracer = _tracer, None
+        tracer.save(file)
+        _log.info(f"Wrote trace of {len(tracer.events)} events to '{file}'")
+
 
 @contextmanager
 def timer(msg):
     start = datetime.now(tz=timezone.utc)
     try:
-        yield
+        with span(msg):
+            yield
     finally:
         end = datetime.now(tz=timezone.utc)
         delta = (end - start) / timedelta(milliseconds=1)
         _log.debug(f"{msg} took {delta}ms")
+
+
+class PhaseProfiler:
+    """Profiles phases of a run with cProfile and tracemalloc, writing the results to a directory.
+
+    Every phase writes <phase>.pstats, readable with pstats or snakeviz, and <phase>.txt with the
+    functions taking the most cumulative time, the peak traced memory and the lines holding the most
+    memory allocated during the phase at its end.
+    """
+
+    def __init__(self, directory, top=25, frames=1):
+        """Prepare the output directory.
+
+        args:
+        directory path of the directory to write to, created when missing
+
+        kwargs:
+        top number of functions and allocating lines to report
+        frames number of frames kept for every traced allocation
+        """
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.top = top
+        self.frames = frames
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, frame, event, arg):
+        # called once by every thread started during a phase, which then profiles itself
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # python 3.12 allows a single active profiler, which already sees every thread
+            return
+        with self._lock:
+            self._threads.append(profile)
+
+    @contextmanager
+    def phase(self, name):
+        """Profile the wrapped block, including the threads it starts."""
+        self._threads = []
+        tracing_memory = tracemalloc.is_tracing()
+        if not tracing_memory:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        main_profile = cProfile.Profile()
+        threading.setprofile(self._profile_thread)
+        main_profile.enable()
+        try:
+            yield
+        finally:
+            main_profile.disable()
+            threading.setprofile(None)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if not tracing_memory:
+                tracemalloc.stop()
+            self._write(name, main_profile, snapshot, current, peak)
+
+    def _write(self, name, main_profile, snapshot, current, peak):
+        report = io.StringIO()
+        stats = pstats.Stats(main_profile, stream=report)
+        with self._lock:
+            for thread_profile in self._threads:
+                stats.add(thread_profile)
+        stats.dump_stats(self.directory.joinpath(f"{name}.pstats"))
+
+        report.write(f"Phase {name}\n\n")
+        report.write(f"Traced memory at the end {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n\n")
+        report.write(f"Top {self.top} lines by memory allocated during the phase and held at its end\n\n")
+        snapshot = snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+            ]
+        )
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            report.write(f"{stat}\n")
+        report.write(f"\nTop {self.top} functions by cumulative time\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        self.directory.joinpath(f"{name}.txt").write_text(report.getvalue())
+
+
+@contextmanager
+def profile(name):
+    """Profile the wrapped block as a phase of the given name, a no-op unless profiling is on."""
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+
+    with profiler.phase(name):
+        yield
+
+
+@contextmanager
+def profiling(directory, **kwargs):
+    """Turn on profiling of phases for the wrapped block, writing the profiles to directory."""
+    global _profiler
+
+    _profiler = PhaseProfiler(directory, **kwargs)
+    try:
+        yield _profiler
+    finally:
+        _profiler = None
+        _log.info(f"Wrote profiles to '{directory}'")
@@ -29,4 +29,5 @@ setup(
         "lockfile",
         "cachecontrol[filecache]",
     ],
+    extras_require={"arrow": ["pyarrow"]},
 )
@@ -65,6 +65,18 @@ def filepath_png(tmp_path):
     return tmp_filepath
 
 
+@pytest.fixture
+def filepath_parquet(tmp_path):
+    tmp_filepath = tmp_path.joinpath("t.parquet")
+    return tmp_filepath
+
+
+@pytest.fixture
+def filepath_feather(tmp_path):
+    tmp_filepath = tmp_path.joinpath("t.feather")
+    return tmp_filepath
+
+
 @pytest.fixture
 def session():
     session = GitlabSession("https://gitlab.com/api/v4/", access_token="x")
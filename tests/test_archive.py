@@ -0,0 +1,156 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from gl_analytics.archive import EventArchive
+from gl_analytics.histories import HistoryTable
+from gl_analytics.issues import Issue
+from gl_analytics.metrics import CycleTimeSketches, LeadCycleTimes, StageTransitionMatrix
+
+
+@pytest.fixture
+def opened():
+    return datetime.datetime(2021, 3, 15, tzinfo=datetime.timezone.utc)
+
+
+def _issue(issue_id, project_id, opened, stages, issue_type=None):
+    issue = Issue(issue_id, project_id, opened, issue_type=issue_type)
+    issue.history.add_events([(s, opened + datetime.timedelta(days=i + 1), None) for i, s in enumerate(stages)])
+    return issue
+
+
+@pytest.fixture
+def issues(opened):
+    april = opened + datetime.timedelta(days=30)
+    return [
+        _issue(1, 2, opened, ["todo", "closed"], issue_type="Bug"),
+        _issue(2, 2, april, ["closed"]),
+        _issue(3, 5, opened, ["todo", "closed"], issue_type="Feature"),
+    ]
+
+
+def test_archive_partitions_by_project_and_month_opened(tmp_path, issues):
+    archive = EventArchive(tmp_path)
+    assert archive.append(issues) == 8
+
+    assert [(p, month) for p, month, _ in archive.partitions()] == [(2, "2021-03"), (2, "2021-04"), (5, "2021-03")]
+    assert [(p, month) for p, month, _ in archive.partitions(projects=[2], since="2021-04")] == [(2, "2021-04")]
+    assert [m for _, m, _ in archive.partitions(until=datetime.date(2021, 3, 31))] == ["2021-03", "2021-03"]
+
+
+def test_archive_maps_partitions(tmp_path, issues):
+    archive = EventArchive(tmp_path)
+    archive.append(issues)
+
+    table = EventArchive(tmp_path).table(projects=[5])
+    assert isinstance(table.records, np.memmap)
+    assert [list(i.history) for i in table.to_issues()] == [list(issues[2].history)]
+    assert table.to_issues()[0].issue_type == "Feature"
+
+
+def test_archive_joins_partitions(tmp_path, issues):
+    archive = EventArchive(tmp_path)
+    archive.append(issues)
+
+    rebuilt = archive.table().to_issues()
+    assert [(i.issue_id, i.project_id, i.issue_type) for i in rebuilt] == [
+        (1, 2, "Bug"),
+        (2, 2, None),
+        (3, 5, "Feature"),
+    ]
+    assert [list(i.history) for i in rebuilt] == [list(i.history) for i in issues]
+
+
+def test_archive_maps_codes_of_later_appends(tmp_path, opened, issues):
+    archive = EventArchive(tmp_path)
+    archive.append(issues[:1])
+    archive.append([_issue(4, 2, opened, ["review", "closed"], issue_type="Feature")])
+
+    assert archive.stages == ["opened", "todo", "closed", "review"]
+    assert archive.types == ["Bug", "Feature"]
+    rebuilt = EventArchive(tmp_path).table().to_issues()
+    assert [(i.issue_id, i.issue_type, [e[0] for e in i.history]) for i in rebuilt] == [
+        (1, "Bug", ["opened", "todo", "closed"]),
+        (4, "Feature", ["opened", "review", "closed"]),
+    ]
+
+
+def test_archive_keeps_the_last_copy_of_issues(tmp_path, opened, issues):
+    archive = EventArchive(tmp_path)
+    archive.append(issues)
+    assert archive.append(issues) == 0
+
+    reopened = _issue(1, 2, opened, ["todo", "closed", "reopened", "closed"], issue_type="Bug")
+    assert archive.append([reopened]) == 5
+
+    rebuilt = archive.table(projects=[2]).to_issues()
+    assert [i.issue_id for i in rebuilt] == [1, 2]
+    assert list(rebuilt[0].history) == list(reopened.history)
+
+
+def test_archive_keeps_the_last_copy_of_issues_ending_with_a_removed_label(tmp_path, opened):
+    """The last event of a history has an end when its scoped label was removed and nothing followed."""
+    issue = Issue(1, 2, opened)
+    issue.history.add_events([("todo", opened + datetime.timedelta(days=1), opened + datetime.timedelta(days=2))])
+    archive = EventArchive(tmp_path)
+    archive.append([issue])
+
+    issue.history.add_events([("review", opened + datetime.timedelta(days=3), opened + datetime.timedelta(days=4))])
+    assert archive.append([issue]) == 3
+
+    rebuilt = archive.table().to_issues()
+    assert len(rebuilt) == 1
+    assert list(rebuilt[0].history) == list(issue.history)
+
+
+def test_archive_skips_partial_records(tmp_path, issues):
+    archive = EventArchive(tmp_path)
+    archive.append(issues[2:])
+    _, _, path = archive.partitions()[0]
+    with open(path, "ab") as f:
+        f.write(b"\0" * 5)
+
+    assert len(archive.table()) == 3
+
+
+def test_archive_without_issues(tmp_path):
+    archive = EventArchive(tmp_path)
+    assert archive.append([]) == 0
+    assert archive.partitions() == []
+    assert len(archive.table()) == 0
+
+
+def test_archive_rejects_other_versions(tmp_path):
+    tmp_path.joinpath("archive.json").write_text('{"version": 99}')
+    with pytest.raises(ValueError):
+        EventArchive(tmp_path)
+
+
+def test_transitions_merge_over_partitions(tmp_path, issues):
+    stages = ["opened", "todo", "closed"]
+    archive = EventArchive(tmp_path)
+    archive.append(issues)
+
+    merged = StageTransitionMatrix([], stages=stages)
+    for table in archive.tables():
+        merged.merge(StageTransitionMatrix(table, stages=stages))
+
+    whole = StageTransitionMatrix(HistoryTable.from_issues(issues), stages=stages)
+    assert merged.get_data_frame().equals(whole.get_data_frame())
+    assert merged.get_data_frame_by_type().sort_index().equals(whole.get_data_frame_by_type().sort_index())
+
+
+def test_cycle_time_sketches_over_partitions(tmp_path, issues):
+    stages = ["opened", "todo", "closed"]
+    archive = EventArchive(tmp_path)
+    archive.append(issues)
+
+    sketches = CycleTimeSketches(wip="todo", stages=stages)
+    for table in archive.tables():
+        sketches.update(table)
+
+    cycles = LeadCycleTimes(issues, wip="todo", stages=stages).get_data_frame().set_index("type")["cycle"]
+    df = sketches.quantiles(q=[0.5])
+    assert df["count"].sum() == 3
+    assert [df.loc[t, "p50"] for t in ["Bug", None, "Feature"]] == [cycles["Bug"], cycles[None], cycles["Feature"]]
@@ -0,0 +1,73 @@
+import gzip
+
+import pytest
+
+import gl_analytics.issues as issues
+from gl_analytics.cassette import Cassette
+
+
+def list_issues(session):
+    repo = issues.GitlabIssuesRepository(
+        session, group="gozynta", resolvers=[issues.GitlabScopedLabelResolver, issues.GitLabStateEventResolver]
+    )
+    return repo.list(milestone="mb_v1.3")
+
+
+@pytest.fixture
+def cassette_path(tmp_path):
+    return tmp_path.joinpath("run.jsonl.gz")
+
+
+@pytest.mark.usefixtures("get_paged_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_cassette_replays_recorded_run(cassette_path, requests_mock):
+    for resource in ["resource_label_events", "resource_state_events"]:
+        requests_mock.get(f"https://gitlab.com/api/v4/projects/8273019/issues/3/{resource}", text="[]")
+
+    with Cassette(cassette_path, mode="record", base_url="https://gitlab.com/api/v4/") as cassette:
+        session = issues.GitlabSession("https://gitlab.com/api/v4/", access_token="x", cassette=cassette)
+        recorded = list_issues(session)
+    assert len(cassette) == requests_mock.call_count
+
+    requests_mock.reset_mock()
+    cassette = Cassette(cassette_path)
+    replayed = list_issues(issues.GitlabSession(cassette.base_url, cassette=cassette))
+
+    assert requests_mock.call_count == 0
+    assert [i.issue_id for i in replayed] == [i.issue_id for i in recorded] == [2, 3]
+    assert [list(i.history) for i in replayed] == [list(i.history) for i in recorded]
+
+
+@pytest.mark.usefixtures("get_issues")
+def test_cassette_is_compressed_without_request_headers(cassette_path, session):
+    with Cassette(cassette_path, mode="record", base_url=session.baseurl) as cassette:
+        session.cassette = cassette
+        session.get("groups/gozynta/issues", params=[("scope", "all")])
+
+    content = gzip.decompress(cassette_path.read_bytes()).decode()
+    assert "groups/gozynta/issues?scope=all" in content
+    assert "PRIVATE-TOKEN" not in content
+
+
+@pytest.mark.usefixtures("get_issues")
+def test_cassette_replays_response(cassette_path, session):
+    with Cassette(cassette_path, mode="record", base_url=session.baseurl) as cassette:
+        session.cassette = cassette
+        expected = session.get("groups/gozynta/issues")
+
+    replayed = Cassette(cassette_path).play("https://gitlab.com/api/v4/groups/gozynta/issues")
+    assert replayed.status_code == 200
+    assert replayed.json() == expected.json()
+    replayed.raise_for_status()
+
+
+def test_cassette_requires_recorded_request(cassette_path):
+    Cassette(cassette_path, mode="record", base_url="https://gitlab.com/api/v4/").close()
+
+    with pytest.raises(KeyError):
+        Cassette(cassette_path).play("https://gitlab.com/api/v4/groups/gozynta/issues")
+
+
+def test_cassette_requires_mode(cassette_path):
+    with pytest.raises(ValueError):
+        Cassette(cassette_path, mode="append")
@@ -0,0 +1,77 @@
+import pytest
+
+import gl_analytics.issues as issues
+from gl_analytics.estimate import CostEstimate
+
+from .data import TestData, to_bytes
+
+RESOLVERS = [issues.GitlabScopedLabelResolver, issues.GitLabStateEventResolver]
+
+
+def make_estimate(**kwargs):
+    args = dict(
+        url="groups/gozynta/issues",
+        params=[("scope", "all")],
+        issues=95,
+        exact=True,
+        per_page=20,
+        resolvers=[("resource_label_events", 95, 15), ("resource_state_events", 95, 0)],
+        latency=0.1,
+        workers=10,
+    )
+    args.update(kwargs)
+    return CostEstimate(**args)
+
+
+def test_estimate_counts_requests_not_answered_by_the_cache():
+    estimate = make_estimate()
+
+    assert estimate.pages == 5
+    assert estimate.cached == 15
+    assert estimate.requests == 5 + 80 + 95
+
+
+def test_estimate_resolves_a_page_in_parallel():
+    estimate = make_estimate()
+    assert estimate.seconds == pytest.approx(5 * 0.1 + 175 * 0.1 / 10)
+    small = make_estimate(issues=5, per_page=5, resolvers=[("resource_label_events", 5, 0)])
+    assert small.seconds == pytest.approx(0.1 + 5 * 0.1 / 5)
+
+
+def test_estimate_is_bounded_by_cpu_time_and_rate_limit():
+    assert make_estimate(cpu=0.05).seconds == pytest.approx(180 * 0.05)
+
+    estimate = make_estimate(rate_limit=60, rate_remaining=100)
+    assert estimate.seconds == pytest.approx(180.0)
+    assert estimate.over_rate_limit
+    assert "fail with 429" in estimate.format()
+
+
+def test_estimate_reads_total_from_first_page(session, requests_mock):
+    requests_mock.get(
+        "https://gitlab.com/api/v4/groups/gozynta/issues?milestone=mb_v1.3&scope=all",
+        body=to_bytes(TestData.issues.iid2.body),
+        headers={"X-Total": "250", "X-Per-Page": "20", "RateLimit-Limit": "2000", "RateLimit-Remaining": "1990"},
+    )
+    repo = issues.GitlabIssuesRepository(session, group="gozynta", resolvers=RESOLVERS)
+
+    estimate = repo.estimate(milestone="mb_v1.3")
+
+    assert requests_mock.call_count == 1
+    assert "pagination" not in requests_mock.last_request.qs
+    assert (estimate.issues, estimate.exact, estimate.pages) == (250, True, 13)
+    assert estimate.resolvers == [("resource_label_events", 250, 0), ("resource_state_events", 250, 0)]
+    assert estimate.requests == 13 + 500
+    assert (estimate.rate_limit, estimate.over_rate_limit) == (2000, False)
+
+
+def test_estimate_without_total_is_a_lower_bound(session, requests_mock):
+    requests_mock.get(
+        "https://gitlab.com/api/v4/groups/gozynta/issues",
+        body=to_bytes(TestData.issues.iid2.body),
+        headers={"link": '<https://gitlab.com/api/v4/groups/gozynta/issues?page=2>; rel="next"'},
+    )
+    estimate = issues.GitlabIssuesRepository(session, group="gozynta", resolvers=RESOLVERS).estimate()
+
+    assert (estimate.issues, estimate.exact) == (1, False)
+    assert "X-Total not reported" in estimate.format()
@@ -0,0 +1,120 @@
+import datetime
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from gl_analytics.events import EventStore, EventStoreRepository, make_webhook_server
+from tests.data import TestData
+
+HOOKS = ["open", "in_progress", "code_review", "close"]
+
+
+def hook(name):
+    return json.loads(getattr(TestData.issue_hooks, name))
+
+
+def at(day, hour):
+    return datetime.datetime(2021, 3, day, hour, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def store():
+    store = EventStore()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def recorded(store):
+    for name in HOOKS:
+        store.ingest(hook(name))
+    return store
+
+
+def test_store_records_label_and_state_events(recorded):
+    assert recorded.label_events(8273019, 2) == [
+        {"created_at": "2021-03-10T12:00:00+00:00", "action": "add", "label": {"name": "type::Bug"}},
+        {"created_at": "2021-03-11T09:00:00+00:00", "action": "add", "label": {"name": "workflow::In Progress"}},
+        {"created_at": "2021-03-12T15:00:00+00:00", "action": "add", "label": {"name": "workflow::Code Review"}},
+        {"created_at": "2021-03-12T15:00:00+00:00", "action": "remove", "label": {"name": "workflow::In Progress"}},
+    ]
+    assert recorded.state_events(8273019, 2) == [{"created_at": "2021-03-15T10:00:00+00:00", "state": "closed"}]
+
+
+def test_store_ignores_redelivered_payloads(recorded):
+    assert all(recorded.ingest(hook(name)) == 0 for name in HOOKS)
+    assert len(recorded.label_events(8273019, 2)) == 4
+
+
+def test_store_rejects_other_payloads(store):
+    with pytest.raises(ValueError):
+        store.ingest({"object_kind": "merge_request"})
+
+
+def test_repository_builds_issue_histories(recorded):
+    issues = EventStoreRepository(recorded).list()
+    assert len(issues) == 1
+    issue = issues[0]
+    assert (issue.issue_id, issue.project_id, issue.issue_type) == (2, 8273019, "Bug")
+    assert list(issue.history) == [
+        ("opened", at(10, 12), at(11, 9)),
+        ("In Progress", at(11, 9), at(12, 15)),
+        ("Code Review", at(12, 15), at(15, 10)),
+        ("closed", at(15, 10), None),
+    ]
+    assert issue.closed_at == at(15, 10)
+
+
+def test_repository_filters_issues(store):
+    store.ingest(hook("open"))
+    repository = EventStoreRepository(store)
+    assert len(repository.list(milestone="1741")) == 1
+    assert len(repository.list(milestone="9")) == 0
+    assert len(repository.list(milestone="#started")) == 1
+    assert len(repository.list(state="closed")) == 0
+
+    store.ingest(hook("close"))
+    assert len(repository.list(state="closed")) == 1
+
+
+@pytest.fixture
+def webhook_url(store):
+    server = make_webhook_server(store, port=0, secret="s3cret")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body, event="Issue Hook", token="s3cret"):
+    headers = {"Content-Type": "application/json", "X-Gitlab-Event": event, "X-Gitlab-Token": token}
+    request = urllib.request.Request(url, data=body.encode(), headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request) as res:
+            return res.status, json.loads(res.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_webhook_records_posted_payloads(store, webhook_url):
+    results = [post(webhook_url, getattr(TestData.issue_hooks, name)) for name in HOOKS]
+    assert results == [(200, {"events": 1}), (200, {"events": 1}), (200, {"events": 2}), (200, {"events": 1})]
+    assert EventStoreRepository(store).list()[0].closed_at == at(15, 10)
+
+
+def test_webhook_requires_secret_token(store, webhook_url):
+    status, _ = post(webhook_url, TestData.issue_hooks.open, token="wrong")
+    assert status == 401
+    assert EventStoreRepository(store).list() == []
+
+
+def test_webhook_ignores_other_events(webhook_url):
+    assert post(webhook_url, "{}", event="Push Hook")[0] == 202
+
+
+def test_webhook_rejects_invalid_payloads(webhook_url):
+    assert post(webhook_url, "{not json")[0] == 400
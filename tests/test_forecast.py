@@ -0,0 +1,64 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gl_analytics.forecast import MonteCarloForecast, daily_throughput, simulate
+
+
+def test_daily_throughput_from_closed_stage(df):
+    assert list(daily_throughput(df, closed="done")) == [0, 0, 1, 1]
+
+
+def test_daily_throughput_ignores_reopened():
+    df = pd.DataFrame({"closed": [0, 2, 1, 3]})
+    assert list(daily_throughput(df)) == [2, 0, 2]
+
+
+def test_simulate_constant_throughput():
+    days = simulate([2], 10, 100, seed=1)
+    assert days.shape == (100,)
+    assert all(days == 5)
+
+
+def test_simulate_without_remaining_items():
+    assert all(simulate([1, 2], 0, 10) == 0)
+
+
+def test_simulate_without_throughput_never_finishes():
+    assert all(np.isinf(simulate([0, 0], 3, 10)))
+
+
+def test_simulate_is_reproducible():
+    assert np.array_equal(simulate([0, 1, 3], 20, 1000, seed=7), simulate([0, 1, 3], 20, 1000, seed=7))
+
+
+def test_forecast_reports_percentile_dates():
+    forecast = MonteCarloForecast([1, 3], 20, simulations=1000, start_date=datetime.date(2021, 4, 1), seed=1)
+    df = forecast.get_data_frame()
+    print(df.to_csv())
+    assert list(df.index) == [50, 70, 85, 95]
+    assert df.index.name == "percentile"
+    assert list(df["days"]) == sorted(df["days"])
+    assert 5 <= df.loc[50, "days"] <= 20
+    assert df.loc[50, "date"] == datetime.date(2021, 4, 1) + datetime.timedelta(days=int(df.loc[50, "days"]))
+
+
+def test_forecast_without_throughput_has_no_dates():
+    df = MonteCarloForecast([0], 3, simulations=10, percentiles=[50]).get_data_frame()
+    assert df["days"].isna().all()
+    assert df["date"].isna().all()
+
+
+def test_forecast_in_process_pool():
+    df = MonteCarloForecast(
+        [2], 10, simulations=1000, workers=2, start_date=datetime.date(2021, 4, 1)
+    ).get_data_frame()
+    assert all(df["days"] == 5)
+    assert all(df["date"] == datetime.date(2021, 4, 6))
+
+
+def test_forecast_requires_simulations():
+    with pytest.raises(ValueError):
+        MonteCarloForecast([1], 3, simulations=0)
@@ -0,0 +1,157 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from gl_analytics.histories import HistoryIntervals, HistoryTable
+from gl_analytics.issues import Issue
+
+
+@pytest.fixture
+def opened():
+    return datetime.datetime(2021, 3, 15, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def issues(opened):
+    issue1 = Issue(1, "2", opened, issue_type="Bug")
+    issue1.history.add_events(
+        [
+            ("todo", opened + datetime.timedelta(days=1), None),
+            ("closed", opened + datetime.timedelta(days=2), None),
+        ]
+    )
+    issue2 = Issue(1, 3, opened)
+    return [issue1, issue2]
+
+
+def test_history_table_holds_one_record_per_event(issues):
+    table = HistoryTable.from_issues(issues)
+    assert len(table) == 4
+    assert table.stages == ["opened", "todo", "closed"]
+    assert table.types == ["Bug"]
+    assert list(table.records["project"]) == [2, 2, 2, 3]
+    assert list(table.records["type"]) == [0, 0, 0, -1]
+    assert list(table.records["stage"]) == [0, 1, 2, 0]
+
+
+def test_history_table_records_utc_datetimes(opened, issues):
+    table = HistoryTable.from_issues(issues)
+    assert table.records["start"][0] == np.datetime64("2021-03-15T00:00")
+    assert table.records["end"][0] == np.datetime64("2021-03-16T00:00")
+    assert np.isnat(table.records["end"][2])
+
+
+def test_history_table_keys_issues_by_project(issues):
+    table = HistoryTable.from_issues(issues)
+    assert list(table.issue_keys()) == [0, 0, 0, 1]
+
+
+def test_history_table_to_frame(opened, issues):
+    df = HistoryTable.from_issues(issues).to_frame()
+    assert list(df.columns) == ["key", "issue", "project", "type", "stage", "start", "end"]
+    assert list(df["stage"]) == ["opened", "todo", "closed", "opened"]
+    assert df["type"].isna().tolist() == [False, False, False, True]
+    assert df["start"].iloc[0] == opened
+
+
+def test_history_table_without_issues():
+    table = HistoryTable.from_issues([])
+    assert len(table) == 0
+    assert table.to_frame().empty
+
+
+def test_history_intervals_find_events_at_a_point_in_time(opened, issues):
+    intervals = HistoryIntervals(HistoryTable.from_issues(issues))
+    assert len(intervals) == 4
+    assert list(intervals.at(opened - datetime.timedelta(hours=1))) == []
+    assert list(intervals.at(opened)) == [0, 3]
+    assert list(intervals.at(opened + datetime.timedelta(days=1))) == [1, 3]
+    assert list(intervals.at(opened + datetime.timedelta(days=365))) == [2, 3]
+
+
+def test_history_table_frame_of_positions(issues):
+    table = HistoryTable.from_issues(issues)
+    df = table.to_frame([1, 3])
+    assert list(df["key"]) == [0, 1]
+    assert list(df["stage"]) == ["todo", "opened"]
+
+
+def test_history_table_to_issues_rebuilds_histories(issues):
+    rebuilt = HistoryTable.from_issues(issues).to_issues()
+
+    assert [(i.issue_id, i.project_id, i.issue_type) for i in rebuilt] == [(1, 2, "Bug"), (1, 3, None)]
+    assert [list(i.history) for i in rebuilt] == [list(i.history) for i in issues]
+    assert rebuilt[0].closed_at == issues[0].closed_at
+    assert rebuilt[1].history[-1][2] is None
+
+
+def test_history_table_counts_issues(issues):
+    assert HistoryTable.from_issues(issues).count_issues() == 2
+    assert HistoryTable.from_issues([]).count_issues() == 0
+
+
+def test_history_table_of_closed_issues(issues):
+    table = HistoryTable.from_issues(issues)
+
+    closed = table.closed()
+    assert [i.issue_id for i in closed.to_issues()] == [i.issue_id for i in issues if i.closed_at is not None]
+    assert closed.stages == table.stages
+    assert len(HistoryTable.from_issues(issues[1:]).closed()) == 0
+
+
+def test_history_table_concat_maps_codes(opened, issues):
+    other = Issue(7, 3, opened, issue_type="Feature")
+    other.history.add_events([("closed", opened + datetime.timedelta(days=3), None)])
+    first = HistoryTable.from_issues(issues)
+    second = HistoryTable.from_issues([other])
+
+    table = HistoryTable.concat([first, second])
+
+    assert table.stages == ["opened", "todo", "closed"]
+    assert table.types == ["Bug", "Feature"]
+    assert list(table.records["stage"]) == [0, 1, 2, 0, 0, 2]
+    assert list(table.records["type"]) == [0, 0, 0, -1, 1, 1]
+    assert [i.issue_type for i in table.to_issues()] == ["Bug", None, "Feature"]
+
+
+def test_history_table_concat_without_tables():
+    table = HistoryTable.concat([])
+    assert len(table) == 0
+    assert table.to_issues() == []
+
+
+def _attached_summary(descriptor):
+    table = HistoryTable.attach(descriptor)
+    try:
+        return len(table), table.stages, [i.issue_id for i in table.to_issues()]
+    finally:
+        table.close()
+
+
+def test_history_table_shares_records(issues):
+    table = HistoryTable.from_issues(issues)
+    with table.share() as shared:
+        attached = HistoryTable.attach(shared.descriptor)
+        assert attached.records.tobytes() == table.records.tobytes()
+        assert not np.shares_memory(attached.records, table.records)
+        assert (attached.stages, attached.types) == (table.stages, table.types)
+        assert [list(i.history) for i in attached.to_issues()] == [list(i.history) for i in issues]
+
+        attached.close()
+        assert len(attached) == 0
+
+
+def test_history_table_attaches_in_other_processes(issues):
+    from concurrent.futures import ProcessPoolExecutor
+
+    with HistoryTable.from_issues(issues).share() as shared, ProcessPoolExecutor(max_workers=2) as executor:
+        summary = executor.submit(_attached_summary, shared.descriptor).result()
+    assert summary == (4, ["opened", "todo", "closed"], [1, 1])
+
+
+def test_history_table_shares_no_records():
+    with HistoryTable.from_issues([]).share() as shared:
+        attached = HistoryTable.attach(shared.descriptor)
+        assert len(attached) == 0
+        attached.close()
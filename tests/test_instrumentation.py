@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+from gl_analytics.instrumentation import RequestMetrics, cache_result, classify_endpoint
+
+
+@pytest.mark.parametrize(
+    "url, endpoint",
+    [
+        ("https://gitlab.com/api/v4/groups/gozynta/issues", "issues"),
+        ("https://gitlab.com/api/v4/groups/gozynta/issues?page=2&scope=all", "issues"),
+        ("https://gitlab.com/api/v4/projects/8273019/issues/2/resource_label_events", "resource_label_events"),
+        ("https://gitlab.com/api/v4/projects/8273019/issues/2/resource_state_events", "resource_state_events"),
+        ("https://gitlab.com/api/v4/projects/8273019/issues/2/closed_by", "closed_by"),
+        ("https://gitlab.com/api/v4/projects/8273019/issues/2", "other"),
+    ],
+)
+def test_classify_endpoint(url, endpoint):
+    assert classify_endpoint(url) == endpoint
+
+
+def response(status_code=200, content=b"[]", from_cache=False, headers=None):
+    return SimpleNamespace(
+        status_code=status_code,
+        content=content,
+        from_cache=from_cache,
+        request=SimpleNamespace(headers=headers or {}),
+    )
+
+
+def test_cache_result():
+    assert cache_result(response()) == "miss"
+    assert cache_result(response(from_cache=True)) == "hit"
+    assert cache_result(response(from_cache=True, headers={"If-None-Match": '"abc"'})) == "revalidated"
+
+
+@pytest.fixture
+def metrics():
+    metrics = RequestMetrics()
+    label_events = "https://gitlab.com/api/v4/projects/1/issues/{}/resource_label_events"
+    metrics.record("https://gitlab.com/api/v4/groups/g/issues", response(content=b"[1,2]"), 0.2)
+    metrics.record(label_events.format(1), response(content=b"[]"), 0.004)
+    metrics.record(label_events.format(2), response(from_cache=True), 0.002)
+    metrics.record(label_events.format(3), response(status_code=404, content=b"{}"), 0.03)
+    return metrics
+
+
+def test_request_metrics_summary(metrics):
+    assert metrics.count() == 4
+    assert metrics.count("resource_label_events") == 3
+
+    issues, labels = metrics.summary()
+    assert issues["endpoint"] == "issues"
+    assert (issues["requests"], issues["bytes"], issues["miss"]) == (1, 5, 1)
+    assert labels["endpoint"] == "resource_label_events"
+    assert (labels["requests"], labels["errors"], labels["bytes"]) == (3, 1, 6)
+    assert (labels["hit"], labels["miss"], labels["revalidated"]) == (1, 2, 0)
+    assert labels["mean_ms"] == pytest.approx(12.0)
+    assert labels["p95_ms"] == pytest.approx(30.0)
+    assert labels["max_ms"] == pytest.approx(30.0)
+    assert "resource_label_events" in metrics.format_summary()
+
+
+def test_request_metrics_prometheus(metrics):
+    text = metrics.to_prometheus()
+    assert "# TYPE gitlab_request_duration_seconds histogram" in text
+    assert 'gitlab_requests_total{endpoint="resource_label_events",code="404"} 1' in text
+    assert 'gitlab_cache_requests_total{endpoint="resource_label_events",result="hit"} 1' in text
+    assert 'gitlab_response_bytes_total{endpoint="issues"} 5' in text
+    assert 'gitlab_request_duration_seconds_bucket{endpoint="resource_label_events",le="0.005"} 2' in text
+    assert 'gitlab_request_duration_seconds_bucket{endpoint="resource_label_events",le="+Inf"} 3' in text
+    assert 'gitlab_request_duration_seconds_count{endpoint="issues"} 1' in text
+    assert text.endswith("\n")
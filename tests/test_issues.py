@@ -6,6 +6,9 @@ from dateutil.utils import within_delta
 
 import gl_analytics.issues as issues
 
+from tests import change_directory
+from tests.data import TestData, to_link_header
+
 
 def test_gitlab_session(session):
     assert session is not None
@@ -33,6 +36,33 @@ def test_gitlab_session_requires_relative_path(session, requests_mock):
         session.get("/groups/gozynta/issues")
 
 
+@pytest.mark.usefixtures("get_issues")
+def test_gitlab_session_records_metrics():
+    from gl_analytics.instrumentation import RequestMetrics
+
+    metrics = RequestMetrics()
+    session = issues.GitlabSession("https://gitlab.com/api/v4", access_token="x", metrics=metrics)
+    session.get("groups/gozynta/issues")
+    session.get("groups/gozynta/issues")
+
+    (row,) = metrics.summary()
+    assert (row["endpoint"], row["requests"], row["miss"]) == ("issues", 2, 2)
+    assert row["bytes"] > 0
+
+
+def test_gitlab_session_finds_fresh_cached_responses(tmp_path, monkeypatch):
+    with change_directory(tmp_path):
+        session = issues.GitlabSession("https://gitlab.com/api/v4", access_token="x")
+        assert not session.cached("projects/1/issues/2/resource_label_events")
+
+        controller = session.session.get_adapter("https://gitlab.com/").controller
+        fresh = "https://gitlab.com/api/v4/projects/1/issues/2/resource_label_events"
+        monkeypatch.setattr(controller, "cached_request", lambda request: request.url == fresh)
+
+        assert session.cached("projects/1/issues/2/resource_label_events")
+        assert not session.cached("projects/1/issues/2/resource_state_events")
+
+
 def test_repo_requires_group(session):
     with pytest.raises(ValueError):
         issues.GitlabIssuesRepository(session)
@@ -119,6 +149,49 @@ def test_repo_list_pagination(session):
     assert issue_list[1] and issue_list[1].issue_id == 3
 
 
+def test_repo_requires_processes(session):
+    with pytest.raises(ValueError):
+        issues.GitlabIssuesRepository(session, group="gozynta", processes=0)
+
+
+def test_repo_list_parses_in_processes(session, requests_mock):
+    # text bodies, so both listings can read them
+    base = "https://gitlab.com/api/v4"
+    requests_mock.get(
+        f"{base}/groups/gozynta/issues?milestone=mb_v1.3&pagination=keyset&scope=all",
+        text=TestData.issues.iid2.body,
+        headers=to_link_header(TestData.issues.iid2.headers.link),
+    )
+    requests_mock.get(
+        f"{base}/groups/gozynta/issues?id=gozynta&milestone=mb_v1.3&page=2&pagination=keyset",
+        text=TestData.issues.iid3.body,
+    )
+    bodies = {
+        "resource_label_events": TestData.resource_label_events.closed,
+        "resource_state_events": TestData.resource_state_events.closed,
+        "closed_by": TestData.closed_by.merge,
+    }
+    for resource, body in bodies.items():
+        requests_mock.get(f"{base}/projects/8273019/issues/2/{resource}", text=body)
+        requests_mock.get(f"{base}/projects/8273019/issues/3/{resource}", text="[]")
+    resolvers = [
+        issues.GitlabScopedLabelResolver,
+        issues.GitLabStateEventResolver,
+        issues.GitLabClosedByMergeRequestResolver,
+    ]
+
+    threaded = issues.GitlabIssuesRepository(session, group="gozynta", resolvers=resolvers).list(milestone="mb_v1.3")
+    repo = issues.GitlabIssuesRepository(session, group="gozynta", resolvers=resolvers, processes=2)
+    parsed = repo.list(milestone="mb_v1.3")
+
+    # the test data has string project ids, the histories are built with integer ones
+    assert [(i.issue_id, i.project_id, i.issue_type) for i in parsed] == [
+        (i.issue_id, int(i.project_id), i.issue_type) for i in threaded
+    ]
+    assert [list(i.history) for i in parsed] == [list(i.history) for i in threaded]
+    assert "merge_request" in [e[0] for e in parsed[0].history]
+
+
 def compare_label_events(expected, actual):
     """Helper function for test asserts."""
     return (
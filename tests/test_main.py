@@ -1,6 +1,11 @@
+import json
+import subprocess
+import sys
+
 import pytest
 
 from tests import change_directory, read_filepath
+from tests.data import TestData
 
 import gl_analytics.__main__ as m
 
@@ -11,7 +16,38 @@ def test_main_require_command(capsys):
     assert se.value.code != 0
 
 
-@pytest.mark.parametrize("cmd", ["cumulativeflow", "cf", "flow", "cycletime", "cy"])
+def test_main_help_does_not_import_heavy_modules():
+    probe = (
+        "import sys\n"
+        "import gl_analytics.__main__ as m\n"
+        "try:\n"
+        "    m.main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted({x.split('.')[0] for x in sys.modules} & {'pandas', 'numpy', 'matplotlib', 'requests'}))\n"
+    )
+    res = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    assert res.stdout.splitlines()[-1] == "[]"
+
+
+@pytest.mark.parametrize(
+    "cmd",
+    [
+        "cumulativeflow",
+        "cf",
+        "flow",
+        "cycletime",
+        "cy",
+        "timeinstage",
+        "tis",
+        "transitions",
+        "tr",
+        "forecast",
+        "fc",
+        "wipage",
+        "wa",
+    ],
+)
 def test_main_supports_commands(capsys, cmd):
 
     with pytest.raises(SystemExit) as se:
@@ -46,6 +82,16 @@ def test_main_cumulative_flow_prints_csv(capsys, monkeypatch, patch_datetime_now
     assert "2021-03-07,0.0,1.0,0.0,0.0" in captured.out
 
 
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_parses_in_processes(capsys, monkeypatch):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "-d", "3650", "--processes", "2"])
+    captured = capsys.readouterr()
+    assert ",opened,In Progress,Code Review,closed" in captured.out
+    assert "2021-03-07,0.0,1.0,0.0,0.0" in captured.out
+
+
 @pytest.mark.usefixtures("get_issues")
 @pytest.mark.usefixtures("get_workflow_labels")
 def test_main_cumulative_flow_writes_csv(filepath_csv, monkeypatch, patch_datetime_now):
@@ -82,6 +128,157 @@ def test_main_cumulative_flow_exports_default_png(monkeypatch, tmp_path, fake_ti
     assert tmp_path.joinpath(f"cfd_{timestamp_str}.png").exists()
 
 
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_exports_parquet(monkeypatch, filepath_parquet):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "parquet", "-o", str(filepath_parquet.resolve())])
+
+    table = pq.read_table(filepath_parquet)
+    assert table.column_names == ["datetime", "opened", "In Progress", "Code Review", "closed"]
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_exports_several_reports(monkeypatch, tmp_path, capsys):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "plot", "csv", "-o", str(tmp_path.joinpath("out.txt"))])
+    captured = capsys.readouterr()
+
+    assert ",opened,In Progress,Code Review,closed" in read_filepath(tmp_path.joinpath("out.csv"))
+    assert tmp_path.joinpath("out.png").exists()
+    assert not tmp_path.joinpath("out.txt").exists()
+    assert captured.out.count("Created") == 2
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_renders_plots_off_the_export_threads(monkeypatch, tmp_path, capsys):
+    import gl_analytics.command
+
+    rendered = []
+
+    def render_plots(reports, workers=None):
+        rendered.append([r.format for r in reports])
+        return [r.export() for r in reports]
+
+    monkeypatch.setattr(gl_analytics.command, "render_plots", render_plots)
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "plot", "svg", "-o", str(tmp_path.joinpath("out"))])
+    captured = capsys.readouterr()
+
+    assert rendered == [["png", "svg"]]
+    assert tmp_path.joinpath("out.png").exists()
+    assert tmp_path.joinpath("out.svg").read_text().startswith("<?xml")
+    assert captured.out.count("Created") == 3
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_writes_trace(monkeypatch, tmp_path, capsys):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    filepath = tmp_path.joinpath("trace.json")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "--trace", str(filepath)])
+
+    names = {e["name"] for e in json.loads(read_filepath(filepath))["traceEvents"]}
+    assert {
+        "Listing issues",
+        "Fetch issues page",
+        "GitlabScopedLabelResolver.fetch",
+        "GitLabStateEventResolver.process",
+        "combine_by_totals",
+        "Export CsvReport",
+    } <= names
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_reports_request_metrics(monkeypatch, tmp_path, capsys):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    filepath = tmp_path.joinpath("metrics.prom")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "--metrics", str(filepath)])
+    captured = capsys.readouterr()
+
+    assert "resource_label_events" in captured.err
+    content = read_filepath(filepath)
+    assert 'gitlab_requests_total{endpoint="issues",code="200"} 1' in content
+    assert 'gitlab_requests_total{endpoint="resource_state_events",code="200"} 1' in content
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_writes_profiles(monkeypatch, tmp_path):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "--profile", str(tmp_path.joinpath("profiles"))])
+
+    for phase in ["listing", "aggregation", "export"]:
+        assert tmp_path.joinpath("profiles", f"{phase}.pstats").exists()
+    assert "combine_by_totals" in read_filepath(tmp_path.joinpath("profiles", "aggregation.txt"))
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_main_cumulative_flow_replays_recording(monkeypatch, tmp_path, capsys, requests_mock):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    cassette = str(tmp_path.joinpath("run.jsonl.gz"))
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "-d", "3650", "--record", cassette])
+    recorded = capsys.readouterr().out
+
+    requests_mock.reset_mock()
+    monkeypatch.delitem(m.config, "TOKEN")
+    m.main(["cf", "-m", "mb_v1.3", "-r", "csv", "-d", "3650", "--replay", cassette])
+
+    assert requests_mock.call_count == 0
+    assert capsys.readouterr().out == recorded
+
+
+@pytest.mark.usefixtures("get_issues")
+def test_main_cycletime_dry_run_estimates_resolver_requests(monkeypatch, capsys, requests_mock):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["cy", "-m", "mb_v1.3", "--dry-run"])
+    out = capsys.readouterr().out
+
+    assert requests_mock.call_count == 1
+    assert "state=closed" in out
+    for endpoint in ["resource_label_events", "resource_state_events", "closed_by"]:
+        assert f"{endpoint:<24}1 requests" in out
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_timeinstage_reads_event_store(capsys, tmp_path):
+    """Issues are rebuilt from recorded webhooks, requests_mock fails any GitLab request."""
+    from gl_analytics.events import EventStore
+
+    store = EventStore(str(tmp_path.joinpath("events.sqlite3")))
+    for name in ["open", "in_progress", "code_review", "close"]:
+        store.ingest(json.loads(getattr(TestData.issue_hooks, name)))
+    store.close()
+
+    capsys.readouterr()
+    m.main(["tis", "-m", "1741", "-r", "csv", "--store", str(tmp_path.joinpath("events.sqlite3"))])
+    captured = capsys.readouterr()
+    print("\noutput captured\n", captured.out)
+    assert "0,2,8273019,Bug,1,1,1,0.82" in captured.out
+
+
+@pytest.mark.usefixtures("requests_mock")
+@pytest.mark.parametrize("cmd", ["tis", "tr", "wipage", "fc", "cy"])
+@pytest.mark.parametrize("fmt", ["plot", "svg"])
+def test_plot_reports_require_daily_counts(tmp_path, cmd, fmt):
+    from gl_analytics.events import EventStore
+
+    store = EventStore(str(tmp_path.joinpath("events.sqlite3")))
+    for name in ["open", "in_progress", "code_review", "close"]:
+        store.ingest(json.loads(getattr(TestData.issue_hooks, name)))
+    store.close()
+
+    args = [cmd, "-m", "1741", "-r", "csv", fmt, "-o", str(tmp_path.joinpath("out"))]
+    with pytest.raises(ValueError, match="daily counts"):
+        m.main(args + ["--store", str(tmp_path.joinpath("events.sqlite3"))])
+    assert list(tmp_path.glob("out*")) == []
+
+
 def test_cycletime_requires_user_token(monkeypatch):
     monkeypatch.delitem(m.config, "TOKEN", raising=False)
 
@@ -111,3 +308,87 @@ def test_cycletime_prints_csv(capsys, monkeypatch, patch_datetime_now):
         ",issue,project,type,opened,In Progress,Code Review,closed,last_closed,wip_event,wip,reopened,lead,cycle\n"
         + "0,2,8273019,,2021-03-09,2021-03-12,,2021-03-15,2021-03-15,In Progress,2021-03-12,0,5,2"
     ) in captured.out
+
+
+@pytest.mark.usefixtures("get_closed_issues")
+@pytest.mark.usefixtures("get_closed_workflow_labels")
+def test_timeinstage_prints_csv(capsys, monkeypatch):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+
+    capsys.readouterr()
+    m.main(["tis", "-m", "mb_v1.3", "-r", "csv"])
+    captured = capsys.readouterr()
+    print("\noutput captured\n", captured.out)
+    assert ",issue,project,type,opened,In Progress,Code Review,efficiency\n" + "0,2,8273019,,1,1,0,0.74" in (
+        captured.out
+    )
+
+
+@pytest.mark.usefixtures("get_closed_issues")
+@pytest.mark.usefixtures("get_closed_workflow_labels")
+def test_transitions_appends_closed_issues_to_archive(monkeypatch, tmp_path):
+    from gl_analytics.archive import EventArchive
+
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    m.main(["tr", "-m", "mb_v1.3", "-r", "csv", "--archive", str(tmp_path)])
+
+    archive = EventArchive(tmp_path)
+    assert [(p, month) for p, month, _ in archive.partitions()] == [(8273019, "2021-03")]
+    assert [i.issue_id for i in archive.table().to_issues()] == [2]
+
+
+@pytest.mark.usefixtures("get_closed_issues")
+@pytest.mark.usefixtures("get_closed_workflow_labels")
+def test_transitions_aggregates_table_parsed_in_processes(capsys, monkeypatch, tmp_path):
+    from gl_analytics.archive import EventArchive
+
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+    monkeypatch.setattr("gl_analytics.histories.HistoryTable.to_issues", None)
+
+    capsys.readouterr()
+    m.main(["tr", "-m", "mb_v1.3", "-r", "csv", "--processes", "2", "--archive", str(tmp_path)])
+    captured = capsys.readouterr()
+    assert "from,opened,In Progress,Code Review,closed\n" in captured.out
+    assert "opened,0,1,0,0\n" in captured.out
+    assert "In Progress,0,0,0,1\n" in captured.out
+    assert [(p, month) for p, month, _ in EventArchive(tmp_path).partitions()] == [(8273019, "2021-03")]
+
+
+@pytest.mark.usefixtures("get_closed_issues")
+@pytest.mark.usefixtures("get_closed_workflow_labels")
+def test_transitions_prints_csv(capsys, monkeypatch):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+
+    capsys.readouterr()
+    m.main(["tr", "-m", "mb_v1.3", "-r", "csv"])
+    captured = capsys.readouterr()
+    print("\noutput captured\n", captured.out)
+    assert "from,opened,In Progress,Code Review,closed\n" in captured.out
+    assert "opened,0,1,0,0\n" in captured.out
+    assert "In Progress,0,0,0,1\n" in captured.out
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_forecast_prints_csv(capsys, monkeypatch, patch_datetime_now):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+
+    capsys.readouterr()
+    m.main(["fc", "-m", "mb_v1.3", "-r", "csv", "-s", "100"])
+    captured = capsys.readouterr()
+    print("\noutput captured\n", captured.out)
+    assert "percentile,days,date\n" in captured.out
+    assert "50,," in captured.out
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_wipage_prints_csv(capsys, monkeypatch):
+    monkeypatch.setitem(m.config, "TOKEN", "x")
+
+    capsys.readouterr()
+    m.main(["wa", "-m", "mb_v1.3", "-r", "csv", "-d", "2021-03-01"])
+    captured = capsys.readouterr()
+    print("\noutput captured\n", captured.out)
+    assert "stage,count,p50,p85,max\n" in captured.out
+    assert "In Progress,1,14.0,14.0,14.0\n" in captured.out
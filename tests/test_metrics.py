@@ -1,5 +1,6 @@
 import pytest
 from datetime import datetime, timedelta, timezone
+from io import StringIO
 from types import SimpleNamespace
 
 import numpy as np
@@ -7,8 +8,21 @@ import pandas as pd
 
 from tests import records
 
+from gl_analytics.histories import HistoryTable
 from gl_analytics.issues import Issue
-from gl_analytics.metrics import CumulativeFlow, IssueStageTransitions, LeadCycleTimes, build_transitions
+from gl_analytics.metrics import (
+    CumulativeFlow,
+    CumulativeFlowIndex,
+    CycleTimeSketches,
+    IncrementalCumulativeFlow,
+    IssueStageTransitions,
+    LeadCycleTimes,
+    StageTransitionMatrix,
+    TimeInStage,
+    WipAge,
+    aggregate_in_processes,
+    build_transitions,
+)
 
 
 def test_build_transitions_from_issues():
@@ -702,6 +716,206 @@ def test_cumulative_flow_shows_hanging_open(stages):
     assert all([a == b for a, b in zip(df["opened"].array, [1, 1, 1])])
 
 
+def test_cumulative_flow_does_not_modify_transitions():
+    openedAt = datetime(2021, 3, 16, 8, tzinfo=timezone.utc)
+
+    test_data = [
+        {"datetime": openedAt, "opened": 1},
+        {"datetime": openedAt + timedelta(hours=2), "opened": 0, "inprogress": 1},
+        {"datetime": openedAt + timedelta(hours=3), "inprogress": 0, "review": 1},
+    ]
+
+    data = pd.DataFrame.from_records(test_data, index=["datetime"])
+    expected = data.index.copy()
+    tr = SimpleNamespace(data=data)
+
+    CumulativeFlow([tr], stages=["inprogress"], start_date=datetime(2021, 3, 15), end_date=datetime(2021, 3, 19))
+
+    assert expected.equals(tr.data.index)
+
+
+def get_transitions_over_weeks():
+    openedAt = datetime(2021, 3, 1, 8, tzinfo=timezone.utc)
+    issue1 = Issue(1, 2, openedAt, issue_type="Bug")
+    issue1.history.add_events(
+        [
+            ("todo", openedAt + timedelta(days=2), None),
+            ("inprogress", openedAt + timedelta(days=9, hours=3), None),
+            ("done", openedAt + timedelta(days=16, hours=12), None),
+            ("closed", openedAt + timedelta(days=16, hours=13), None),
+        ]
+    )
+    issue2 = Issue(2, 2, openedAt + timedelta(days=5), issue_type="Feature")
+    issue2.history.add_events(
+        [
+            ("inprogress", openedAt + timedelta(days=6), None),
+            ("review", openedAt + timedelta(days=8), None),
+            ("inprogress", openedAt + timedelta(days=10), None),
+        ]
+    )
+    return build_transitions([issue1, issue2])
+
+
+@pytest.mark.parametrize(
+    "window",
+    [
+        dict(start_date=datetime(2021, 3, 1), end_date=datetime(2021, 3, 31)),
+        dict(start_date=datetime(2021, 3, 8), days=7),
+        dict(end_date=datetime(2021, 4, 15), days=10),
+        dict(start_date=datetime(2021, 2, 20), days=5),
+    ],
+)
+def test_cumulative_flow_index_window_matches_cumulative_flow(stages, window):
+    transitions = get_transitions_over_weeks()
+    index = CumulativeFlowIndex(transitions, stages=stages, end_date=datetime(2021, 3, 31))
+
+    expected = CumulativeFlow(transitions, stages=stages, **window).get_data_frame()
+    actual = index.window(**window)
+    print(actual.to_csv())
+
+    assert list(expected.columns) == list(actual.columns)
+    assert expected.index.equals(actual.index)
+    assert np.array_equal(expected.values.astype(float), actual.values.astype(float))
+
+
+def test_cumulative_flow_index_covers_history(stages):
+    index = CumulativeFlowIndex(get_transitions_over_weeks(), stages=stages, end_date=datetime(2021, 3, 31))
+    assert index.included_dates[0] == datetime(2021, 3, 1, tzinfo=timezone.utc)
+    assert index.included_dates[-1] == datetime(2021, 3, 31, tzinfo=timezone.utc)
+    assert index.get_data_frame().sum(axis=1).iloc[-1] == 2
+
+
+def test_cumulative_flow_index_of_parsed_timestamps():
+    """GitLab timestamps parsed by dateutil, as the resolvers do, are tzlocal() rather than UTC."""
+    import dateutil.parser
+
+    issue = Issue(1, 2, dateutil.parser.parse("2021-03-01T10:00:00Z"))
+    issue.history.add_events([("closed", dateutil.parser.parse("2021-03-05T10:00:00Z"), None)])
+
+    index = CumulativeFlowIndex(build_transitions([issue]), stages=["opened", "closed"], end_date=datetime(2021, 3, 8))
+    df = index.get_data_frame()
+    assert str(df.index.tz) == "UTC"
+    assert df.index[0] == datetime(2021, 3, 1, tzinfo=timezone.utc)
+    assert list(df["closed"]) == [0, 0, 0, 0, 1, 1, 1, 1]
+
+
+def test_cumulative_flow_index_rolls_up_weeks(stages):
+    index = CumulativeFlowIndex(get_transitions_over_weeks(), stages=stages, end_date=datetime(2021, 3, 31))
+    df = index.rollup("W", start_date=datetime(2021, 3, 1), end_date=datetime(2021, 3, 21))
+    print(df.to_csv())
+    assert df.index.size == 3
+    assert all([a == b for a, b in zip(df["todo"].array, [1, 0, 0])])
+    assert all([a == b for a, b in zip(df["inprogress"].array, [1, 2, 1])])
+    assert all([a == b for a, b in zip(df["closed"].array, [0, 0, 1])])
+
+
+def test_cumulative_flow_index_persists(stages, filepath_csv):
+    index = CumulativeFlowIndex(get_transitions_over_weeks(), stages=stages, end_date=datetime(2021, 3, 31))
+    index.save(filepath_csv)
+
+    loaded = CumulativeFlowIndex.load(filepath_csv)
+    assert list(loaded.get_data_frame().columns) == stages
+    assert loaded.included_dates.equals(index.included_dates)
+    assert loaded.get_data_frame().equals(index.get_data_frame())
+    assert loaded.window(days=7, end_date=datetime(2021, 3, 20)).equals(
+        index.window(days=7, end_date=datetime(2021, 3, 20))
+    )
+
+
+@pytest.mark.parametrize("group_by", [["type"], ["project", "type"]])
+def test_cumulative_flow_groups_by_dimensions(stages, group_by):
+    untyped = Issue(3, 4, datetime(2021, 3, 3, 8, tzinfo=timezone.utc))
+    untyped.history.add_events([("todo", datetime(2021, 3, 4, 8, tzinfo=timezone.utc), None)])
+    transitions = get_transitions_over_weeks() + build_transitions([untyped])
+    window = dict(start_date=datetime(2021, 3, 1), end_date=datetime(2021, 3, 31))
+
+    cf = CumulativeFlow(transitions, stages=stages, group_by=group_by, **window)
+    df = cf.get_data_frame()
+    print(df.to_csv())
+
+    assert df.index.names == ["datetime"] + group_by
+    assert list(df.columns) == stages
+    assert len(df) == 3 * cf.included_dates.size
+
+    for i, issue_type in enumerate(["Bug", "Feature"]):
+        expected = CumulativeFlow([transitions[i]], stages=stages, **window).get_data_frame()
+        actual = df.xs(issue_type, level="type")
+        assert np.array_equal(expected.values.astype(float), actual.values.astype(float))
+
+    untyped_counts = df[df.index.get_level_values("type").isna()]
+    expected = CumulativeFlow(transitions[2:], stages=stages, **window).get_data_frame()
+    assert np.array_equal(expected.values.astype(float), untyped_counts.values.astype(float))
+
+    total = CumulativeFlow(transitions, stages=stages, **window).get_data_frame()
+    assert np.array_equal(total.values.astype(float), df.groupby(level="datetime").sum().values.astype(float))
+
+
+def test_cumulative_flow_groups_without_transitions(stages):
+    df = CumulativeFlow([], stages=stages, group_by=["type"], days=5).get_data_frame()
+    assert df.empty
+    assert df.index.names == ["datetime", "type"]
+
+
+def test_incremental_cumulative_flow_matches_cumulative_flow(stages):
+    openedAt = datetime(2021, 3, 15, 8, tzinfo=timezone.utc)
+    window = dict(start_date=datetime(2021, 3, 15), end_date=datetime(2021, 3, 19))
+
+    issue = Issue(1, 2, openedAt, issue_type="Bug")
+    issue.history.add_events(
+        [
+            ("todo", openedAt + timedelta(days=1), None),
+            ("inprogress", openedAt + timedelta(days=2), None),
+            ("closed", openedAt + timedelta(days=2, hours=4), None),
+        ]
+    )
+    expected = CumulativeFlow(build_transitions([issue]), stages=stages, **window).get_data_frame()
+
+    flow = IncrementalCumulativeFlow(stages=stages, **window)
+    flow.apply(2, 1, "open", openedAt, issue_type="Bug")
+    flow.apply(2, 1, "add", openedAt + timedelta(days=1), stage="todo")
+    flow.apply(2, 1, "add", openedAt + timedelta(days=2), stage="inprogress")
+    flow.apply(2, 1, "close", openedAt + timedelta(days=2, hours=4))
+
+    df = flow.get_data_frame()
+    print(df.to_csv())
+    assert expected.index.equals(df.index)
+    assert np.array_equal(expected.values.astype(float), df.values.astype(float))
+
+
+def test_incremental_cumulative_flow_updates_resolved_issue(stages):
+    openedAt = datetime(2021, 3, 15, 8, tzinfo=timezone.utc)
+    issue = Issue(1, 2, openedAt, issue_type="Bug")
+    issue.history.add_events([("inprogress", openedAt + timedelta(days=1), None)])
+
+    flow = IncrementalCumulativeFlow(stages=stages, start_date=datetime(2021, 3, 15), end_date=datetime(2021, 3, 19))
+    flow.add_issue(issue)
+    flow.add_issue(Issue(2, 2, openedAt, issue_type="Bug"))
+
+    df = flow.get_data_frame()
+    assert all([a == b for a, b in zip(df["opened"].array, [2, 1, 1, 1, 1])])
+    assert all([a == b for a, b in zip(df["inprogress"].array, [0, 1, 1, 1, 1])])
+
+    flow.apply(2, 1, "close", openedAt + timedelta(days=2))
+    flow.apply(2, 1, "reopen", openedAt + timedelta(days=3))
+    flow.apply(2, 2, "add", openedAt + timedelta(days=3), stage="todo")
+    flow.apply(2, 2, "remove", openedAt + timedelta(days=4), stage="todo")
+
+    df = flow.get_data_frame()
+    print(df.to_csv())
+    assert all([a == b for a, b in zip(df["opened"].array, [2, 1, 1, 0, 0])])
+    assert all([a == b for a, b in zip(df["todo"].array, [0, 0, 0, 1, 0])])
+    assert all([a == b for a, b in zip(df["inprogress"].array, [0, 1, 0, 0, 0])])
+    assert all([a == b for a, b in zip(df["closed"].array, [0, 0, 1, 0, 0])])
+
+
+def test_incremental_cumulative_flow_requires_opened_issue(stages):
+    flow = IncrementalCumulativeFlow(stages=stages)
+    with pytest.raises(ValueError):
+        flow.apply(2, 1, "add", datetime(2021, 3, 15, tzinfo=timezone.utc), stage="todo")
+    with pytest.raises(ValueError):
+        flow.apply(2, 1, "move", datetime(2021, 3, 15, tzinfo=timezone.utc))
+
+
 def test_leadcycletimes_should_be_additive(stages):
     """Lead and cycle times count days between opened, in progress, and closed."""
 
@@ -864,3 +1078,272 @@ def get_item_closed_without_close_state_event():
     ]
     issue.history.add_events(history)
     return issue
+
+
+def get_item_with_rework():
+    openedAt = datetime(2021, 3, 15, 6, tzinfo=timezone.utc)  # Monday
+    issue = Issue(1, 2, openedAt, issue_type="Bug")
+    history = [
+        ("todo", openedAt + timedelta(days=1), None),
+        ("inprogress", openedAt + timedelta(days=2), None),
+        ("review", openedAt + timedelta(days=3), None),
+        ("inprogress", openedAt + timedelta(days=3, hours=6), None),
+        ("review", openedAt + timedelta(days=7), None),
+        ("closed", openedAt + timedelta(days=8), None),
+    ]
+    issue.history.add_events(history)
+    return issue
+
+
+def get_item_in_progress():
+    openedAt = datetime(2021, 3, 15, 6, tzinfo=timezone.utc)
+    issue = Issue(2, 2, openedAt, issue_type="Feature")
+    issue.history.add_events([("inprogress", openedAt + timedelta(days=1), None)])
+    return issue
+
+
+def test_time_in_stage_sums_repeated_visits(stages):
+    obj = TimeInStage([get_item_with_rework()], stages=stages, wip="inprogress")
+    df = obj.get_data_frame()
+    print(df.to_csv())
+    assert list(df.columns) == ["issue", "project", "type"] + stages[:-1] + ["efficiency"]
+    assert all([a == b for a, b in zip(df.loc[0, stages[:-1]], [1, 1, 3, 1, 0])])
+
+    durations = obj.durations.set_index("stage")
+    assert durations.loc["inprogress", "visits"] == 2
+    assert durations.loc["inprogress", "hours"] == 24 + 90
+    assert durations.loc["review", "hours"] == 6 + 24
+
+
+def test_time_in_stage_measures_hours(stages):
+    obj = TimeInStage([get_item_with_rework()], stages=stages, wip="inprogress", unit="hours")
+    df = obj.get_data_frame()
+    assert all([a == b for a, b in zip(df.loc[0, stages[:-1]], [24, 24, 114, 30, 0])])
+    assert df.loc[0, "efficiency"] == pytest.approx((114 + 30) / 192)
+
+
+def test_time_in_stage_measures_open_stages_until_as_of(stages):
+    as_of = datetime(2021, 3, 19, 6, tzinfo=timezone.utc)
+    obj = TimeInStage([get_item_in_progress()], stages=stages, wip="inprogress", unit="hours", as_of=as_of)
+    df = obj.get_data_frame()
+    assert df.loc[0, "inprogress"] == 72
+
+
+def test_time_in_stage_requires_valid_unit(stages):
+    with pytest.raises(ValueError):
+        TimeInStage([], stages=stages, unit="weeks")
+
+
+def test_time_in_stage_percentiles_by_stage_and_type(stages):
+    as_of = datetime(2021, 3, 19, 6, tzinfo=timezone.utc)
+    obj = TimeInStage([get_item_with_rework(), get_item_in_progress()], stages=stages, wip="inprogress", as_of=as_of)
+    df = obj.percentiles(q=[0.5, 0.85])
+    print(df)
+    assert list(df.columns) == ["p50", "p85"]
+    assert df.loc[("inprogress", "Bug"), "p50"] == 3
+    assert df.loc[("inprogress", "Feature"), "p50"] == 3
+    assert ("todo", "Feature") not in df.index
+
+
+def test_transition_matrix_counts_moves(stages):
+    obj = StageTransitionMatrix([get_item_with_rework(), get_item_in_progress()], stages=stages)
+    df = obj.get_data_frame()
+    print(df)
+    assert list(df.index) == stages
+    assert list(df.columns) == stages
+    assert df.loc["opened", "todo"] == 1
+    assert df.loc["opened", "inprogress"] == 1
+    assert df.loc["inprogress", "review"] == 2
+    assert df.loc["review", "inprogress"] == 1
+    assert df.loc["review", "closed"] == 1
+    assert df.values.sum() == 7
+
+
+def test_transition_matrix_skips_excluded_stages(stages):
+    obj = StageTransitionMatrix([get_item_reopened_twice()], stages=stages)
+    df = obj.get_data_frame()
+    print(df)
+    assert df.loc["closed", "closed"] == 2
+    assert df.values.sum() == 6
+
+
+def test_transition_matrix_by_type(stages):
+    obj = StageTransitionMatrix([get_item_with_rework(), get_item_in_progress()], stages=stages, by_type=True)
+    df = obj.get_data_frame()
+    print(df)
+    assert df.index.names == ["type", "from"]
+    assert df.loc[("Bug", "review"), "inprogress"] == 1
+    assert df.loc[("Feature", "opened"), "inprogress"] == 1
+    assert df.loc["Feature"].values.sum() == 1
+
+
+def test_transition_matrix_finds_rework(stages):
+    obj = StageTransitionMatrix([get_item_with_rework(), get_item_over_weekend()], stages=stages)
+    df = obj.rework()
+    print(df)
+    assert list(df.columns) == ["type", "from", "to", "count"]
+    assert len(df) == 1
+    assert df.loc[0, "from"] == "review"
+    assert df.loc[0, "to"] == "inprogress"
+    assert df.loc[0, "count"] == 1
+
+
+def test_aggregations_take_a_history_table(stages):
+    issues = get_closed_items()
+    table = HistoryTable.from_issues(issues)
+    window = dict(start_date=datetime(2021, 3, 1), end_date=datetime(2021, 3, 31))
+
+    expected = CumulativeFlow(build_transitions(issues), stages=stages, **window).get_data_frame()
+    actual = CumulativeFlow(table, stages=stages, **window).get_data_frame()
+    # counted from the records the counts are floats, combined per issue they are objects
+    assert actual.index.equals(expected.index)
+    assert list(actual.columns) == list(expected.columns)
+    assert actual.equals(expected.astype(float))
+
+    expected = LeadCycleTimes(issues, wip="inprogress", stages=stages).get_data_frame()
+    actual = LeadCycleTimes(table, wip="inprogress", stages=stages).get_data_frame()
+    assert actual.drop(columns="project").equals(expected.drop(columns="project"))
+
+
+def test_aggregate_in_processes_matches_in_process(stages):
+    table = HistoryTable.from_issues(get_closed_items())
+    window = dict(start_date=datetime(2021, 3, 1), end_date=datetime(2021, 3, 31))
+    aggregations = [
+        (CumulativeFlow, dict(stages=stages, **window)),
+        (LeadCycleTimes, dict(wip="inprogress", stages=stages)),
+        (StageTransitionMatrix, dict(stages=stages)),
+    ]
+
+    flow, times, transitions = aggregate_in_processes(table, aggregations, workers=2)
+
+    assert flow.equals(CumulativeFlow(table, stages=stages, **window).get_data_frame())
+    assert times.equals(LeadCycleTimes(table, wip="inprogress", stages=stages).get_data_frame())
+    assert transitions.equals(StageTransitionMatrix(table, stages=stages).get_data_frame())
+
+
+def get_closed_items():
+    return [get_item_over_week(), get_item_over_weekend(), get_item_closed_without_wip()]
+
+
+def get_item_with_removed_label():
+    """The last label was removed and nothing followed, its event has an end."""
+    opened = datetime(2021, 3, 1, 8, tzinfo=timezone.utc)
+    issue = Issue(4, 3, opened)
+    issue.history.add_events(
+        [
+            ("inprogress", opened + timedelta(days=1), None),
+            ("done", opened + timedelta(days=2, hours=1), opened + timedelta(days=2, hours=1)),
+            ("todo", opened + timedelta(days=3), opened + timedelta(days=5)),
+        ]
+    )
+    return issue
+
+
+def test_lead_cycle_times_from_table_match_issues(stages):
+    issues = get_closed_items()
+    table = HistoryTable.from_issues(issues)
+
+    expected = LeadCycleTimes(table.to_issues(), wip="inprogress", stages=stages).get_data_frame()
+    actual = LeadCycleTimes(table, wip="inprogress", stages=stages).get_data_frame()
+    assert actual.equals(expected)
+    assert list(actual["wip_event"]) == list(expected["wip_event"])
+
+
+@pytest.mark.parametrize("group_by", [None, ["type"], ["project", "type"]])
+def test_cumulative_flow_from_table_matches_transitions(stages, group_by):
+    issues = get_closed_items() + [get_item_in_progress(), get_item_with_removed_label()]
+    table = HistoryTable.from_issues(issues)
+    window = dict(start_date=datetime(2021, 2, 25), end_date=datetime(2021, 4, 10))
+
+    expected = CumulativeFlow(build_transitions(table.to_issues()), stages=stages, group_by=group_by, **window)
+    actual = CumulativeFlow(table, stages=stages, group_by=group_by, **window)
+
+    expected, actual = expected.get_data_frame(), actual.get_data_frame()
+    assert expected.index.equals(actual.index)
+    assert list(expected.columns) == list(actual.columns)
+    assert np.array_equal(expected.values.astype(float), actual.values.astype(float))
+
+
+def test_cycle_time_sketches_match_lead_cycle_times(stages):
+    issues = get_closed_items()
+    expected = LeadCycleTimes(issues, wip="inprogress", stages=stages).get_data_frame()["cycle"]
+    obj = CycleTimeSketches(freq="W", wip="inprogress", stages=stages).update(issues + [get_item_in_progress()])
+    df = obj.quantiles(q=[0.25, 0.5, 0.95])
+    print(df)
+    assert list(df.index) == ["Bug"]
+    assert df.loc["Bug", "count"] == 3
+    assert list(df.loc["Bug", ["p25", "p50", "p95"]]) == list(expected.quantile([0.25, 0.5, 0.95]))
+
+
+def test_cycle_time_sketches_by_period(stages):
+    obj = CycleTimeSketches(freq="W", wip="inprogress", stages=stages).update(get_closed_items())
+    df = obj.get_data_frame()
+    print(df)
+    assert [str(p) for p, _ in df.index] == ["2021-03-15/2021-03-21", "2021-03-22/2021-03-28"]
+    assert list(df["count"]) == [2, 1]
+    assert list(df["p50"]) == [2.5, 2]
+    assert list(obj.rolling(periods=2)["count"]) == [2, 3]
+    assert obj.quantiles(start="2021-03-22").loc["Bug", "count"] == 1
+
+
+def test_cycle_time_sketches_merge_shards(stages):
+    issues = get_closed_items()
+    whole = CycleTimeSketches(freq="W", wip="inprogress", stages=stages).update(issues)
+    shards = [CycleTimeSketches(freq="W", wip="inprogress", stages=stages).update([x]) for x in issues]
+    merged = shards[0].merge(shards[1]).merge(shards[2])
+    assert merged.count() == 3
+    assert merged.get_data_frame().equals(whole.get_data_frame())
+
+
+def test_cycle_time_sketches_merge_requires_same_freq(stages):
+    with pytest.raises(ValueError):
+        CycleTimeSketches(freq="W").merge(CycleTimeSketches(freq="M"))
+
+
+def test_cycle_time_sketches_save_and_load(stages):
+    obj = CycleTimeSketches(freq="W", wip="inprogress", stages=stages).update(get_closed_items())
+    buffer = StringIO()
+    obj.save(buffer)
+    buffer.seek(0)
+    print(buffer.getvalue())
+    loaded = CycleTimeSketches.load(buffer, freq="W")
+    assert loaded.periods == obj.periods
+    assert loaded.get_data_frame().equals(obj.get_data_frame())
+
+
+def test_wip_age_snapshots_open_issues(stages):
+    issues = [get_item_with_rework(), get_item_in_progress(), get_item_over_week()]
+    obj = WipAge(issues, stages=stages, as_of=datetime(2021, 3, 18, 9, tzinfo=timezone.utc))
+    items = obj.items
+    print(items)
+    assert list(zip(items["issue"], items["stage"])) == [(2, "inprogress"), (1, "review"), (1, "review")]
+    assert list(items["age"]) == [2, 0, 0]
+    df = obj.get_data_frame()
+    print(df)
+    assert list(df.index) == stages[:-1]
+    assert list(df["count"]) == [0, 0, 1, 2, 0]
+
+
+def test_wip_age_takes_a_date_at_the_end_of_the_day(stages):
+    obj = WipAge([get_item_over_week()], stages=stages, as_of=datetime(2021, 3, 18).date())
+    assert obj.as_of == pd.Timestamp("2021-03-18 23:59:59.999999999", tz="UTC")
+    assert list(obj.items["stage"]) == ["review"]
+    assert list(obj.items["age"]) == [0]
+
+
+def test_wip_age_in_hours(stages):
+    obj = WipAge(
+        [get_item_over_week()], stages=stages, unit="hours", as_of=datetime(2021, 3, 18, 12, tzinfo=timezone.utc)
+    )
+    assert list(obj.items["age"]) == [6]
+
+
+def test_wip_age_skips_closed_issues(stages):
+    obj = WipAge([get_item_over_week()], stages=stages, as_of=datetime(2021, 4, 1, tzinfo=timezone.utc))
+    assert obj.items.empty
+    assert obj.get_data_frame()["count"].sum() == 0
+
+
+def test_wip_age_requires_valid_unit(stages):
+    with pytest.raises(ValueError):
+        WipAge([], stages=stages, unit="weeks")
@@ -1,6 +1,19 @@
 import sys
 
-from gl_analytics.report import CsvReport, PlotReport
+import numpy as np
+import pandas as pd
+import pytest
+
+from gl_analytics.report import (
+    CsvReport,
+    FeatherReport,
+    ParquetReport,
+    PlotReport,
+    SvgReport,
+    columnar_frame,
+    lttb_indices,
+    render_plots,
+)
 from tests import read_filepath
 
 
@@ -50,3 +63,102 @@ def test_plot_should_save_png_image(filepath_png, df):
     report = PlotReport(df, file=filepath_png.resolve())
     report.export()
     assert filepath_png.exists()
+
+
+def test_plot_returns_png_bytes(df):
+    content = PlotReport(df).export()
+    assert content.startswith(b"\x89PNG")
+
+
+def test_plot_payload_is_compact(df):
+    payload = PlotReport(df, title="m1").payload()
+    assert payload["labels"] == ["done", "inprogress", "todo"]
+    assert payload["values"].shape == (3, 5)
+    assert str(payload["dates"][0]) == "2021-03-15"
+    assert payload["ylim"] == (0, 10)
+
+
+def test_render_plots_in_process_pool(tmp_path, df):
+    files = [tmp_path.joinpath(f"t{i}.png") for i in range(3)]
+    with tmp_path.joinpath("buf.png").open("wb") as fbuf:
+        reports = [PlotReport(df, file=f) for f in files] + [PlotReport(df, file=fbuf)]
+        render_plots(reports, workers=2)
+
+    assert all(f.exists() for f in files)
+    assert tmp_path.joinpath("buf.png").read_bytes() == files[0].read_bytes()
+
+
+@pytest.fixture
+def long_df():
+    index = pd.date_range(start="2018-01-01", periods=1500, freq="D", name="datetime", tz="UTC")
+    days = np.arange(1500)
+    return pd.DataFrame({"todo": days % 7, "inprogress": (days // 100) % 5, "done": days // 10}, index=index)
+
+
+def test_lttb_keeps_first_last_and_peaks():
+    y = np.zeros(100)
+    y[37] = 10
+    selected = lttb_indices(np.arange(100), y, 10)
+    assert len(selected) == 10
+    assert selected[0] == 0 and selected[-1] == 99
+    assert 37 in selected
+    assert list(lttb_indices(np.arange(5), np.arange(5), 10)) == [0, 1, 2, 3, 4]
+
+
+def test_plot_reduces_long_ranges(long_df):
+    payload = PlotReport(long_df, max_points=90).payload()
+    assert 3 < len(payload["dates"]) <= 90
+    assert str(payload["dates"][0]) == "2018-01-01"
+    assert str(payload["dates"][-1]) == "2022-02-08"
+    assert len(PlotReport(long_df, max_points=None).payload()["dates"]) == 1500
+
+
+def test_plot_resamples_by_period(long_df):
+    payload = PlotReport(long_df, freq="M", max_points=None).payload()
+    assert len(payload["dates"]) == 50
+    assert list(payload["values"][0][:2]) == [3, 5]
+
+
+def test_svg_size_is_bounded(long_df):
+    content = SvgReport(long_df).export()
+    assert content.lstrip().startswith(b"<?xml")
+    assert len(SvgReport(long_df, max_points=None).export()) > 2 * len(content)
+
+
+def test_columnar_frame_keeps_index_and_dtypes(df):
+    df = df.assign(type=["Bug", None, "Feature", "Bug", "Bug"])
+    df.columns = pd.CategoricalIndex(df.columns)
+    frame = columnar_frame(df)
+    assert list(frame.columns) == ["datetime", "todo", "inprogress", "done", "type"]
+    assert str(frame["datetime"].dtype) == "datetime64[ns, UTC]"
+    assert frame["type"].dtype == "category"
+    assert list(frame["type"].cat.categories) == ["Bug", "Feature"]
+
+
+def test_columnar_frame_drops_row_numbers():
+    frame = columnar_frame(pd.DataFrame({"issue": [1, 2]}))
+    assert list(frame.columns) == ["issue"]
+
+
+def test_parquet_to_filepath(filepath_parquet, df):
+    pq = pytest.importorskip("pyarrow.parquet")
+    ParquetReport(df, file=filepath_parquet).export()
+    result = pq.read_table(filepath_parquet).to_pandas()
+    assert str(result["datetime"].dtype) == "datetime64[ns, UTC]"
+    assert list(result["done"]) == [0, 0, 0, 1, 2]
+
+
+def test_feather_to_filepath(filepath_feather, df):
+    feather = pytest.importorskip("pyarrow.feather")
+    FeatherReport(df, file=filepath_feather).export()
+    table = feather.read_table(filepath_feather, memory_map=True)
+    assert table.column_names == ["datetime", "todo", "inprogress", "done"]
+    assert str(table.schema.field("datetime").type) == "timestamp[ns, tz=UTC]"
+
+
+def test_feather_returns_bytes(df):
+    pa = pytest.importorskip("pyarrow")
+    content = FeatherReport(df.assign(type="Bug")).export()
+    table = pa.ipc.open_file(content).read_all()
+    assert pa.types.is_dictionary(table.schema.field("type").type)
+    assert table.num_rows == 5
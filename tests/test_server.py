@@ -0,0 +1,159 @@
+import json
+import sqlite3
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from gl_analytics.server import AnalyticsService, make_server
+
+STAGES = ["opened", "In Progress", "Code Review", "closed"]
+
+
+@pytest.fixture
+def service(session):
+    config = {"GITLAB_BASE_URL": "https://gitlab.com/api/v4", "TOKEN": "x"}
+    return AnalyticsService(config, group="gozynta", refresh=0, session=session, stages=STAGES, wip="In Progress")
+
+
+@pytest.fixture
+def base_url(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    """Returns status, content type and body, using urllib so requests_mock does not intercept it."""
+    try:
+        with urllib.request.urlopen(url) as res:
+            return res.status, res.headers["Content-Type"], res.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers["Content-Type"], e.read()
+
+
+def test_server_health(base_url):
+    status, _, body = get(f"{base_url}/health")
+    assert status == 200
+    assert json.loads(body) == {"status": "ok"}
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_server_cumulative_flow_json(base_url):
+    status, content_type, body = get(f"{base_url}/cumulativeflow?milestone=mb_v1.3&days=10")
+    assert status == 200
+    assert content_type == "application/json"
+    records = json.loads(body)
+    assert len(records) == 10
+    assert list(records[0]) == ["datetime"] + STAGES
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_server_answers_from_memory(base_url, requests_mock):
+    get(f"{base_url}/cumulativeflow?milestone=mb_v1.3&format=csv")
+    calls = requests_mock.call_count
+
+    status, content_type, body = get(f"{base_url}/cumulativeflow?milestone=mb_v1.3&format=csv")
+    assert status == 200
+    assert content_type.startswith("text/csv")
+    assert body.decode().startswith("datetime,opened,In Progress,Code Review,closed")
+    assert requests_mock.call_count == calls
+
+    status, content_type, body = get(f"{base_url}/cumulativeflow?milestone=mb_v1.3&format=png")
+    assert status == 200
+    assert body.startswith(b"\x89PNG")
+    assert requests_mock.call_count == calls
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_server_refresh_fetches_issues_again(service, requests_mock):
+    df = service.data_frame("timeinstage", milestone="mb_v1.3")
+    calls = requests_mock.call_count
+
+    service.refresh()
+    assert requests_mock.call_count > calls
+    assert service.data_frame("timeinstage", milestone="mb_v1.3").equals(df)
+
+
+@pytest.mark.parametrize(
+    "path,status",
+    [
+        ("/unknown", 404),
+        ("/cumulativeflow?format=xml", 400),
+        ("/cumulativeflow?days=many", 400),
+        ("/cumulativeflow?color=red", 400),
+    ],
+)
+def test_server_rejects_bad_requests(base_url, path, status):
+    code, content_type, body = get(f"{base_url}{path}")
+    assert code == status
+    assert "error" in json.loads(body)
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_server_plots_only_daily_counts(base_url):
+    code, _, body = get(f"{base_url}/timeinstage?milestone=mb_v1.3&format=png")
+    assert code == 400
+
+
+@pytest.mark.usefixtures("get_issues")
+@pytest.mark.usefixtures("get_workflow_labels")
+def test_server_exposes_request_metrics():
+    from gl_analytics.instrumentation import RequestMetrics
+    from gl_analytics.issues import GitlabSession
+
+    session = GitlabSession("https://gitlab.com/api/v4", access_token="x", metrics=RequestMetrics())
+    service = AnalyticsService({}, group="gozynta", refresh=0, session=session, stages=STAGES, wip="In Progress")
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        assert get(f"{base_url}/timeinstage")[0] == 200
+        status, content_type, body = get(f"{base_url}/metrics")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert status == 200
+    assert content_type.startswith("text/plain")
+    assert 'gitlab_requests_total{endpoint="resource_label_events",code="200"} 1' in body.decode()
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_server_reads_event_store_through_one_connection(tmp_path, monkeypatch):
+    import gl_analytics.events as events
+    from tests.data import TestData
+
+    path = str(tmp_path.joinpath("events.sqlite3"))
+    store = events.EventStore(path)
+    for name in ["open", "in_progress", "code_review", "close"]:
+        store.ingest(json.loads(getattr(TestData.issue_hooks, name)))
+    store.close()
+
+    opened = []
+
+    class CountingEventStore(events.EventStore):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    monkeypatch.setattr(events, "EventStore", CountingEventStore)
+    service = AnalyticsService({}, refresh=0, store=path, stages=STAGES, wip="In Progress")
+    assert not service.data_frame("timeinstage", milestone="1741").empty
+    for _ in range(3):
+        service.refresh()
+    service.stop()
+
+    assert len(opened) == 1
+    # closed by stop
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].issue_rows()
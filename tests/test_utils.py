@@ -0,0 +1,87 @@
+import io
+import pstats
+import json
+import threading
+
+import gl_analytics.utils as utils
+from gl_analytics.utils import Tracer, span, timer, tracing
+
+
+def test_span_is_a_noop_without_tracing():
+    assert utils._tracer is None
+    with span("nothing", x=1):
+        pass
+    assert utils._tracer is None
+
+
+def test_tracing_records_nested_spans(tmp_path):
+    filepath = tmp_path.joinpath("trace.json")
+    with tracing(str(filepath)) as tracer:
+        with timer("outer"):
+            with span("inner", page=2, url="groups/1/issues"):
+                pass
+    assert utils._tracer is None
+
+    trace = json.loads(filepath.read_text())
+    spans = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+    outer, inner = spans["outer"], spans["inner"]
+    assert inner["args"] == {"page": 2, "url": "groups/1/issues"}
+    assert outer["tid"] == inner["tid"] == threading.get_ident()
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert len(tracer.events) == 3
+
+
+def test_tracer_names_every_thread():
+    tracer = Tracer()
+
+    def work():
+        tracer.add("work", 0, 2000)
+
+    thread = threading.Thread(target=work, name="worker-1")
+    thread.start()
+    thread.join()
+    tracer.add("main", 1000, 5000)
+
+    buffer = io.StringIO()
+    tracer.save(buffer)
+    events = json.loads(buffer.getvalue())["traceEvents"]
+    names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    assert names[thread.ident] == "worker-1"
+    assert [(e["name"], e["ts"], e["dur"]) for e in events if e["ph"] == "X"] == [
+        ("work", 0, 2),
+        ("main", 1, 4),
+    ]
+
+
+def test_profiling_writes_every_phase(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def build(n):
+        return [str(x) * 10 for x in range(n)]
+
+    with utils.profiling(tmp_path.joinpath("profiles"), top=5):
+        with utils.profile("listing"), ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(build, [1000, 2000]))
+        with utils.profile("aggregation"):
+            build(100)
+    assert utils._profiler is None
+
+    directory = tmp_path.joinpath("profiles")
+    assert sorted(p.name for p in directory.iterdir()) == [
+        "aggregation.pstats",
+        "aggregation.txt",
+        "listing.pstats",
+        "listing.txt",
+    ]
+    # the calls of the worker threads are part of the phase
+    stats = pstats.Stats(str(directory.joinpath("listing.pstats")))
+    assert sum(n for (_, _, name), (n, *_) in stats.stats.items() if name == "build") == 2
+    report = directory.joinpath("listing.txt").read_text()
+    assert "peak" in report
+    assert "functions by cumulative time" in report
+
+
+def test_profile_is_a_noop_without_profiling(tmp_path):
+    with utils.profile("listing"):
+        pass
+    assert utils._profiler is None